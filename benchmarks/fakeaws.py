@@ -0,0 +1,275 @@
+# benchmarks/fakeaws.py
+# Local AWS stand-in for the benchmarks. Responses are produced by botocore
+# `before-call` hooks, so the services run their real boto3 code (parameter
+# validation, paginators, error handling) without any network traffic.
+# Resources are generated from their index on demand; nothing account-sized is
+# held in memory by the stand-in itself.
+import datetime
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from botocore.awsrequest import AWSResponse
+
+CREATED = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@dataclass
+class SyntheticAccount:
+    instances: int = 0
+    volumes_per_instance: int = 2
+    buckets: int = 0
+    security_groups: int = 0
+    rules_per_group: int = 10
+    vpcs: int = 0
+    subnets_per_vpc: int = 8
+    nat_gateways_per_vpc: int = 1
+    regions: tuple = ("ap-northeast-2",)
+
+
+class FakeAWS:
+    """Answers EC2 / S3 calls for one SyntheticAccount.
+
+    Every call is counted per operation and delayed by ``latency_ms`` (plus up
+    to ``jitter_ms``) to model the round trip to AWS.
+    """
+
+    def __init__(self, account, latency_ms=0.0, jitter_ms=0.0, page_size=1000):
+        self.account = account
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.page_size = page_size
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def install(self, session):
+        """Register the hooks on a boto3 Session; affects clients created afterwards."""
+        session.events.register("before-parameter-build", self._capture_params)
+        session.events.register("before-call", self._respond)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    # ---------- botocore hooks ----------
+    def _capture_params(self, params, context, **kwargs):
+        # before-call only sees the serialized request; keep the API parameters
+        context["benchmark_params"] = dict(params)
+
+    def _respond(self, model, context, **kwargs):
+        with self._lock:
+            self.calls[model.name] += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.random() * self.jitter)
+
+        handler = getattr(self, model.name, None)
+        if handler is None:
+            return self._error(400, "UnsupportedOperation")
+        result = handler(context.get("benchmark_params", {}))
+        if isinstance(result, AWSResponseError):
+            return self._error(result.status, result.code)
+        return AWSResponse("https://fakeaws.local/", 200, {}, None), result
+
+    def _error(self, status, code):
+        body = {"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": status}}
+        return AWSResponse("https://fakeaws.local/", status, {}, None), body
+
+    def _page(self, params, total, make, result_key):
+        start = int(params.get("NextToken") or 0)
+        size = min(params.get("MaxResults") or self.page_size, self.page_size)
+        end = min(start + size, total)
+        page = {result_key: [make(i) for i in range(start, end)]}
+        if end < total:
+            page["NextToken"] = str(end)
+        return page
+
+    # ---------- EC2: regions / instances / volumes ----------
+    def DescribeRegions(self, params):
+        return {"Regions": [{"RegionName": name} for name in self.account.regions]}
+
+    def instance(self, i):
+        account = self.account
+        subnet = i % max(account.vpcs * account.subnets_per_vpc, 1)
+        devices = [
+            {"DeviceName": "/dev/xvda" if v == 0 else f"/dev/xvd{chr(98 + v)}",
+             "Ebs": {"VolumeId": f"vol-{i:08x}{v:02x}"}}
+            for v in range(account.volumes_per_instance)
+        ]
+        return {
+            "InstanceId": f"i-{i:017x}",
+            "InstanceType": ("t3.micro", "m5.large", "c6g.xlarge", "r6i.2xlarge")[i % 4],
+            "State": {"Name": "running" if i % 10 else "stopped"},
+            "Placement": {"AvailabilityZone": f"ap-northeast-2{'abcd'[i % 4]}"},
+            "VpcId": f"vpc-{subnet // account.subnets_per_vpc:08x}",
+            "SubnetId": f"subnet-{subnet:08x}",
+            "PrivateIpAddress": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            "PublicIpAddress": f"3.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" if i % 3 == 0 else None,
+            "SecurityGroups": [
+                {"GroupId": f"sg-{(i + k) % max(account.security_groups, 1):08x}", "GroupName": f"group-{k}"}
+                for k in range(2)
+            ],
+            "KeyName": "benchmark",
+            "ImageId": "ami-0123456789abcdef0",
+            "PlatformDetails": "Linux/UNIX",
+            "RootDeviceName": "/dev/xvda",
+            "BlockDeviceMappings": devices,
+            "Tags": [{"Key": "Name", "Value": f"instance-{i}"}, {"Key": "team", "Value": f"team-{i % 7}"}],
+        }
+
+    def DescribeInstances(self, params):
+        page = self._page(params, self.account.instances, self.instance, "Instances")
+        page["Reservations"] = [{"Instances": page.pop("Instances")}]
+        return page
+
+    @staticmethod
+    def volume(vol_id):
+        return {"VolumeId": vol_id, "Size": 8 + int(vol_id[-2:], 16) * 92, "VolumeType": "gp3", "KmsKeyId": None}
+
+    def DescribeVolumes(self, params):
+        ids = next((f["Values"] for f in params.get("Filters", []) if f["Name"] == "volume-id"), None)
+        if ids is not None:
+            return {"Volumes": [self.volume(vol_id) for vol_id in ids]}
+        # Unfiltered: page through every attached volume, like a region-wide sweep
+        per_instance = self.account.volumes_per_instance
+        return self._page(
+            params, self.account.instances * per_instance,
+            lambda n: self.volume(f"vol-{n // per_instance:08x}{n % per_instance:02x}"), "Volumes",
+        )
+
+    # ---------- EC2: security groups ----------
+    def security_group(self, g):
+        rules = []
+        for r in range(self.account.rules_per_group):
+            port = (22, 80, 443, 3306, 5432, 6379)[r % 6]
+            rule = {"IpProtocol": "tcp", "FromPort": port, "ToPort": port if r % 4 else port + 100}
+            if r % 5 == 0:
+                rule["UserIdGroupPairs"] = [{"GroupId": f"sg-{(g + 1) % self.account.security_groups:08x}"}]
+            else:
+                rule["IpRanges"] = [{"CidrIp": "0.0.0.0/0" if r % 7 == 0 else f"10.{g & 255}.{r & 255}.0/24"}]
+                if r % 3 == 0:
+                    rule["Ipv6Ranges"] = [{"CidrIpv6": f"2001:db8:{g & 0xffff:x}::/48"}]
+            rules.append(rule)
+        return {
+            "GroupId": f"sg-{g:08x}",
+            "GroupName": f"group-{g}",
+            "VpcId": f"vpc-{g % max(self.account.vpcs, 1):08x}",
+            "IpPermissions": rules,
+            "IpPermissionsEgress": [{"IpProtocol": "-1", "IpRanges": [{"CidrIp": "0.0.0.0/0"}]}],
+            "Tags": [{"Key": "Name", "Value": f"group-{g}"}],
+        }
+
+    def DescribeSecurityGroups(self, params):
+        return self._page(params, self.account.security_groups, self.security_group, "SecurityGroups")
+
+    # ---------- EC2: network ----------
+    def vpc(self, v):
+        return {"VpcId": f"vpc-{v:08x}", "CidrBlock": f"10.{v & 255}.0.0/16",
+                "Tags": [{"Key": "Name", "Value": f"vpc-{v}"}]}
+
+    def subnet(self, s):
+        v = s // self.account.subnets_per_vpc
+        return {
+            "SubnetId": f"subnet-{s:08x}",
+            "VpcId": f"vpc-{v:08x}",
+            "CidrBlock": f"10.{v & 255}.{s % self.account.subnets_per_vpc}.0/24",
+            "AvailabilityZone": f"ap-northeast-2{'abcd'[s % 4]}",
+            "AvailableIpAddressCount": 251 - s % 50,
+            "Tags": [{"Key": "Name", "Value": f"subnet-{s}"}],
+        }
+
+    def nat_gateway(self, n):
+        v = n // self.account.nat_gateways_per_vpc
+        return {
+            "NatGatewayId": f"nat-{n:017x}",
+            "VpcId": f"vpc-{v:08x}",
+            "SubnetId": f"subnet-{v * self.account.subnets_per_vpc:08x}",
+            "ConnectivityType": "public",
+            "NatGatewayAddresses": [{"PublicIp": f"52.0.{v & 255}.{n & 255}", "PrivateIp": f"10.{v & 255}.0.5",
+                                     "NetworkInterfaceId": f"eni-{n:017x}", "IsPrimary": True}],
+            "Tags": [{"Key": "Name", "Value": f"nat-{n}"}],
+        }
+
+    def route_table(self, t):
+        # One main table per VPC plus one table per private subnet
+        per_vpc = self.account.subnets_per_vpc + 1
+        v, k = divmod(t, per_vpc)
+        associations = (
+            [{"Main": True}] if k == 0
+            else [{"Main": False, "SubnetId": f"subnet-{v * self.account.subnets_per_vpc + k - 1:08x}"}]
+        )
+        return {
+            "RouteTableId": f"rtb-{t:017x}",
+            "VpcId": f"vpc-{v:08x}",
+            "Associations": associations,
+            "Routes": [
+                {"DestinationCidrBlock": f"10.{v & 255}.0.0/16", "GatewayId": "local", "State": "active"},
+                {"DestinationCidrBlock": "0.0.0.0/0", "NatGatewayId": f"nat-{v:017x}", "State": "active"},
+            ],
+        }
+
+    def DescribeVpcs(self, params):
+        return self._page(params, self.account.vpcs, self.vpc, "Vpcs")
+
+    def DescribeSubnets(self, params):
+        return self._page(params, self.account.vpcs * self.account.subnets_per_vpc, self.subnet, "Subnets")
+
+    def DescribeNatGateways(self, params):
+        total = self.account.vpcs * self.account.nat_gateways_per_vpc
+        return self._page(params, total, self.nat_gateway, "NatGateways")
+
+    def DescribeRouteTables(self, params):
+        total = self.account.vpcs * (self.account.subnets_per_vpc + 1)
+        return self._page(params, total, self.route_table, "RouteTables")
+
+    # ---------- S3 ----------
+    def ListBuckets(self, params):
+        return {"Buckets": [{"Name": f"bucket-{b:06d}", "CreationDate": CREATED} for b in range(self.account.buckets)]}
+
+    @staticmethod
+    def bucket_number(params):
+        return int(params["Bucket"].rsplit("-", 1)[1])
+
+    def GetBucketLocation(self, params):
+        b = self.bucket_number(params)
+        return {"LocationConstraint": self.account.regions[b % len(self.account.regions)]}
+
+    def GetBucketWebsite(self, params):
+        if self.bucket_number(params) % 20:
+            return AWSResponseError(404, "NoSuchWebsiteConfiguration")
+        return {"IndexDocument": {"Suffix": "index.html"}}
+
+    def GetBucketVersioning(self, params):
+        return {"Status": "Enabled"} if self.bucket_number(params) % 2 else {}
+
+    def GetBucketLifecycleConfiguration(self, params):
+        if self.bucket_number(params) % 3:
+            return AWSResponseError(404, "NoSuchLifecycleConfiguration")
+        return {"Rules": [{"ID": "expire", "Status": "Enabled", "Filter": {"Prefix": ""}}]}
+
+    def GetBucketReplication(self, params):
+        return AWSResponseError(404, "ReplicationConfigurationNotFoundError")
+
+    def GetBucketEncryption(self, params):
+        return {"ServerSideEncryptionConfiguration": {"Rules": [
+            {"ApplyServerSideEncryptionByDefault": {"SSEAlgorithm": "AES256"}}
+        ]}}
+
+    def GetPublicAccessBlock(self, params):
+        flag = bool(self.bucket_number(params) % 4)
+        return {"PublicAccessBlockConfiguration": {
+            "BlockPublicAcls": flag, "IgnorePublicAcls": flag,
+            "BlockPublicPolicy": flag, "RestrictPublicBuckets": flag,
+        }}
+
+    def GetBucketTagging(self, params):
+        if self.bucket_number(params) % 2:
+            return AWSResponseError(404, "NoSuchTagSet")
+        return {"TagSet": [{"Key": "owner", "Value": "benchmark"}]}
+
+
+@dataclass
+class AWSResponseError:
+    status: int
+    code: str
@@ -0,0 +1,175 @@
+# benchmarks/run.py
+# Runs the benchmark matrix, stores the results and compares them with a
+# previous run.
+#
+#   python -m benchmarks.run                          # every service, every scenario
+#   python -m benchmarks.run --services ec2s,s3 --scenarios small --latency-ms 20
+#   python -m benchmarks.run --baseline benchmarks/results/20260101T000000Z.json --fail-above 20
+#   python -m benchmarks.run --serialization --scenarios medium,large   # default vs FAST_JSON responses
+import argparse
+import datetime
+import glob
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.scenarios import SCENARIOS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Metrics compared between runs; all of them are "lower is better"
+METRICS = [
+    ("cold", "wall_ms"),
+    ("cold", "aws_calls"),
+    ("cold", "payload_bytes"),
+    ("warm", "wall_ms"),
+    ("warm", "cpu_ms"),
+    (None, "peak_rss_mb"),
+]
+
+# Serialization comparisons are reported per this many records
+RECORDS_UNIT = 10_000
+
+
+def run_worker(service, scenario, latency_ms, jitter_ms, fast_json=False):
+    command = [
+        sys.executable, "-m", "benchmarks.worker", service, scenario,
+        "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms),
+    ]
+    if fast_json:
+        command.append("--fast-json")
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"service": service, "scenario": scenario, "error": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def metric(result, section, name):
+    source = result.get(section, {}) if section else result
+    return source.get(name)
+
+
+def result_key(result):
+    return result["service"], result["scenario"], result.get("latency_ms"), result.get("fast_json", False)
+
+
+def latest_results():
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    return paths[-1] if paths else None
+
+
+def compare(results, baseline_path, fail_above):
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"] if "error" not in r}
+
+    regressions = []
+    print(f"\nCompared with {os.path.relpath(baseline_path, ROOT)}")
+    for result in results:
+        before = baseline.get(result_key(result))
+        if before is None or "error" in result:
+            continue
+        for section, name in METRICS:
+            old, new = metric(before, section, name), metric(result, section, name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            label = f"{section}.{name}" if section else name
+            flag = ""
+            if fail_above is not None and change > fail_above:
+                flag = "  REGRESSION"
+                regressions.append((result_key(result), label, change))
+            print(f"  {result['service']:16} {result['scenario']:7} {label:20} {old:>12} -> {new:>12} ({change:+.1f}%){flag}")
+    return regressions
+
+
+def print_table(results):
+    print(
+        f"{'service':16} {'scenario':8} {'json':5} {'cold ms':>10} {'calls':>8} {'payload':>12} "
+        f"{'warm ms':>9} {'warm cpu':>9} {'peak MB':>8}"
+    )
+    for r in results:
+        mode = "fast" if r.get("fast_json") else ""
+        if "error" in r:
+            print(f"{r['service']:16} {r['scenario']:8} {mode:5} ERROR {r['error']}")
+            continue
+        print(
+            f"{r['service']:16} {r['scenario']:8} {mode:5} {r['cold']['wall_ms']:>10} {r['cold']['aws_calls']:>8} "
+            f"{r['cold']['payload_bytes']:>12} {r['warm']['wall_ms']:>9} {r['warm']['cpu_ms']:>9} {r['peak_rss_mb']:>8}"
+        )
+
+
+def per_unit(ms, records):
+    return ms * RECORDS_UNIT / records if records else None
+
+
+def print_serialization(results):
+    """Warm-response CPU per 10k records, default path vs FAST_JSON."""
+    pairs = {}
+    for r in results:
+        if "error" not in r:
+            pairs.setdefault((r["service"], r["scenario"]), {})[r.get("fast_json", False)] = r["warm"]
+    print(f"\nWarm response CPU ms per {RECORDS_UNIT:,} records")
+    print(f"{'service':16} {'scenario':8} {'records':>9} {'default':>9} {'fast':>9} {'saved':>9} {'change':>8}")
+    for (service, scenario), runs in pairs.items():
+        if len(runs) < 2:
+            continue
+        default, fast = runs[False], runs[True]
+        before = per_unit(default["cpu_ms"], default["records"])
+        after = per_unit(fast["cpu_ms"], fast["records"])
+        if before is None or after is None:
+            continue
+        print(
+            f"{service:16} {scenario:8} {default['records']:>9} {before:>9.1f} {after:>9.1f} "
+            f"{before - after:>9.1f} {(after - before) / before * 100:>+7.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the inventory endpoints against a local AWS stand-in")
+    parser.add_argument("--services", default=",".join(SCENARIOS), help="Comma-separated services")
+    parser.add_argument("--scenarios", default=None, help="Comma-separated scenario names (default: all)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Injected latency per AWS call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random latency per AWS call")
+    parser.add_argument("--baseline", default=None, help="Results file to compare with (default: latest stored run)")
+    parser.add_argument("--fail-above", type=float, default=None,
+                        help="Exit 1 if any metric regressed by more than this many percent")
+    parser.add_argument("--fast-json", action="store_true", help="Run the services with FAST_JSON=true")
+    parser.add_argument("--serialization", action="store_true",
+                        help="Run every scenario with and without FAST_JSON and compare warm CPU per record")
+    parser.add_argument("--no-save", action="store_true", help="Do not store this run's results")
+    args = parser.parse_args()
+
+    wanted = args.scenarios.split(",") if args.scenarios else None
+    baseline = args.baseline or latest_results()
+
+    modes = [False, True] if args.serialization else [args.fast_json]
+    results = []
+    for service in args.services.split(","):
+        for scenario in SCENARIOS[service]:
+            if wanted and scenario not in wanted:
+                continue
+            for fast_json in modes:
+                print(f"running {service}/{scenario}{' (fast json)' if fast_json else ''} ...", file=sys.stderr)
+                results.append(run_worker(service, scenario, args.latency_ms, args.jitter_ms, fast_json))
+
+    print_table(results)
+    if args.serialization:
+        print_serialization(results)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(RESULTS_DIR, f"{stamp}.json")
+        with open(path, "w") as f:
+            json.dump({"created_at": stamp, "argv": sys.argv[1:], "results": results}, f, indent=2)
+        print(f"\nSaved {os.path.relpath(path, ROOT)}")
+
+    regressions = compare(results, baseline, args.fail_above) if baseline else []
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
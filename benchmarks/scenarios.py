@@ -0,0 +1,30 @@
+# benchmarks/scenarios.py
+# Synthetic account sizes per service.
+from benchmarks.fakeaws import SyntheticAccount
+
+SCENARIOS = {
+    "ec2s": {
+        "small": SyntheticAccount(instances=100, vpcs=2),
+        "medium": SyntheticAccount(instances=10_000, vpcs=20),
+        "large": SyntheticAccount(instances=100_000, vpcs=50),
+    },
+    "s3": {
+        "small": SyntheticAccount(buckets=100),
+        "large": SyntheticAccount(buckets=5_000, regions=("ap-northeast-2", "us-east-1", "eu-west-1")),
+    },
+    "network": {
+        "small": SyntheticAccount(vpcs=5),
+        "large": SyntheticAccount(vpcs=200, subnets_per_vpc=24, nat_gateways_per_vpc=3),
+    },
+    "security-groups": {
+        "small": SyntheticAccount(security_groups=50, instances=100, vpcs=2),
+        "large": SyntheticAccount(security_groups=5_000, rules_per_group=20, instances=10_000, vpcs=20),
+    },
+}
+
+ENDPOINTS = {
+    "ec2s": "/?region=ap-northeast-2",
+    "s3": "/?region=ap-northeast-2",
+    "network": "/?region=ap-northeast-2",
+    "security-groups": "/?region=ap-northeast-2",
+}
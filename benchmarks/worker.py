@@ -0,0 +1,140 @@
+# benchmarks/worker.py
+# Runs one (service, scenario) benchmark in a fresh process and prints a JSON
+# result line. Every service ships its own `app` package, so each one needs its
+# own interpreter; a fresh process also makes peak RSS per scenario meaningful.
+#
+#   python -m benchmarks.worker ec2s medium --latency-ms 20
+#   python -m benchmarks.worker ec2s medium --fast-json
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+
+from benchmarks.fakeaws import FakeAWS
+from benchmarks.scenarios import ENDPOINTS, SCENARIOS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARK_SESSION = {
+    "AccessKeyId": "ASIABENCHMARK",
+    "SecretAccessKey": "benchmark",
+    "SessionToken": "benchmark",
+    "Expiration": "2099-01-01T00:00:00+00:00",
+    "Region": "ap-northeast-2",
+    "AccountId": "123456789012",
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# Envelope fields that describe the response rather than inventory records
+NON_RECORD_FIELDS = {"regions", "accounts", "timings"}
+
+
+def count_records(body):
+    """Inventory items in a response: list elements, or those of each collection in an envelope."""
+    if isinstance(body, list):
+        return len(body)
+    return sum(
+        len(value) for name, value in body.items()
+        if name not in NON_RECORD_FIELDS and isinstance(value, (list, dict))
+    )
+
+
+def load_service(service, fake):
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    # Each service runs as `app` next to the shared `common` package, as in its image
+    sys.path.insert(0, os.path.join(ROOT, "services"))
+    sys.path.insert(0, os.path.join(ROOT, "services", service))
+
+    from common.aws_clients import client_pool
+    from app import main
+
+    client_pool.clear()
+    fake.install(client_pool._session)
+    if hasattr(main, "session_client"):
+        # security-groups resolves sessions through the login service
+        main.session_client.resolve = lambda session_id: BENCHMARK_SESSION
+    return main.app
+
+
+async def measure(client, fake, path):
+    fake.reset()
+    start, cpu_start = time.perf_counter(), time.process_time()
+    # Uncompressed, so results stay comparable with runs from before compression
+    response = await client.get(path, headers={"X-Session-Id": "benchmark", "Accept-Encoding": "identity"})
+    # process_time covers every thread, so executor work is counted too
+    cpu_ms = (time.process_time() - cpu_start) * 1000
+    wall_ms = (time.perf_counter() - start) * 1000
+    response.raise_for_status()
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "cpu_ms": round(cpu_ms, 1),
+        "records": count_records(response.json()),
+        "aws_calls": sum(fake.calls.values()),
+        "calls_by_operation": dict(sorted(fake.calls.items())),
+        "payload_bytes": len(response.content),
+        "cache": response.headers.get("x-cache"),
+    }
+
+
+async def run(service, scenario, latency_ms, jitter_ms, fast_json=False):
+    import httpx
+
+    if fast_json:
+        # Read by app.aio at import time
+        os.environ["FAST_JSON"] = "true"
+
+    fake = FakeAWS(SCENARIOS[service][scenario], latency_ms, jitter_ms)
+    app = load_service(service, fake)
+    rss_before = peak_rss_mb()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        path = ENDPOINTS[service]
+        # cold: full crawl into an empty cache; warm: served from the snapshot
+        cold = await measure(client, fake, path)
+        warm = await measure(client, fake, path)
+
+    return {
+        "service": service,
+        "scenario": scenario,
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "fast_json": fast_json,
+        "endpoint": path,
+        "cold": cold,
+        "warm": warm,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "python": sys.version.split()[0],
+        "finished_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one (service, scenario) benchmark and print a JSON result line")
+    parser.add_argument("service", choices=sorted(SCENARIOS))
+    parser.add_argument("scenario")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--fast-json", action="store_true", help="Run the service with FAST_JSON=true")
+    args = parser.parse_args()
+    if args.scenario not in SCENARIOS[args.service]:
+        parser.error(f"unknown scenario {args.scenario}; expected one of {', '.join(SCENARIOS[args.service])}")
+
+    result = asyncio.run(run(args.service, args.scenario, args.latency_ms, args.jitter_ms, args.fast_json))
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
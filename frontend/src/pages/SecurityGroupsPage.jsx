@@ -3,6 +3,7 @@ import axios from "axios";
 
 function SecurityGroupsPage() {
   const [securityGroups, setSecurityGroups] = useState([]);
+  const [instances, setInstances] = useState({});
   const [loading, setLoading] = useState(false);
   const [fetched, setFetched] = useState(false);
   const [filteredSg, setFilteredSg] = useState([]);
@@ -17,9 +18,9 @@ function SecurityGroupsPage() {
       const res = await axios.get(backendUrl, {
         headers: { "x-session-ID": sessionId }
       });
-      // setSecurityGroups(res.data);
-      // setFilteredSg(res.data);
-      const flatData = Object.values(res.data).flat();
+      // Normalized response: rules per SG + attached instances keyed by ID
+      const flatData = Object.values(res.data.security_groups);
+      setInstances(res.data.instances);
       setSecurityGroups(flatData);
       setFilteredSg(flatData);
       setFetched(true);
@@ -113,6 +114,13 @@ function SecurityGroupsPage() {
                     ...sg.inbound_rules.map((r) => ({ ...r, direction: "Inbound" })),
                     ...sg.outbound_rules.map((r) => ({ ...r, direction: "Outbound" }))
                   ];
+                  const attached = sg.instance_ids.map((id) => instances[id]).filter(Boolean);
+                  const attachedColumn = (field) =>
+                    attached.length === 0
+                      ? "—"
+                      : attached.map((inst) => (
+                          <div key={inst.instance_id}>{inst[field] || "—"}</div>
+                        ));
                   return allRules.map((rule, idx) => (
                     <tr key={`${sg.sg_id}-${idx}`}>
                       {idx === 0 && (
@@ -130,16 +138,16 @@ function SecurityGroupsPage() {
                         <td rowSpan={allRules.length}>{sg.region}</td>
                       )}
                       {idx === 0 && (
-                        <td rowSpan={allRules.length}>{rule.instance_id || "—"}</td>
+                        <td rowSpan={allRules.length}>{attachedColumn("instance_id")}</td>
                       )}
                       {idx === 0 && (
-                        <td rowSpan={allRules.length}>{rule.instance_name || "—"}</td>
+                        <td rowSpan={allRules.length}>{attachedColumn("instance_name")}</td>
                       )}
                       {idx === 0 && (
-                        <td rowSpan={allRules.length}>{rule.private_ip || "—"}</td>
+                        <td rowSpan={allRules.length}>{attachedColumn("private_ip")}</td>
                       )}
                       {idx === 0 && (
-                        <td rowSpan={allRules.length}>{rule.public_ip || "—"}</td>
+                        <td rowSpan={allRules.length}>{attachedColumn("public_ip")}</td>
                       )}
                       <td>{rule.direction}</td>
                       <td>{rule.protocol}</td>
@@ -0,0 +1,5 @@
+# common/
+# Infrastructure shared by every backend service: AWS clients and rate
+# limiting, metrics, the snapshot cache and store, history, queries, and the
+# async / HTTP helpers. docker-compose adds this directory to each service's
+# build context, and the images copy it next to the service's own `app`.
@@ -0,0 +1,129 @@
+# common/aio.py
+# Async bridge for the blocking boto3 crawl code. AWS calls and heavy
+# post-processing run on a dedicated, bounded executor so the event loop (and
+# /health) never waits behind a crawl.
+import asyncio
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import orjson
+from fastapi import HTTPException, Response
+
+from common.metrics import phase
+from common.snapshot_store import snapshot_store
+from common.snapshots import AS_OF, MISS, Snapshot, etag_matches, snapshot_cache, snapshot_etag
+
+AWS_IO_WORKERS = int(os.getenv("AWS_IO_WORKERS", "32"))
+# Crawls beyond this many wait for a slot; after the timeout the caller gets 503
+MAX_CONCURRENT_CRAWLS = int(os.getenv("MAX_CONCURRENT_CRAWLS", "8"))
+CRAWL_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CRAWL_QUEUE_TIMEOUT_SECONDS", "30"))
+# Opt-in: snapshots hold plain dicts validated once when stored, and list
+# responses are encoded with orjson instead of being validated again
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() == "true"
+
+io_executor = ThreadPoolExecutor(max_workers=AWS_IO_WORKERS, thread_name_prefix="aws-io")
+crawl_slots = asyncio.Semaphore(MAX_CONCURRENT_CRAWLS)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking call on the AWS I/O executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_crawl(fn, *args, **kwargs):
+    """run_io() for crawls, bounded by MAX_CONCURRENT_CRAWLS."""
+    try:
+        await asyncio.wait_for(crawl_slots.acquire(), CRAWL_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many inventory crawls in progress; retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    try:
+        return await run_io(fn, *args, **kwargs)
+    finally:
+        crawl_slots.release()
+
+
+async def cached_snapshot(key, loader, force=False, restore=None):
+    """snapshot_cache.get() that holds no worker thread for hits or shared crawls.
+
+    ``restore()`` may return (data, crawled_at) of the last persisted crawl. It
+    seeds an empty cache, so a restarted service answers from disk (stale, with
+    a background refresh) instead of crawling first.
+    """
+    with phase("fetch"):
+        if not force:
+            found = snapshot_cache.get_nowait(key, loader)
+            if found is None and restore is not None and snapshot_cache.peek(key) is None:
+                restored = await run_io(restore)
+                if restored is not None:
+                    snapshot_cache.put(key, *restored)
+                    found = snapshot_cache.get_nowait(key, loader)
+            if isinstance(found, Future):
+                return await asyncio.wrap_future(found), MISS
+            if found is not None:
+                return found
+        return await run_crawl(snapshot_cache.get, key, loader, force)
+
+
+async def stored_snapshot(loader, as_of):
+    """Snapshot of an inventory as it was at ``as_of``; ``loader(as_of)`` returns (data, crawled_at)."""
+    if snapshot_store is None:
+        raise HTTPException(status_code=400, detail="as_of needs a snapshot store (SNAPSHOT_STORE=sqlite)")
+    with phase("fetch"):
+        found = await run_io(loader, as_of)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"No stored crawl at or before {as_of}")
+    data, crawled_at = found
+    return Snapshot(data, crawled_at), AS_OF
+
+
+async def not_modified(request, response, snapshot, content=None):
+    """Tag this view of the snapshot with an ETag; a 304 response if the client already has it.
+
+    Called before any filtering or serialization, so a repeat view of an
+    unchanged inventory costs one header comparison.
+    """
+    with phase("etag"):
+        etag = await run_io(snapshot_etag, snapshot, f"{request.url.path}?{request.url.query}", content)
+    response.headers["ETag"] = etag
+    # Browsers may keep the body but must revalidate it on every view
+    response.headers["Cache-Control"] = "no-cache"
+    if not etag_matches(request.headers.get("if-none-match"), etag):
+        return None
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return Response(status_code=304, headers=headers)
+
+
+def snapshot_data(adapter, data):
+    """Snapshot data as stored: with FAST_JSON, validated once and dumped to JSON-ready dicts."""
+    if not FAST_JSON:
+        return data
+    return adapter.dump_python(adapter.validate_python(data), mode="json")
+
+
+async def transform(fn, *args, **kwargs):
+    """run_io() for filtering / reshaping a snapshot, timed as the transform phase."""
+    with phase("transform"):
+        return await run_io(fn, *args, **kwargs)
+
+
+async def json_response(response, adapter, data, validated=False):
+    """Validate and serialize off the event loop.
+
+    FastAPI validates the return value of ``async def`` endpoints on the loop
+    itself, which stalls every other request for large inventories.
+    ``validated`` marks data built only from snapshot_data() items; with
+    FAST_JSON it is encoded as-is.
+    """
+    with phase("serialize"):
+        if FAST_JSON and validated:
+            body = await run_io(orjson.dumps, data)
+        else:
+            body = await run_io(lambda: adapter.dump_json(adapter.validate_python(data)))
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return Response(content=body, media_type="application/json", headers=headers)
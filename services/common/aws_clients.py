@@ -0,0 +1,93 @@
+# common/aws_clients.py
+# Shared boto3 client pool. Building a client reloads the botocore service model
+# and opens a fresh connection pool, so clients are reused across requests.
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+from botocore.config import Config
+
+from common.metrics import install_botocore_hooks
+from common.ratelimit import rate_limiters
+
+AWS_CLIENT_CACHE_SIZE = int(os.getenv("AWS_CLIENT_CACHE_SIZE", "64"))
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "10"))
+# "standard" retries back off exponentially with jitter and stop retrying once
+# the client's retry quota is spent, so throttling does not turn into a storm
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "standard")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "6"))
+
+
+class ClientPool:
+    """LRU of boto3 clients keyed by (credentials, region, service, pool size).
+
+    Clients built from STS credentials are dropped once those credentials expire.
+    """
+
+    def __init__(self, max_size=AWS_CLIENT_CACHE_SIZE):
+        self.max_size = max_size
+        self._clients = OrderedDict()  # key -> (expires_at, client)
+        self._lock = threading.Lock()
+        # boto3.client() on the default session is not thread-safe; build from our own
+        self._session = boto3.session.Session()
+        install_botocore_hooks(self._session)
+
+    def get(self, service, region, credentials=None, max_pool_connections=None):
+        pool_size = max_pool_connections or AWS_MAX_POOL_CONNECTIONS
+        access_key = credentials["AccessKeyId"] if credentials else None
+        key = (access_key, region, service, pool_size)
+        now = time.time()
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry[0] > now:
+                self._clients.move_to_end(key)
+                return entry[1]
+
+            kwargs = {}
+            expires_at = float("inf")
+            if credentials:
+                kwargs = {
+                    "aws_access_key_id": credentials["AccessKeyId"],
+                    "aws_secret_access_key": credentials["SecretAccessKey"],
+                    "aws_session_token": credentials.get("SessionToken"),
+                }
+                if credentials.get("Expiration"):
+                    expires_at = datetime.datetime.fromisoformat(credentials["Expiration"]).timestamp()
+
+            client = self._session.client(
+                service,
+                region_name=region,
+                config=Config(
+                    max_pool_connections=pool_size,
+                    retries={"mode": AWS_RETRY_MODE, "max_attempts": AWS_MAX_ATTEMPTS},
+                ),
+                **kwargs,
+            )
+            # Clients for the same account/region/service share one token bucket
+            account = (credentials.get("AccountId") or access_key) if credentials else "default"
+            rate_limiters.attach(client, account, region, service)
+            self._clients[key] = (expires_at, client)
+            self._clients.move_to_end(key)
+            self._evict_locked(now)
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def _evict_locked(self, now):
+        for key in [k for k, (expires_at, _) in self._clients.items() if expires_at <= now]:
+            del self._clients[key]
+        while len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+
+
+client_pool = ClientPool()
+
+
+def get_client(service, region, credentials=None, max_pool_connections=None):
+    return client_pool.get(service, region, credentials, max_pool_connections)
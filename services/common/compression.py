@@ -0,0 +1,147 @@
+# common/compression.py
+# gzip / brotli for large response bodies, negotiated from Accept-Encoding.
+# Compression runs on the I/O executor, and the compressed bodies of recent
+# ETag'd responses are kept, so another client viewing the same unchanged
+# snapshot reuses them instead of compressing megabytes of JSON again.
+import gzip
+import os
+import threading
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from common.aio import run_io
+from common.metrics import phase
+
+try:
+    import brotli
+except ImportError:
+    # Without the brotli wheel only gzip is offered
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+# Quality 4 compresses JSON better than gzip at a similar speed; 11 is far slower
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+COMPRESSED_CACHE_BYTES = int(os.getenv("COMPRESSED_CACHE_BYTES", str(64 * 1024 * 1024)))
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def negotiate(accept_encoding):
+    """The preferred encoding the client accepts ("br" or "gzip"), or None."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip") if brotli else ("gzip",):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressedBodies:
+    """LRU of compressed bodies keyed by (ETag, encoding), bounded by total size."""
+
+    def __init__(self, max_bytes=COMPRESSED_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._bodies = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._bodies.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._bodies[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """Compresses complete bodies of compressible responses.
+
+    Streamed responses (NDJSON, exports) and bodies that already carry a
+    Content-Encoding pass through unchanged.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.bodies = CompressedBodies()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        pending = {}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk shows whether to compress
+                pending["start"] = message
+                return
+            start = pending.pop("start", None)
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            if start["status"] == 304:
+                # Same Vary as the 200 it revalidates
+                headers.add_vary_header("Accept-Encoding")
+            if (
+                message.get("more_body")
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            etag = headers.get("etag")
+            compressed = self.bodies.get((etag, encoding)) if etag else None
+            if compressed is None:
+                with phase("compress"):
+                    compressed = await run_io(compress, body, encoding)
+                if etag:
+                    self.bodies.put((etag, encoding), compressed)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,40 @@
+# common/estate_client.py
+# Reads raw AWS collections from the inventory aggregator (services/inventory),
+# which crawls each (account, region) once for every service. Leave
+# ESTATE_SERVICE_URL unset to crawl AWS directly from this service.
+import os
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ESTATE_SERVICE_URL = os.getenv("ESTATE_SERVICE_URL", "")
+# Collections another service fetched this recently are reused, not re-crawled
+ESTATE_MAX_AGE_SECONDS = float(os.getenv("ESTATE_MAX_AGE_SECONDS", "60"))
+
+
+class EstateClient:
+    """Keep-alive HTTP client for GET /estate; the aggregator does the caching."""
+
+    def __init__(self, base_url: str, timeout: Tuple[float, float] = (2, 600), pool_size: int = 20):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+    def fetch(self, region: str, collections: List[str], session_id: Optional[str] = None,
+              max_age: float = ESTATE_MAX_AGE_SECONDS) -> dict:
+        """Return {"collections": {name: [raw items]}, "links": {...}, ...}; raises requests.RequestException."""
+        resp = self._http.get(
+            f"{self.base_url}/estate",
+            params={"region": region, "collections": ",".join(collections), "max_age": max_age},
+            headers={"X-Session-ID": session_id} if session_id else None,
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+
+estate_client = EstateClient(ESTATE_SERVICE_URL) if ESTATE_SERVICE_URL else None
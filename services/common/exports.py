@@ -0,0 +1,82 @@
+# common/exports.py
+# Row-by-row CSV / XLSX export bodies for StreamingResponse.
+import csv
+import datetime
+import io
+import tempfile
+import zlib
+
+import openpyxl
+from fastapi.responses import StreamingResponse
+
+# Rows are flushed to the client in batches of this size
+CSV_FLUSH_ROWS = 500
+CHUNK_SIZE = 64 * 1024
+# The assembled .xlsx stays in memory up to this size, then spills to disk
+XLSX_SPOOL_BYTES = 8 * 1024 * 1024
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def csv_chunks(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def xlsx_chunks(header, rows, sheet_title):
+    # Write-only mode streams rows to a temp file instead of keeping cell objects;
+    # the zip container can only be assembled once the last row is written.
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES) as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_response(fmt, header, rows, filename_prefix, compress=False):
+    if fmt == "csv":
+        chunks = csv_chunks(header, rows)
+    else:
+        chunks = xlsx_chunks(header, rows, filename_prefix[:31])
+
+    filename = f"{filename_prefix}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    media_type = MEDIA_TYPES[fmt]
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
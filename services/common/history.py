@@ -0,0 +1,140 @@
+# common/history.py
+# Per-resource fingerprints of recent crawls, used to skip re-enriching
+# unchanged resources and to answer /diff?since= queries. With a snapshot store
+# configured every crawl is also persisted, and a restarted process picks up
+# where the last one left off.
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from common.snapshot_store import snapshot_store
+
+SNAPSHOT_HISTORY_VERSIONS = int(os.getenv("SNAPSHOT_HISTORY_VERSIONS", "20"))
+SNAPSHOT_HISTORY_KEYS = int(os.getenv("SNAPSHOT_HISTORY_KEYS", "256"))
+
+
+def fingerprint(record):
+    """Stable hash of an AWS record or response item."""
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class InventoryHistory:
+    """Keeps the last few crawls per (account, region, resource type) key.
+
+    Only the latest crawl keeps full items ({id: (fingerprint, item)}); older
+    versions keep just {id: fingerprint}, so memory grows with resource count,
+    not with item size times history length.
+    """
+
+    def __init__(self, max_versions=SNAPSHOT_HISTORY_VERSIONS, max_keys=SNAPSHOT_HISTORY_KEYS, store=snapshot_store):
+        self.max_versions = max_versions
+        self.max_keys = max_keys
+        self.store = store
+        self._versions = OrderedDict()  # key -> deque[(taken_at, {id: fingerprint})]
+        self._latest = {}  # key -> {id: (fingerprint, item)}
+        self._lock = threading.Lock()
+
+    def latest(self, key):
+        with self._lock:
+            entries = self._latest.get(key)
+        if entries is None and self.store is not None:
+            # Warm start: continue incrementally from the last persisted crawl
+            stored = self.store.entries(key)
+            if stored is not None:
+                taken_at, entries = stored
+                self._remember(key, entries, taken_at)
+        return entries or {}
+
+    def record(self, key, entries, taken_at=None):
+        taken_at = taken_at or time.time()
+        self._remember(key, entries, taken_at)
+        if self.store is not None:
+            self.store.record(key, entries, taken_at)
+
+    def _remember(self, key, entries, taken_at):
+        with self._lock:
+            self._latest[key] = entries
+            versions = self._versions.get(key)
+            if versions is None:
+                versions = self._versions[key] = deque(maxlen=self.max_versions)
+            self._versions.move_to_end(key)
+            versions.append((taken_at, {resource_id: fp for resource_id, (fp, _) in entries.items()}))
+            while len(self._versions) > self.max_keys:
+                old_key, _ = self._versions.popitem(last=False)
+                self._latest.pop(old_key, None)
+
+    def stored(self, key, as_of=None):
+        """(crawled_at, [items]) of the last crawl, or of the newest one at or before as_of.
+
+        The last crawl comes from memory or, after a restart, the snapshot
+        store; older crawls need the store. None if there is no such crawl.
+        """
+        if as_of is not None:
+            found = self.store.entries(key, as_of) if self.store is not None else None
+            if found is None:
+                return None
+            taken_at, entries = found
+        else:
+            entries = self.latest(key)
+            with self._lock:
+                versions = self._versions.get(key)
+                taken_at = versions[-1][0] if versions else None
+            if taken_at is None:
+                return None
+        return taken_at, [item for _, item in entries.values()]
+
+    def diff(self, key, since):
+        """Changes between the newest crawl at or before `since` and the latest crawl.
+
+        Returns None if the key has never been crawled. If every retained crawl
+        is newer than `since`, the whole latest crawl is reported as added and
+        `truncated` is set.
+        """
+        with self._lock:
+            versions = list(self._versions.get(key, ()))
+            latest = self._latest.get(key, {})
+        if not versions:
+            return None
+
+        base_at, base = None, {}
+        for taken_at, fingerprints in versions:
+            if taken_at <= since:
+                base_at, base = taken_at, fingerprints
+
+        added, modified = [], []
+        for resource_id, (fp, item) in latest.items():
+            if resource_id not in base:
+                added.append(item)
+            elif base[resource_id] != fp:
+                modified.append(item)
+
+        return {
+            "since": since,
+            "base": base_at,
+            "current": versions[-1][0],
+            "truncated": base_at is None,
+            "added": added,
+            "modified": modified,
+            "removed": [resource_id for resource_id in base if resource_id not in latest],
+        }
+
+
+def merge_diffs(diffs, since):
+    """Combine per-region diffs into one response."""
+    diffs = [d for d in diffs if d is not None]
+    bases = [d["base"] for d in diffs if d["base"] is not None]
+    return {
+        "since": since,
+        "base": min(bases) if bases else None,
+        "current": max((d["current"] for d in diffs), default=None),
+        "truncated": any(d["truncated"] for d in diffs),
+        "added": [item for d in diffs for item in d["added"]],
+        "modified": [item for d in diffs for item in d["modified"]],
+        "removed": [resource_id for d in diffs for resource_id in d["removed"]],
+    }
+
+
+inventory_history = InventoryHistory()
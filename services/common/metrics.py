@@ -0,0 +1,250 @@
+# common/metrics.py
+# Prometheus text-format metrics: per-AWS-operation latency / retries /
+# throttles / response sizes from botocore event hooks, plus per-endpoint
+# request and phase (fetch / transform / serialize) timings.
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import Response
+from starlette.datastructures import MutableHeaders
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+THROTTLE_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottled",
+    "RequestThrottledException", "RequestLimitExceeded", "TooManyRequestsException",
+    "SlowDown", "RequestLimitExceededException", "BandwidthLimitExceeded",
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_label_text(self.labels, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            # Counts are stored per bucket and made cumulative on render; values
+            # above the last bound only show up in +Inf (the total count)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _label_text(self.labels + ("le",), key + (repr(float(bound)),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_bucket{_label_text(self.labels + ('le',), key + ('+Inf',))} {values[-1]}"
+            yield f"{self.name}_sum{_label_text(self.labels, key)} {values[-2]}"
+            yield f"{self.name}_count{_label_text(self.labels, key)} {values[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+aws_call_duration = REGISTRY.register(Histogram(
+    "aws_call_duration_seconds", "AWS API call latency including retries", ["aws_service", "operation"]))
+aws_calls = REGISTRY.register(Counter(
+    "aws_calls_total", "AWS API calls by final outcome", ["aws_service", "operation", "outcome"]))
+aws_retries = REGISTRY.register(Counter(
+    "aws_call_retries_total", "Retry attempts made by botocore", ["aws_service", "operation"]))
+aws_throttles = REGISTRY.register(Counter(
+    "aws_throttled_attempts_total", "Attempts rejected with a throttling error", ["aws_service", "operation", "code"]))
+aws_response_size = REGISTRY.register(Histogram(
+    "aws_response_size_bytes", "AWS API response body size", ["aws_service", "operation"], SIZE_BUCKETS))
+http_request_duration = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route", ["method", "route", "status"]))
+endpoint_phase_duration = REGISTRY.register(Histogram(
+    "endpoint_phase_duration_seconds", "Time spent per request phase", ["route", "phase"]))
+
+
+# ---------- botocore hooks ----------
+def _names(model):
+    return model.service_model.service_id.hyphenize(), model.name
+
+
+def _on_before_call(model, context, **kwargs):
+    context["metrics_call"] = _names(model)
+    context["metrics_started_at"] = time.perf_counter()
+
+
+def _on_after_call(http_response, parsed, model, context, **kwargs):
+    service, operation = _names(model)
+    started = context.get("metrics_started_at")
+    if started is not None:
+        aws_call_duration.observe(time.perf_counter() - started, aws_service=service, operation=operation)
+
+    metadata = parsed.get("ResponseMetadata", {}) if isinstance(parsed, dict) else {}
+    retries = metadata.get("RetryAttempts", 0)
+    if retries:
+        aws_retries.inc(retries, aws_service=service, operation=operation)
+
+    length = http_response.headers.get("content-length") if http_response is not None else None
+    if length is not None:
+        aws_response_size.observe(int(length), aws_service=service, operation=operation)
+
+    status = getattr(http_response, "status_code", 200)
+    if status < 300:
+        outcome = "ok"
+    elif parsed.get("Error", {}).get("Code") in THROTTLE_CODES:
+        outcome = "throttled"
+    else:
+        outcome = "error"
+    aws_calls.inc(aws_service=service, operation=operation, outcome=outcome)
+
+
+def _on_after_call_error(context, **kwargs):
+    # Connection errors etc.; this event carries no model, so use what before-call saved
+    if "metrics_call" not in context:
+        return
+    service, operation = context["metrics_call"]
+    started = context.get("metrics_started_at")
+    if started is not None:
+        aws_call_duration.observe(time.perf_counter() - started, aws_service=service, operation=operation)
+    aws_calls.inc(aws_service=service, operation=operation, outcome="exception")
+
+
+def _on_needs_retry(response, operation, **kwargs):
+    # Called after every attempt; only observes, never decides (returns None)
+    if response is None:
+        return None
+    _, parsed = response
+    code = parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None
+    if code in THROTTLE_CODES:
+        service = operation.service_model.service_id.hyphenize()
+        aws_throttles.inc(aws_service=service, operation=operation.name, code=code)
+    return None
+
+
+def install_botocore_hooks(session):
+    """Instrument every client later created from this boto3 Session."""
+    session.events.register("before-call", _on_before_call)
+    session.events.register("after-call", _on_after_call)
+    session.events.register("after-call-error", _on_after_call_error)
+    session.events.register("needs-retry", _on_needs_retry)
+
+
+# ---------- Request phases ----------
+_phases = ContextVar("request_phases", default=None)
+
+
+@contextmanager
+def phase(name):
+    """Time a block as one phase of the current request (fetch, transform, ...)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = _phases.get()
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Records request latency and phase timings per route.
+
+    Phases are also appended to the Server-Timing response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        phases = {}
+        token = _phases.set(phases)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if phases:
+                    headers = MutableHeaders(scope=message)
+                    timing = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items())
+                    existing = headers.get("server-timing")
+                    headers["server-timing"] = f"{existing}, {timing}" if existing else timing
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _phases.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            if route != "/metrics":
+                http_request_duration.observe(
+                    time.perf_counter() - start, method=scope["method"], route=route, status=str(status["code"])
+                )
+                for name, seconds in phases.items():
+                    endpoint_phase_duration.observe(seconds, route=route, phase=name)
+
+
+def metrics_response():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,209 @@
+# common/query.py
+# Server-side filter / sort / cursor paging over a snapshot's items.
+# Indexes are built once per snapshot (see Snapshot.derived) and reused by
+# every request that hits the same snapshot.
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+MAX_PAGE_SIZE = 1000
+# Filters matching fewer than 1/N of the items are sorted directly instead of
+# walking the whole sort order to find them
+SPARSE_SELECTION_RATIO = 8
+
+
+class PageRequest(BaseModel):
+    sort: Optional[str] = None
+    order: str = Field("asc", pattern="^(asc|desc)$")
+    limit: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+
+    def requested(self):
+        return bool(self.sort or self.limit or self.cursor)
+
+
+def item_value(item, field):
+    if isinstance(item, dict):
+        return item.get(field)
+    return getattr(item, field, None)
+
+
+def normalize(value):
+    # Query parameters arrive as strings; compare everything case-insensitively as text
+    return "" if value is None else str(value).lower()
+
+
+def sort_key(value):
+    # None sorts first; everything else is compared as (type rank, value)
+    if value is None:
+        return (0, "")
+    if isinstance(value, bool):
+        return (1, int(value))
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value).lower())
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def valid_key(rank, value, item_id):
+    # Same shapes as sort_key() + (id,), so bisect never compares mismatched types
+    if type(rank) is not int or not isinstance(item_id, str):
+        return False
+    if rank == 0:
+        return value in ("", None)
+    if rank == 1:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if rank == 2:
+        return isinstance(value, str)
+    return False
+
+
+def decode_cursor(cursor):
+    try:
+        rank, value, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not valid_key(rank, value, item_id):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return (rank, "" if value is None else value, item_id)
+
+
+class SnapshotIndex:
+    """Value -> positions postings for a fixed set of fields over one list of items.
+
+    ``extractors`` may map a field to a function returning several values for
+    one item (e.g. every port a security group opens); by default the item's
+    attribute of the same name is used.
+    """
+
+    def __init__(self, items, fields, id_field, extractors=None):
+        self.items = items
+        self.id_field = id_field
+        self.extractors = extractors or {}
+        self._postings = {field: {} for field in fields}
+        self._orders = {}
+        self._sets = {}  # (field, value) -> frozenset of positions, built on first use
+
+        for pos, item in enumerate(items):
+            for field in fields:
+                extract = self.extractors.get(field)
+                values = extract(item) if extract else [item_value(item, field)]
+                for value in set(normalize(v) for v in values):
+                    self._postings[field].setdefault(value, []).append(pos)
+
+    def positions(self, field, value):
+        # A list value matches any of its members
+        if isinstance(value, (list, tuple, set)):
+            matched = set()
+            for member in value:
+                matched.update(self._postings[field].get(normalize(member), []))
+            return matched
+        key = (field, normalize(value))
+        positions = self._sets.get(key)
+        if positions is None:
+            positions = self._sets[key] = frozenset(self._postings[field].get(key[1], ()))
+        return positions
+
+    def select(self, filters):
+        """Positions of items matching every non-None filter (field -> value)."""
+        active = [(field, value) for field, value in filters.items() if value is not None]
+        if not active:
+            return None
+        postings = sorted((self.positions(field, value) for field, value in active), key=len)
+        if len(postings) == 1:
+            return postings[0]
+        selected = set(postings[0])
+        for positions in postings[1:]:
+            selected.intersection_update(positions)
+            if not selected:
+                break
+        return selected
+
+    def key(self, pos, sort):
+        item = self.items[pos]
+        return sort_key(item_value(item, sort)) + (str(item_value(item, self.id_field)),)
+
+    def order(self, sort):
+        """(positions, keys, ranks) sorted by sort, cached for the snapshot's lifetime.
+
+        ``keys[i]`` is the sort key of ``positions[i]``; ``ranks[pos]`` is the
+        index of ``pos`` in ``positions``. The index itself lives in
+        Snapshot.derived, so this is built once per snapshot and sort field.
+        """
+        cached = self._orders.get(sort)
+        if cached is None:
+            keyed = sorted((self.key(pos, sort), pos) for pos in range(len(self.items)))
+            keys = [key for key, _ in keyed]
+            positions = [pos for _, pos in keyed]
+            ranks = [0] * len(positions)
+            for rank, pos in enumerate(positions):
+                ranks[pos] = rank
+            cached = self._orders[sort] = (positions, keys, ranks)
+        return cached
+
+    def query(self, filters, sort, descending=False, limit=None, cursor=None):
+        """Return (items, total matched, next cursor or None).
+
+        A page costs O(log N + limit) for unfiltered queries; filtered ones
+        walk the sort order from the cursor, or sort the matches when they are
+        a small share of the snapshot.
+        """
+        selected = self.select(filters)
+        positions, keys, ranks = self.order(sort)
+        total = len(positions) if selected is None else len(selected)
+
+        # Ranks still to walk: [start, stop) ascending, or downwards from stop - 1
+        start, stop = 0, len(positions)
+        if cursor:
+            last = decode_cursor(cursor)
+            if descending:
+                stop = bisect_left(keys, last)
+            else:
+                start = bisect_right(keys, last)
+
+        wanted = None if limit is None else limit + 1
+        if selected is not None and len(selected) * SPARSE_SELECTION_RATIO < len(positions):
+            matched = sorted(ranks[pos] for pos in selected)
+            window = matched[bisect_left(matched, start):bisect_left(matched, stop)]
+            if descending:
+                window.reverse()
+            page = [positions[rank] for rank in window[:wanted]]
+        else:
+            walk = range(stop - 1, start - 1, -1) if descending else range(start, stop)
+            page = []
+            for rank in walk:
+                pos = positions[rank]
+                if selected is None or pos in selected:
+                    page.append(pos)
+                    if wanted is not None and len(page) == wanted:
+                        break
+
+        next_cursor = None
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(list(keys[ranks[page[-1]]]))
+
+        return [self.items[pos] for pos in page], total, next_cursor
+
+
+def page_headers(response, total, next_cursor):
+    response.headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+
+def run_query(index, filters, page, sort_fields, response):
+    """Filter/sort/page with an index; sort_fields[0] is the default sort."""
+    sort = page.sort or sort_fields[0]
+    if sort not in sort_fields:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by {sort}; expected one of {', '.join(sort_fields)}")
+    items, total, next_cursor = index.query(filters, sort, page.order == "desc", page.limit, page.cursor)
+    page_headers(response, total, next_cursor)
+    return items
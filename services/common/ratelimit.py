@@ -0,0 +1,128 @@
+# common/ratelimit.py
+# Client-side rate limiting shared by every client that talks to the same
+# (account, region, AWS service). Each HTTP attempt (retries included) takes a
+# token; throttling errors halve the refill rate and successes slowly raise it
+# again (AIMD), so parallel crawls settle just under the account's API limit
+# instead of throttling each other.
+import os
+import threading
+import time
+
+from common.metrics import Counter, REGISTRY, THROTTLE_CODES
+
+# Requests per second and burst size per AWS service; "service=rate:burst,..."
+DEFAULT_RATE_LIMITS = {"ec2": (20.0, 100.0), "s3": (100.0, 200.0), "sts": (10.0, 20.0)}
+FALLBACK_RATE_LIMIT = (20.0, 50.0)
+MIN_RATE = 1.0
+# A burst of throttles within this window only counts as one decrease
+DECREASE_COOLDOWN_SECONDS = 1.0
+
+rate_limit_wait = REGISTRY.register(Counter(
+    "aws_rate_limit_wait_seconds_total", "Time spent waiting for a rate-limit token", ["aws_service"]))
+rate_limit_decreases = REGISTRY.register(Counter(
+    "aws_rate_limit_decreases_total", "Rate reductions after throttling", ["aws_service"]))
+
+
+def parse_rate_limits(value):
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        service, _, spec = item.partition("=")
+        rate, _, burst = spec.partition(":")
+        limits[service.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+RATE_LIMITS = parse_rate_limits(os.getenv("AWS_RATE_LIMITS", ""))
+
+
+class AdaptiveTokenBucket:
+    def __init__(self, rate, burst, min_rate=MIN_RATE):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take one token, sleeping if needed; returns the time waited.
+
+        Tokens may go negative: each caller reserves its slot under the lock and
+        sleeps off its own debt, so waiters are served in arrival order.
+        """
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+                return False
+            self._refill_locked(now)
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Drop the banked burst too; it is what just got throttled
+            self.tokens = min(self.tokens, 0.0)
+            return True
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                # About +1 request/second for every second spent at the current rate
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+
+
+class RateLimiterRegistry:
+    def __init__(self, limits=RATE_LIMITS):
+        self.limits = limits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, account, region, service):
+        key = (account, region, service)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = AdaptiveTokenBucket(*self.limits.get(service, FALLBACK_RATE_LIMIT))
+            return bucket
+
+    def attach(self, client, account, region, service):
+        """Make every HTTP attempt of `client` draw from the shared bucket."""
+        bucket = self.bucket(account, region, service)
+
+        def before_send(**kwargs):
+            waited = bucket.acquire()
+            if waited:
+                rate_limit_wait.inc(waited, aws_service=service)
+            return None  # never short-circuits the request
+
+        def after_attempt(response, **kwargs):
+            # needs-retry fires after every attempt; observe only
+            if response is None:
+                return None
+            http_response, parsed = response
+            code = parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None
+            if code in THROTTLE_CODES:
+                if bucket.on_throttle():
+                    rate_limit_decreases.inc(aws_service=service)
+            elif http_response.status_code < 300:
+                bucket.on_success()
+            return None
+
+        client.meta.events.register("before-send", before_send)
+        client.meta.events.register("needs-retry", after_attempt)
+        return bucket
+
+
+rate_limiters = RateLimiterRegistry()
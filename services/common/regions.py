@@ -0,0 +1,50 @@
+# common/regions.py
+# Multi-region fan-out: ?region=all or ?region=us-east-1,eu-west-1
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.aws_clients import get_client
+
+AWS_REGION_WORKERS = int(os.getenv("AWS_REGION_WORKERS", "8"))
+DEFAULT_REGION = os.getenv("AWS_REGION", "ap-northeast-2")
+
+
+def is_multi_region(region):
+    return region == "all" or "," in region
+
+
+def resolve_regions(region, credentials=None):
+    """Expand the region query parameter into a list of region names."""
+    if region == "all":
+        ec2 = get_client("ec2", DEFAULT_REGION, credentials)
+        return sorted(r["RegionName"] for r in ec2.describe_regions()["Regions"])
+    return list(dict.fromkeys(r.strip() for r in region.split(",") if r.strip()))
+
+
+def _timed(fn, region):
+    start = time.perf_counter()
+    try:
+        return fn(region), None, time.perf_counter() - start
+    except Exception as e:
+        return None, str(e), time.perf_counter() - start
+
+
+def fan_out(regions, fn, max_workers=AWS_REGION_WORKERS):
+    """Run fn(region) for every region on a bounded pool.
+
+    Returns ({region: result}, {region: {"region", "elapsed_ms", "error"}}), both
+    in the order of ``regions``. A failing region gets result None and an error
+    message instead of failing the whole call.
+    """
+    if not regions:
+        return {}, {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(regions)), thread_name_prefix="region") as pool:
+        futures = [(region, pool.submit(_timed, fn, region)) for region in regions]
+        results = {}
+        status = {}
+        for region, future in futures:
+            result, error, elapsed = future.result()
+            results[region] = result
+            status[region] = {"region": region, "elapsed_ms": round(elapsed * 1000, 1), "error": error}
+    return results, status
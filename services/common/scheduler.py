@@ -0,0 +1,162 @@
+# common/scheduler.py
+# Background re-crawls of the inventories people actually look at. Every view
+# registers its (account/session, region, resource type) target; a scheduler
+# thread re-crawls due targets into the snapshot cache a little before their
+# TTL runs out, so page loads are served warm instead of waiting on AWS.
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.metrics import Counter, REGISTRY
+from common.snapshots import SNAPSHOT_TTL_SECONDS, snapshot_cache
+
+logger = logging.getLogger(__name__)
+
+CRAWL_SCHEDULER_ENABLED = os.getenv("CRAWL_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Re-crawl before the snapshot goes stale; jitter spreads targets registered together
+CRAWL_INTERVAL_SECONDS = float(os.getenv("CRAWL_INTERVAL_SECONDS", str(SNAPSHOT_TTL_SECONDS * 0.8)))
+CRAWL_JITTER = float(os.getenv("CRAWL_JITTER", "0.1"))  # +/- fraction of the interval
+# Targets nobody has viewed for this long are dropped
+CRAWL_IDLE_SECONDS = float(os.getenv("CRAWL_IDLE_SECONDS", "3600"))
+CRAWL_SCHEDULER_WORKERS = int(os.getenv("CRAWL_SCHEDULER_WORKERS", "2"))
+CRAWL_MAX_FAILURES = int(os.getenv("CRAWL_MAX_FAILURES", "3"))
+# Stop this long before the target's STS credentials expire
+EXPIRY_SKEW_SECONDS = 60
+MAX_SLEEP_SECONDS = 60
+
+scheduled_crawls = REGISTRY.register(Counter(
+    "scheduled_crawls_total", "Background re-crawls by outcome", ["resource", "outcome"]))
+
+
+class TargetExpired(Exception):
+    """Raised by a loader whose credentials are gone; the target is dropped."""
+
+
+class CrawlTarget:
+    def __init__(self, key, loader, expires_at=None, pinned=False):
+        self.key = key
+        self.loader = loader
+        self.expires_at = expires_at
+        self.pinned = pinned  # configured at startup; never dropped as idle
+        self.last_viewed = time.time()
+        self.next_due = 0.0
+        self.failures = 0
+        self.running = False
+
+
+class CrawlScheduler:
+    """Re-crawls registered targets on an interval, most recently viewed first."""
+
+    def __init__(self, cache=snapshot_cache, interval=CRAWL_INTERVAL_SECONDS, jitter=CRAWL_JITTER,
+                 idle=CRAWL_IDLE_SECONDS, workers=CRAWL_SCHEDULER_WORKERS, enabled=CRAWL_SCHEDULER_ENABLED):
+        self.cache = cache
+        self.interval = interval
+        self.jitter = jitter
+        self.idle = idle
+        self.workers = workers
+        self.enabled = enabled
+        self._targets = {}  # snapshot key -> CrawlTarget
+        self._running = 0
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._executor = None
+
+    def register(self, key, loader, expires_at=None, pinned=False):
+        """Record a view of key; the loader is what the scheduler will call to re-crawl it."""
+        if not self.enabled:
+            return
+        with self._wakeup:
+            target = self._targets.get(key)
+            if target is None:
+                target = self._targets[key] = CrawlTarget(key, loader, expires_at, pinned)
+                # Pinned targets are crawled right away; a viewed one was just crawled by its view
+                target.next_due = time.time() if pinned else self._next_run(time.time())
+            else:
+                target.loader = loader
+                target.expires_at = expires_at
+                target.pinned = target.pinned or pinned
+                target.last_viewed = time.time()
+            self._ensure_started_locked()
+            self._wakeup.notify()
+
+    def targets(self):
+        with self._wakeup:
+            return list(self._targets.values())
+
+    def _next_run(self, now):
+        return now + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _ensure_started_locked(self):
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawl-scheduler")
+        self._thread = threading.Thread(target=self._loop, name="crawl-scheduler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._wakeup:
+                due, wait = self._take_due_locked(time.time())
+                if not due:
+                    self._wakeup.wait(wait)
+                    continue
+            for target in due:
+                self._executor.submit(self._crawl, target)
+
+    def _take_due_locked(self, now):
+        """Pick due targets for the free worker slots; returns (targets, seconds to sleep)."""
+        for key, target in list(self._targets.items()):
+            if target.running:
+                continue
+            if target.expires_at is not None and target.expires_at - EXPIRY_SKEW_SECONDS <= now:
+                logger.info(f"Stopped re-crawling {key}: credentials expired")
+                del self._targets[key]
+            elif not target.pinned and now - target.last_viewed > self.idle:
+                del self._targets[key]
+
+        waiting = [t for t in self._targets.values() if not t.running]
+        due = sorted((t for t in waiting if t.next_due <= now), key=lambda t: t.last_viewed, reverse=True)
+        due = due[:self.workers - self._running]
+        for target in due:
+            target.running = True
+        self._running += len(due)
+
+        upcoming = [t.next_due for t in waiting if t.next_due > now]
+        wait = min([MAX_SLEEP_SECONDS] + [due_at - now for due_at in upcoming])
+        return due, wait
+
+    def _crawl(self, target):
+        outcome = "ok"
+        try:
+            snapshot = self.cache.peek(target.key)
+            if snapshot is not None and snapshot.age < self.interval / 2:
+                # A view (or ?refresh) crawled it recently; count from there
+                outcome = "skipped"
+            else:
+                self.cache.get(target.key, target.loader, force=True)
+                target.failures = 0
+        except TargetExpired as e:
+            outcome = "expired"
+            logger.info(f"Stopped re-crawling {target.key}: {e}")
+        except Exception as e:
+            outcome = "error"
+            target.failures += 1
+            logger.error(f"Scheduled crawl of {target.key} failed ({target.failures}/{CRAWL_MAX_FAILURES}): {e}")
+        finally:
+            scheduled_crawls.inc(resource=target.key[2], outcome=outcome)
+            with self._wakeup:
+                target.running = False
+                self._running -= 1
+                snapshot = self.cache.peek(target.key)
+                started = snapshot.fetched_at if outcome == "skipped" and snapshot is not None else time.time()
+                target.next_due = self._next_run(started)
+                if outcome == "expired" or (outcome == "error" and not target.pinned
+                                            and target.failures >= CRAWL_MAX_FAILURES):
+                    self._targets.pop(target.key, None)
+                self._wakeup.notify()
+
+
+crawl_scheduler = CrawlScheduler()
@@ -0,0 +1,114 @@
+# common/session_client.py
+# Resolves X-Session-ID / X-Session-Group headers to STS credentials through the
+# auth service.
+import datetime
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Stop serving cached credentials this long before STS says they expire
+EXPIRY_SKEW_SECONDS = 60
+
+
+def session_expires_at(session: dict) -> Optional[float]:
+    """Epoch seconds at which the session's STS credentials expire, if known."""
+    expiration = session.get("Expiration") or session.get("expiration")
+    return datetime.datetime.fromisoformat(expiration).timestamp() if expiration else None
+
+
+def session_scope(session: dict) -> str:
+    """Cache key for data crawled with this session.
+
+    Roles in one account can see different resources (or none), so crawls are
+    shared per role, not per account. Sessions without a RoleArn fall back to
+    their own access key.
+    """
+    return session.get("RoleArn") or session["AccessKeyId"]
+
+
+class SessionClient:
+    """Keep-alive HTTP client with a short TTL cache and single-flight lookups."""
+
+    def __init__(self, base_url: str, ttl: float = 60, timeout: Tuple[float, float] = (2, 5),
+                 pool_size: int = 20, max_entries: int = 10000):
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+        self._cache: Dict[str, Tuple[float, dict]] = {}  # path -> (cached_until, session or group)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, session_id: str) -> dict:
+        """Return the session for session_id; raises requests.RequestException on failure."""
+        # The id travels with the credentials so crawls can forward it (see estate_client)
+        return {**self._resolve(f"session/{session_id}"), "SessionId": session_id}
+
+    def resolve_group(self, group_id: str) -> dict:
+        """Return a session group: {"group_id", "region", "expiration", "members": [...]}."""
+        return self._resolve(f"group/{group_id}")
+
+    def _resolve(self, path: str) -> dict:
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None and entry[0] > time.time():
+                return entry[1]
+            future = self._inflight.get(path)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[path] = future
+
+        # Concurrent requests for the same session wait on the first lookup
+        if not leader:
+            return future.result()
+
+        try:
+            session = self._fetch(path)
+            # Inside the try: if caching fails (e.g. a malformed Expiration),
+            # the waiters must get the error instead of blocking forever
+            self._store(path, session)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(session)
+            return session
+        finally:
+            with self._lock:
+                self._inflight.pop(path, None)
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._cache.pop(f"session/{session_id}", None)
+
+    def _fetch(self, path: str) -> dict:
+        resp = self._http.get(f"{self.base_url}/{path}", timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _store(self, path: str, session: dict) -> None:
+        now = time.time()
+        cached_until = now + self.ttl
+        expires = session_expires_at(session)
+        if expires is not None:
+            cached_until = min(cached_until, expires - EXPIRY_SKEW_SECONDS)
+        if cached_until <= now:
+            return
+
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                while len(self._cache) >= self.max_entries:
+                    self._cache.pop(next(iter(self._cache)))
+            self._cache[path] = (cached_until, session)
@@ -0,0 +1,222 @@
+# common/snapshot_store.py
+# On-disk history of every crawl, for warm starts and ?as_of= queries.
+#
+# Storage grows with changes, not with the number of crawls:
+#   records   - each distinct item version once, addressed by content hash
+#   parts     - tags and security-group references, once each however many
+#               items carry them
+#   versions  - (key, resource id) -> record, valid from one crawl until the
+#               crawl that changed or removed it
+#   crawls    - one small row per crawl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# List fields whose elements repeat across many items; each element is stored once
+INTERNED_FIELDS = ("tags", "security_groups")
+PART_REF = "$part"
+# SQLite's default limit on host parameters per statement is 999
+SQL_BATCH_SIZE = 500
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def scope_of(key):
+    return "|".join(key)
+
+
+def encode(item):
+    """Return (record hash, record json, {part hash: part json})."""
+    data = item.model_dump(mode="json") if hasattr(item, "model_dump") else dict(item)
+    parts = {}
+    for field in INTERNED_FIELDS:
+        value = data.get(field)
+        if isinstance(value, list):
+            refs = []
+            for element in value:
+                text = _dumps(element)
+                part = _hash(text)
+                parts[part] = text
+                refs.append({PART_REF: part})
+            data[field] = refs
+    text = _dumps(data)
+    return _hash(text), text, parts
+
+
+class SQLiteSnapshotStore:
+    """Durable, append-mostly crawl history shared by every worker that mounts the file."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.models = {}  # resource type -> pydantic model items are rebuilt as
+        self._local = threading.local()
+        self._open = {}  # scope -> {resource_id: (source fingerprint, record hash)}; writer thread only
+        # One writer keeps crawl order and takes the disk writes off the crawl path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-store")
+        conn = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS records (hash TEXT PRIMARY KEY, data TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS parts (hash TEXT PRIMARY KEY, data TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS versions ("
+            " scope TEXT NOT NULL,"
+            " resource_id TEXT NOT NULL,"
+            " source_fingerprint TEXT NOT NULL,"
+            " record TEXT NOT NULL,"
+            " valid_from REAL NOT NULL,"
+            " valid_to REAL);"
+            "CREATE INDEX IF NOT EXISTS versions_open ON versions (scope, resource_id) WHERE valid_to IS NULL;"
+            "CREATE INDEX IF NOT EXISTS versions_from ON versions (scope, valid_from);"
+            "CREATE TABLE IF NOT EXISTS crawls (scope TEXT NOT NULL, taken_at REAL NOT NULL,"
+            " PRIMARY KEY (scope, taken_at));"
+        )
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register_model(self, resource, model):
+        """Rebuild stored items of this resource type as `model` instead of dicts."""
+        self.models[resource] = model
+
+    # ---------- Writes ----------
+    def record(self, key, entries, taken_at):
+        """Queue one crawl ({resource_id: (fingerprint, item)}) for writing."""
+        self._writer.submit(self._write, scope_of(key), dict(entries), taken_at)
+
+    def flush(self):
+        self._writer.submit(lambda: None).result()
+
+    def _open_versions(self, conn, scope):
+        current = self._open.get(scope)
+        if current is None:
+            rows = conn.execute(
+                "SELECT resource_id, source_fingerprint, record FROM versions"
+                " WHERE scope = ? AND valid_to IS NULL",
+                (scope,),
+            )
+            current = self._open[scope] = {rid: (fp, record) for rid, fp, record in rows}
+        return current
+
+    def _write(self, scope, entries, taken_at):
+        try:
+            conn = self._conn()
+            current = self._open_versions(conn, scope)
+            records, parts, opened = {}, {}, []
+            for resource_id, (fp, item) in entries.items():
+                previous = current.get(resource_id)
+                # Same source fingerprint means the crawl reused the previous item as-is
+                if previous is not None and previous[0] == fp:
+                    continue
+                record, text, item_parts = encode(item)
+                if previous is not None and previous[1] == record:
+                    current[resource_id] = (fp, record)
+                    continue
+                records[record] = text
+                parts.update(item_parts)
+                opened.append((scope, resource_id, fp, record, taken_at))
+            closed = [rid for rid in current if rid not in entries]
+            closed += [row[1] for row in opened if row[1] in current]
+
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO parts (hash, data) VALUES (?, ?)", parts.items())
+                conn.executemany("INSERT OR IGNORE INTO records (hash, data) VALUES (?, ?)", records.items())
+                conn.executemany(
+                    "UPDATE versions SET valid_to = ? WHERE scope = ? AND resource_id = ? AND valid_to IS NULL",
+                    [(taken_at, scope, rid) for rid in closed],
+                )
+                conn.executemany(
+                    "INSERT INTO versions (scope, resource_id, source_fingerprint, record, valid_from)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    opened,
+                )
+                conn.execute("INSERT OR IGNORE INTO crawls (scope, taken_at) VALUES (?, ?)", (scope, taken_at))
+
+            for rid in closed:
+                current.pop(rid, None)
+            for _, rid, fp, record, _ in opened:
+                current[rid] = (fp, record)
+        except Exception as e:
+            # The in-memory state is still correct; reload the open versions next time
+            self._open.pop(scope, None)
+            logger.error(f"Failed to persist crawl of {scope}: {e}")
+
+    # ---------- Reads ----------
+    def crawled_at(self, key, as_of=None):
+        """Time of the newest crawl of key at or before as_of (default: now), or None."""
+        row = self._conn().execute(
+            "SELECT MAX(taken_at) FROM crawls WHERE scope = ? AND taken_at <= ?",
+            (scope_of(key), time.time() if as_of is None else as_of),
+        ).fetchone()
+        return row[0]
+
+    def entries(self, key, as_of=None):
+        """Return (taken_at, {resource_id: (fingerprint, item)}) as of a point in time, or None."""
+        taken_at = self.crawled_at(key, as_of)
+        if taken_at is None:
+            return None
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT v.resource_id, v.source_fingerprint, r.data FROM versions v"
+            " JOIN records r ON r.hash = v.record"
+            " WHERE v.scope = ? AND v.valid_from <= ? AND (v.valid_to IS NULL OR v.valid_to > ?)"
+            " ORDER BY v.rowid",
+            (scope_of(key), taken_at, taken_at),
+        ).fetchall()
+
+        items = [(rid, fp, json.loads(text)) for rid, fp, text in rows]
+        refs = {
+            ref[PART_REF]
+            for _, _, item in items for field in INTERNED_FIELDS
+            for ref in item.get(field) or ()
+        }
+        parts = {}
+        refs = list(refs)
+        for start in range(0, len(refs), SQL_BATCH_SIZE):
+            chunk = refs[start:start + SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            for part, text in conn.execute(f"SELECT hash, data FROM parts WHERE hash IN ({placeholders})", chunk):
+                parts[part] = json.loads(text)
+
+        model = self.models.get(key[-1])
+        result = {}
+        for rid, fp, item in items:
+            for field in INTERNED_FIELDS:
+                if item.get(field):
+                    item[field] = [parts[ref[PART_REF]] for ref in item[field]]
+            result[rid] = (fp, model(**item) if model else item)
+        return taken_at, result
+
+
+def create_snapshot_store():
+    backend = os.getenv("SNAPSHOT_STORE", "none").lower()
+    if backend == "sqlite":
+        return SQLiteSnapshotStore(os.getenv("SNAPSHOT_DB_PATH", "/data/snapshots.db"))
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown SNAPSHOT_STORE: {backend}")
+
+
+snapshot_store = create_snapshot_store()
@@ -0,0 +1,179 @@
+# common/snapshots.py
+# Inventory snapshot cache keyed by (account, region, resource type).
+# Fresh entries are served as-is; stale entries are served immediately while a
+# background refresh runs (stale-while-revalidate).
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pydantic_core import to_json
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL_SECONDS = float(os.getenv("SNAPSHOT_TTL_SECONDS", "300"))
+# Older than this, a snapshot is not worth serving and the request waits for a crawl
+SNAPSHOT_MAX_STALE_SECONDS = float(os.getenv("SNAPSHOT_MAX_STALE_SECONDS", "3600"))
+SNAPSHOT_MAX_ENTRIES = int(os.getenv("SNAPSHOT_MAX_ENTRIES", "256"))
+
+HIT, STALE, MISS, REFRESH = "HIT", "STALE", "MISS", "REFRESH"
+# Rebuilt from the snapshot store for an ?as_of= query
+AS_OF = "AS_OF"
+
+
+class Snapshot:
+    def __init__(self, data, fetched_at=None):
+        self.data = data
+        self.fetched_at = fetched_at or time.time()
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def derived(self, name, builder):
+        """Build a structure over this snapshot's data once and reuse it (indexes etc.)."""
+        with self._derived_lock:
+            if name not in self._derived:
+                self._derived[name] = builder()
+            return self._derived[name]
+
+
+class SnapshotCache:
+    def __init__(self, ttl=SNAPSHOT_TTL_SECONDS, max_stale=SNAPSHOT_MAX_STALE_SECONDS,
+                 max_entries=SNAPSHOT_MAX_ENTRIES, refresh_workers=4):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> Snapshot
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="snapshot-refresh")
+
+    def get(self, key, loader, force=False):
+        """Return (Snapshot, status) for key, calling loader() to (re)crawl when needed."""
+        if not force:
+            with self._lock:
+                found = self._lookup_locked(key, loader)
+            if found is not None:
+                return found
+
+        return self._load(key, loader), REFRESH if force else MISS
+
+    def get_nowait(self, key, loader):
+        """Non-blocking get() for async callers.
+
+        Returns (Snapshot, status) when the key can be served right away, the
+        in-flight Future when another caller is already crawling it, or None
+        when the caller has to crawl.
+        """
+        with self._lock:
+            found = self._lookup_locked(key, loader)
+            if found is not None:
+                return found
+            return self._inflight.get(key)
+
+    def _lookup_locked(self, key, loader):
+        snapshot = self._entries.get(key)
+        if snapshot is None:
+            return None
+        self._entries.move_to_end(key)
+        if snapshot.age <= self.ttl:
+            return snapshot, HIT
+        if snapshot.age <= self.max_stale:
+            self._start_background_refresh_locked(key, loader)
+            return snapshot, STALE
+        return None
+
+    def peek(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, data, fetched_at=None):
+        snapshot = Snapshot(data, fetched_at)
+        with self._lock:
+            self._entries[key] = snapshot
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _load(self, key, loader):
+        # Concurrent requests for the same key share one crawl
+        with self._lock:
+            future, leader = self._claim_locked(key)
+        if not leader:
+            return future.result()
+        return self._run(key, loader, future)
+
+    def _claim_locked(self, key):
+        future = self._inflight.get(key)
+        if future is not None:
+            return future, False
+        future = Future()
+        self._inflight[key] = future
+        return future, True
+
+    def _run(self, key, loader, future):
+        try:
+            snapshot = self.put(key, loader())
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(snapshot)
+            return snapshot
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _start_background_refresh_locked(self, key, loader):
+        future, leader = self._claim_locked(key)
+        if not leader:
+            return
+
+        def refresh():
+            try:
+                self._run(key, loader, future)
+            except Exception as e:
+                logger.error(f"Background refresh of {key} failed: {e}")
+
+        self._refresher.submit(refresh)
+
+
+def cache_headers(response, snapshot, status):
+    response.headers["Age"] = str(int(snapshot.age))
+    response.headers["X-Cache"] = status
+
+
+def snapshot_etag(snapshot, variant, content=None):
+    """Weak ETag for one view (path and query) of a snapshot.
+
+    It is derived from a hash of the snapshot's content, computed once per
+    snapshot, so a re-crawl that found no changes keeps the same ETag.
+    ``content(data)`` picks the part of the data that responses are built from.
+    """
+    digest = snapshot.derived(
+        "content_hash",
+        lambda: hashlib.sha1(to_json(content(snapshot.data) if content else snapshot.data, fallback=str)).hexdigest(),
+    )
+    return 'W/"' + hashlib.sha1(f"{digest} {variant}".encode()).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match comparison; weak, as GET requires."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+
+snapshot_cache = SnapshotCache()
@@ -1,13 +1,44 @@
 # app/main.py
-from fastapi import FastAPI, Query, Body
-from pydantic import BaseModel
-from typing import List, Optional
-import boto3
+from fastapi import FastAPI, Query, Body, Depends, Path, Response, Request
+from pydantic import BaseModel, TypeAdapter
+from typing import Dict, List, Optional, Union
+from contextlib import asynccontextmanager
+import logging
+import os
+import time
+from botocore.exceptions import BotoCoreError, ClientError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from common.aws_clients import get_client
+from common.regions import fan_out, is_multi_region, resolve_regions
+from common.snapshots import cache_headers
+from common.aio import cached_snapshot, json_response, not_modified, run_io, snapshot_data, stored_snapshot, transform
+from common.compression import CompressionMiddleware
+from common.metrics import MetricsMiddleware, metrics_response
+from common.history import fingerprint, inventory_history, merge_diffs
+from common.exports import export_response
+from common.query import PageRequest, SnapshotIndex, run_query
+from common.scheduler import crawl_scheduler
+from common.estate_client import ESTATE_MAX_AGE_SECONDS, estate_client
+
+logger = logging.getLogger(__name__)
+
+# Regions kept warm from startup, before anyone has viewed them
+PREWARM_REGIONS = [r.strip() for r in os.getenv("PREWARM_REGIONS", "").split(",") if r.strip()]
+# Volume resizes and type or encryption changes do not show in describe_instances;
+# re-read each instance's volumes at least this often
+EC2_VOLUME_MAX_AGE_SECONDS = float(os.getenv("EC2_VOLUME_MAX_AGE_SECONDS", "3600"))
+
+@asynccontextmanager
+async def lifespan(app):
+    for region in PREWARM_REGIONS:
+        crawl_scheduler.register((DEFAULT_ACCOUNT, region, "ec2"), instances_loader(region), pinned=True)
+    yield
 
 app = FastAPI(
     title="AWS EC2 Documentation Service",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # ---------- Middleware ----------
@@ -18,9 +49,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Inside MetricsMiddleware, so compression shows up in the request's phases
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
-# ---------- In-memory cache ----------
-last_instances = []
+# ---------- Snapshot cache ----------
+# This service crawls with the container's own credentials, so every snapshot
+# belongs to the same account.
+DEFAULT_ACCOUNT = "default"
 
 # ---------- Models ----------
 class SecurityGroupModel(BaseModel):
@@ -32,6 +68,7 @@ class Volume(BaseModel):
     size_gb: Optional[int]
     type: Optional[str]
     kms_key_id: Optional[str]
+    error: Optional[str] = None
 
 class TagModel(BaseModel):
     Key: str
@@ -43,6 +80,7 @@ class EC2InstanceModel(BaseModel):
     instance_type: str
     os: Optional[str] = None
     state: str
+    region: Optional[str] = None
     vpc_id: Optional[str] = None
     az: str
     subnet_id: Optional[str] = None
@@ -55,133 +93,420 @@ class EC2InstanceModel(BaseModel):
     root_volume_id: Optional[str] = None
     root_volume_type: Optional[str] = None
     root_volume_size: Optional[int] = None
+    root_volume_error: Optional[str] = None
     data_volumes: List[Volume] = []
     tags: Optional[List[TagModel]] = []
 
+class RegionStatusModel(BaseModel):
+    region: str
+    elapsed_ms: float
+    error: Optional[str] = None
+    count: int = 0
+
+class MultiRegionInstancesModel(BaseModel):
+    instances: List[EC2InstanceModel]
+    regions: Dict[str, RegionStatusModel]
+
+class InstanceDiffModel(BaseModel):
+    since: float
+    base: Optional[float] = None
+    current: Optional[float] = None
+    truncated: bool = False
+    added: List[EC2InstanceModel] = []
+    modified: List[EC2InstanceModel] = []
+    removed: List[str] = []
+
+class InstanceFilterRequest(BaseModel):
+    vpc_id: Optional[str] = None
+    subnet_id: Optional[str] = None
+    state: Optional[str] = None
+    instance_type: Optional[str] = None
+    az: Optional[str] = None
+    instance_region: Optional[str] = None  # narrows a multi-region snapshot
+
 class ExportRequest(BaseModel):
     region: str = "ap-northeast-2"
     account: Optional[str] = None
+    compress: bool = False  # gzip the file
+
+# ---------- Volume index ----------
+# describe_volumes accepts at most 200 values per filter, so volume IDs are
+# looked up in chunks of that size and each chunk is walked with the paginator.
+VOLUME_BATCH_SIZE = 200
+
+def build_volume_index(ec2, volume_ids):
+    """Return ({volume_id: volume}, {volume_id: error}) for the given IDs."""
+    ids = list(dict.fromkeys(volume_ids))
+    index = {}
+    errors = {}
+    paginator = ec2.get_paginator("describe_volumes")
+
+    for start in range(0, len(ids), VOLUME_BATCH_SIZE):
+        chunk = ids[start:start + VOLUME_BATCH_SIZE]
+        try:
+            for page in paginator.paginate(Filters=[{"Name": "volume-id", "Values": chunk}]):
+                for vol in page.get("Volumes", []):
+                    index[vol["VolumeId"]] = vol
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Error describing volumes {chunk[0]}..{chunk[-1]}: {e}")
+            for vol_id in chunk:
+                errors.setdefault(vol_id, f"Failed to describe volume: {e}")
+
+    for vol_id in ids:
+        if vol_id not in index and vol_id not in errors:
+            errors[vol_id] = "Volume not found"
+    return index, errors
+
+def volume_info(vol_id, volume_index, volume_errors):
+    vol = volume_index.get(vol_id)
+    if vol is None:
+        return {
+            "volume_id": vol_id,
+            "size_gb": None,
+            "type": None,
+            "kms_key_id": None,
+            "error": volume_errors.get(vol_id, "Volume not found"),
+        }
+    return {
+        "volume_id": vol_id,
+        "size_gb": vol.get("Size"),
+        "type": vol.get("VolumeType"),
+        "kms_key_id": vol.get("KmsKeyId"),
+        "error": None,
+    }
+
+def instance_volume_ids(inst):
+    for bd in inst.get("BlockDeviceMappings", []):
+        vol_id = bd.get("Ebs", {}).get("VolumeId")
+        if vol_id:
+            yield vol_id
+
+# ---------- Instance collection ----------
+def instance_to_dict(inst, volume_index, volume_errors, region=None):
+    # Name tag
+    name_tag = None
+    for t in inst.get("Tags", []):
+        if t["Key"] == "Name":
+            name_tag = t["Value"]
+            break
+
+    # Security groups
+    sgs = [
+        {
+            "group_id": sg.get("GroupId"),
+            "group_name": sg.get("GroupName")
+        }
+        for sg in inst.get("SecurityGroups", [])
+    ]
+
+    # Volumes
+    root_volume = {}
+    data_volumes = []
+    for bd in inst.get("BlockDeviceMappings", []):
+        vol_id = bd.get("Ebs", {}).get("VolumeId")
+        if not vol_id:
+            continue
+        vol_info = volume_info(vol_id, volume_index, volume_errors)
+
+        if bd.get("DeviceName") == inst.get("RootDeviceName"):
+            root_volume = vol_info
+        else:
+            data_volumes.append(vol_info)
+
+    os_info = inst.get("PlatformDetails")
+
+    return {
+        "instance_id": inst.get("InstanceId"),
+        "name": name_tag,
+        "instance_type": inst.get("InstanceType"),
+        "os": os_info,
+        "state": inst.get("State", {}).get("Name"),
+        "region": region,
+        "vpc_id": inst.get("VpcId"),
+        "az": inst.get("Placement", {}).get("AvailabilityZone"),
+        "subnet_id": inst.get("SubnetId"),
+        "private_ip": inst.get("PrivateIpAddress"),
+        "public_ip": inst.get("PublicIpAddress"),
+        "security_groups": sgs,
+        "key_pair": inst.get("KeyName"),
+        "ami_id": inst.get("ImageId"),
+        "kms_key_id": inst.get("KmsKeyId"),
+        "root_volume_id": root_volume.get("volume_id"),
+        "root_volume_type": root_volume.get("type"),
+        "root_volume_size": root_volume.get("size_gb"),
+        "root_volume_error": root_volume.get("error"),
+        "data_volumes": data_volumes,
+        "tags": [{"Key": t["Key"], "Value": t["Value"]} for t in inst.get("Tags", [])]
+    }
+
+# (region, instance_id) -> (describe_instances fingerprint, time its volumes were
+# read). Kept out of the history so a re-read that finds nothing new is not
+# reported as a change; after a restart every instance is enriched once.
+instance_enrichments = {}
+
+def has_volume_error(item):
+    return bool(item.get("root_volume_error")) or any(vol.get("error") for vol in item.get("data_volumes", []))
+
+def enrich_instances(raw_instances, previous, region, lookup_volumes):
+    """Return [(instance_id, fingerprint, item)] for one batch of raw instances.
+
+    An instance reuses its item in ``previous`` while its raw record is
+    unchanged, its volumes were read less than EC2_VOLUME_MAX_AGE_SECONDS ago
+    and none of them failed; ``lookup_volumes(ids)`` is only asked about the
+    rest. The fingerprint covers the enriched item, so /diff sees volume changes.
+    """
+    now = time.time()
+    raw_fingerprints = [fingerprint(inst) for inst in raw_instances]
+
+    def reusable(inst, raw_fp):
+        instance_id = inst.get("InstanceId")
+        enrichment = instance_enrichments.get((region, instance_id))
+        return (
+            instance_id in previous
+            and enrichment is not None
+            and enrichment[0] == raw_fp
+            and now - enrichment[1] < EC2_VOLUME_MAX_AGE_SECONDS
+            and not has_volume_error(previous[instance_id][1])
+        )
+
+    stale = [not reusable(inst, raw_fp) for inst, raw_fp in zip(raw_instances, raw_fingerprints)]
+    volume_index, volume_errors = lookup_volumes(
+        [vol_id for inst, refresh in zip(raw_instances, stale) if refresh for vol_id in instance_volume_ids(inst)]
+    )
+
+    entries = []
+    for inst, raw_fp, refresh in zip(raw_instances, raw_fingerprints, stale):
+        instance_id = inst.get("InstanceId")
+        if not refresh:
+            entries.append((instance_id, *previous[instance_id]))
+            continue
+        item = instance_to_dict(inst, volume_index, volume_errors, region)
+        instance_enrichments[(region, instance_id)] = (raw_fp, now)
+        entries.append((instance_id, fingerprint(item), item))
+    return entries
+
+def iter_instance_pages(ec2, previous=None):
+    """Walk the describe_instances paginator, yielding one enriched page at a time.
+
+    Each page is a list of (instance_id, fingerprint, item); see enrich_instances.
+    """
+    previous = previous or {}
+    region = ec2.meta.region_name
+    paginator = ec2.get_paginator("describe_instances")
+    for page in paginator.paginate():
+        raw_instances = [
+            inst
+            for reservation in page.get("Reservations", [])
+            for inst in reservation.get("Instances", [])
+        ]
+        # One batched volume lookup per page instead of one call per block device
+        yield enrich_instances(raw_instances, previous, region, lambda ids: build_volume_index(ec2, ids))
+
+def estate_instance_pages(region, previous=None, full=False):
+    """iter_instance_pages() over the aggregator's shared instances + volumes crawl."""
+    max_age = 0 if full else ESTATE_MAX_AGE_SECONDS
+    estate = estate_client.fetch(region, ["instances", "volumes"], max_age=max_age)["collections"]
+    volume_index = {vol["VolumeId"]: vol for vol in estate["volumes"]}
+    yield enrich_instances(estate["instances"], previous or {}, region, lambda ids: (volume_index, {}))
+
+def iter_instances(ec2):
+    for page in iter_instance_pages(ec2):
+        for _, _, item in page:
+            yield item
+
+def ndjson_lines(instances):
+    for inst in instances:
+        yield EC2InstanceModel(**inst).model_dump_json() + "\n"
+
+def crawl_instances(region, full=False):
+    # Incremental unless full: unchanged instances keep their previous enrichment
+    key = (DEFAULT_ACCOUNT, region, "ec2")
+    previous = {} if full else inventory_history.latest(key)
+    if estate_client is not None:
+        pages = estate_instance_pages(region, previous, full)
+    else:
+        pages = iter_instance_pages(get_client("ec2", region), previous)
+    entries = {}
+    for page in pages:
+        for instance_id, fp, item in page:
+            entries[instance_id] = (fp, item)
+    inventory_history.record(key, entries)
+    # list() copies the keys in one step; other regions may be crawling in parallel
+    for gone in [k for k in list(instance_enrichments) if k[0] == region and k[1] not in entries]:
+        instance_enrichments.pop(gone, None)
+    return [item for _, item in entries.values()]
+
+def list_instances_multi_region(regions, full=False):
+    results, status = fan_out(regions, lambda r: crawl_instances(r, full))
+    instances = []
+    for region, region_instances in results.items():
+        if region_instances is None:
+            logger.error(f"Failed to list instances in {region}: {status[region]['error']}")
+            continue
+        status[region]["count"] = len(region_instances)
+        instances.extend(region_instances)
+    return {"instances": instances, "regions": status}
+
+def stream_instances(regions):
+    # Regions are streamed one after another to keep memory bounded by one page
+    for region in regions:
+        yield from ndjson_lines(iter_instances(get_client("ec2", region)))
+
+def instances_loader(region, full=False):
+    def crawl():
+        if is_multi_region(region):
+            data = list_instances_multi_region(resolve_regions(region), full=full)
+        else:
+            data = crawl_instances(region, full=full)
+        return snapshot_data(INSTANCES_ADAPTER, data)
+    return crawl
+
+def stored_instances(region, as_of=None):
+    """(data, crawled_at) rebuilt from the last crawl, or the one at as_of; None if missing.
+
+    A multi-region restore needs every region; as_of reports missing ones instead.
+    """
+    regions = resolve_regions(region) if is_multi_region(region) else [region]
+    found = {r: inventory_history.stored((DEFAULT_ACCOUNT, r, "ec2"), as_of) for r in regions}
+    available = {r: stored for r, stored in found.items() if stored is not None}
+    if not available or (as_of is None and len(available) < len(regions)):
+        return None
+    crawled_at = min(taken_at for taken_at, _ in available.values())
+    if not is_multi_region(region):
+        return snapshot_data(INSTANCES_ADAPTER, available[region][1]), crawled_at
+
+    status = {
+        r: {"region": r, "elapsed_ms": 0.0, "count": len(available[r][1]) if r in available else 0,
+            "error": None if r in available else "No stored crawl"}
+        for r in regions
+    }
+    instances = [inst for _, items in available.values() for inst in items]
+    return snapshot_data(INSTANCES_ADAPTER, {"instances": instances, "regions": status}), crawled_at
+
+async def cached_instances(region, refresh=False):
+    key = (DEFAULT_ACCOUNT, region, "ec2")
+    # Every view keeps the target on the background re-crawl schedule
+    crawl_scheduler.register(key, instances_loader(region))
+    return await cached_snapshot(
+        key, instances_loader(region, full=refresh), force=refresh, restore=lambda: stored_instances(region)
+    )
+
+# ---------- Query ----------
+INSTANCE_INDEX_FIELDS = ["vpc_id", "subnet_id", "state", "instance_type", "az", "region"]
+INSTANCE_SORT_FIELDS = [
+    "instance_id", "name", "instance_type", "state", "region", "az",
+    "vpc_id", "subnet_id", "private_ip", "public_ip", "root_volume_size",
+]
+
+def query_instances(snapshot, filters, page, response):
+    data = snapshot.data
+    items = data["instances"] if isinstance(data, dict) else data
+    index = snapshot.derived(
+        "instance_index", lambda: SnapshotIndex(items, INSTANCE_INDEX_FIELDS, "instance_id")
+    )
+    criteria = filters.model_dump()
+    criteria["region"] = criteria.pop("instance_region")
+    selected = run_query(index, criteria, page, INSTANCE_SORT_FIELDS, response)
+    return {**data, "instances": selected} if isinstance(data, dict) else selected
 
 # ---------- Endpoints ----------
+INSTANCES_ADAPTER = TypeAdapter(Union[List[EC2InstanceModel], MultiRegionInstancesModel])
+DIFF_ADAPTER = TypeAdapter(InstanceDiffModel)
+
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok", "service": "ec2-listing"}
 
-@app.get("/", response_model=List[EC2InstanceModel])
-def list_instances(region: str = Query("ap-northeast-2")):
-    ec2 = boto3.client("ec2", region_name=region)
-    resp = ec2.describe_instances()
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
 
-    instances = []
-    for reservation in resp.get("Reservations", []):
-        for inst in reservation.get("Instances", []):
-            # Name tag
-            name_tag = None
-            for t in inst.get("Tags", []):
-                if t["Key"] == "Name":
-                    name_tag = t["Value"]
-                    break
-
-            # Security groups
-            sgs = [
-                {
-                    "group_id": sg.get("GroupId"),
-                    "group_name": sg.get("GroupName")
-                }
-                for sg in inst.get("SecurityGroups", [])
+@app.get("/", response_model=Union[List[EC2InstanceModel], MultiRegionInstancesModel])
+async def list_instances(
+    request: Request,
+    response: Response,
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    refresh: bool = Query(False, description="Bypass the snapshot cache and re-crawl everything"),
+    as_of: Optional[float] = Query(None, description="Epoch seconds; serve the inventory as it was then"),
+    filters: InstanceFilterRequest = Depends(),
+    page: PageRequest = Depends(),
+):
+    # Streaming mode: each instance is written as soon as its page is enriched,
+    # so memory is bounded by one describe_instances page. It always crawls live.
+    if fmt == "ndjson":
+        regions = await run_io(resolve_regions, region) if is_multi_region(region) else [region]
+        return StreamingResponse(stream_instances(regions), media_type="application/x-ndjson")
+
+    if as_of is not None:
+        snapshot, status = await stored_snapshot(lambda t: stored_instances(region, t), as_of)
+    else:
+        snapshot, status = await cached_instances(region, refresh)
+    cache_headers(response, snapshot, status)
+    unchanged = await not_modified(request, response, snapshot)
+    if unchanged is not None:
+        return unchanged
+    data = snapshot.data
+    if page.requested() or any(v is not None for v in filters.model_dump().values()):
+        data = await transform(query_instances, snapshot, filters, page, response)
+    return await json_response(response, INSTANCES_ADAPTER, data, validated=True)
+
+@app.get("/diff", response_model=InstanceDiffModel)
+async def diff_instances(
+    response: Response,
+    since: float = Query(..., description="Epoch seconds of the snapshot the client already has"),
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+):
+    snapshot, status = await cached_instances(region)
+    cache_headers(response, snapshot, status)
+
+    def diff():
+        regions = resolve_regions(region) if is_multi_region(region) else [region]
+        return merge_diffs([inventory_history.diff((DEFAULT_ACCOUNT, r, "ec2"), since) for r in regions], since)
+
+    return await json_response(response, DIFF_ADAPTER, await transform(diff))
+
+EXPORT_COLUMNS = [
+    "instance_id", "name", "instance_type", "state", "region", "az", "vpc_id", "subnet_id",
+    "private_ip", "public_ip", "security_groups", "key_pair", "ami_id",
+    "root_volume_id", "root_volume_type", "root_volume_size", "data_volumes",
+]
+
+def export_rows(regions):
+    # Rows are produced page by page from the live paginator, never the whole fleet
+    for region in regions:
+        for inst in iter_instances(get_client("ec2", region)):
+            yield [
+                inst["instance_id"],
+                inst["name"] or "",
+                inst["instance_type"],
+                inst["state"],
+                inst["region"],
+                inst["az"],
+                inst["vpc_id"] or "",
+                inst["subnet_id"] or "",
+                inst["private_ip"] or "",
+                inst["public_ip"] or "",
+                ", ".join(sg["group_name"] or sg["group_id"] for sg in inst["security_groups"]),
+                inst["key_pair"] or "",
+                inst["ami_id"] or "",
+                inst["root_volume_id"] or "",
+                inst["root_volume_type"] or "",
+                inst["root_volume_size"] if inst["root_volume_size"] is not None else "",
+                ", ".join(v["volume_id"] for v in inst["data_volumes"]),
             ]
 
-            # Volumes
-
-            root_volume = {}
-            data_volumes = []
-            try:
-                for bd in inst.get("BlockDeviceMappings", []):
-                    vol_id = bd.get("Ebs", {}).get("VolumeId")
-                    if not vol_id:
-                        continue
-                    vol_resp = ec2.describe_volumes(VolumeIds=[vol_id])
-                    vol = vol_resp["Volumes"][0]
-                    vol_info = {
-                        "volume_id": vol_id,
-                        "size_gb": vol.get("Size"),
-                        "type": vol.get("VolumeType"),
-                        "kms_key_id": vol.get("KmsKeyId"),
-                    }
-
-                    if bd.get("DeviceName") == inst.get("RootDeviceName"):
-                        root_volume = vol_info
-                    else:
-                        data_volumes.append(vol_info)
-            except Exception:
-                pass
-
-            os_info = inst.get("PlatformDetails")
-
-            instances.append({
-                "instance_id": inst.get("InstanceId"),
-                "name": name_tag,
-                "instance_type": inst.get("InstanceType"),
-                "os": os_info,
-                "state": inst.get("State", {}).get("Name"),
-                "vpc_id": inst.get("VpcId"),
-                "az": inst.get("Placement", {}).get("AvailabilityZone"),
-                "subnet_id": inst.get("SubnetId"),
-                "private_ip": inst.get("PrivateIpAddress"),
-                "public_ip": inst.get("PublicIpAddress"),
-                "security_groups": sgs,
-                "key_pair": inst.get("KeyName"),
-                "ami_id": inst.get("ImageId"),
-                "kms_key_id": inst.get("KmsKeyId"),
-                "root_volume_id": root_volume.get("volume_id"),
-                "root_volume_type": root_volume.get("type"),
-                "root_volume_size": root_volume.get("size_gb"),
-                "data_volumes": data_volumes,
-                "tags": [{"Key": t["Key"], "Value": t["Value"]} for t in inst.get("Tags", [])]             
-            })
-
-    global last_instances
-    last_instances = instances
-    return instances
-
-# @app.post("/instances/export/csv")
-# def export_instances_csv(req: ExportRequest = Body(...)):
-#     region = req.region
-#     ec2 = boto3.client("ec2", region_name=region)
-#     resp = ec2.describe_instances()
-
-#     output = io.StringIO()
-#     writer = csv.writer(output)
-#     writer.writerow([
-#         "instance_id", "name", "type", "state", "private_ip", "public_ip", "az", "launch_time", "security_groups"
-#     ])
-
-#     for reservation in resp.get("Reservations", []):
-#         for inst in reservation.get("Instances", []):
-#             name_tag = None
-#             for t in inst.get("Tags", []):
-#                 if t["Key"] == "Name":
-#                     name_tag = t["Value"]
-#                     break
-
-#             sgs = ", ".join([sg["GroupName"] for sg in inst.get("SecurityGroups", [])])
-
-#             writer.writerow([
-#                 inst.get("InstanceId"),
-#                 name_tag or "",
-#                 inst.get("InstanceType"),
-#                 inst.get("State", {}).get("Name"),
-#                 inst.get("PrivateIpAddress", ""),
-#                 inst.get("PublicIpAddress", ""),
-#                 inst.get("Placement", {}).get("AvailabilityZone"),
-#                 inst.get("LaunchTime").isoformat() if inst.get("LaunchTime") else "",
-#                 sgs
-#             ])
-
-#     output.seek(0)
-#     filename = f"ec2_instances_{region}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-#     return StreamingResponse(
-#         output,
-#         media_type="text/csv",
-#         headers={"Content-Disposition": f"attachment; filename={filename}"}
-#     )
+@app.post("/instances/export/{fmt}")
+async def export_instances(
+    fmt: str = Path(..., pattern="^(csv|xlsx)$"),
+    req: ExportRequest = Body(...),
+):
+    # Rows are produced by the streaming body, which Starlette iterates off the loop
+    regions = await run_io(resolve_regions, req.region) if is_multi_region(req.region) else [req.region]
+    return export_response(
+        fmt,
+        EXPORT_COLUMNS,
+        export_rows(regions),
+        f"ec2_instances_{req.region.replace(',', '_')}",
+        compress=req.compress,
+    )
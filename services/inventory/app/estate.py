@@ -0,0 +1,95 @@
+# app/estate.py
+# The shared crawl: each AWS collection of an (account, region) is fetched with
+# one paginated describe_* sweep and cached on its own, so the EC2, security
+# group and network views all project from the same pass.
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from common.aws_clients import get_client
+from common.snapshots import snapshot_cache
+
+logger = logging.getLogger(__name__)
+
+# A collection fetched less than this long ago is reused instead of re-crawled
+ESTATE_MAX_AGE_SECONDS = float(os.getenv("ESTATE_MAX_AGE_SECONDS", "60"))
+
+# collection -> (paginated operation, result key)
+COLLECTIONS = {
+    "instances": ("describe_instances", "Reservations"),
+    "volumes": ("describe_volumes", "Volumes"),
+    "security_groups": ("describe_security_groups", "SecurityGroups"),
+    "vpcs": ("describe_vpcs", "Vpcs"),
+    "subnets": ("describe_subnets", "Subnets"),
+    "nat_gateways": ("describe_nat_gateways", "NatGateways"),
+    "route_tables": ("describe_route_tables", "RouteTables"),
+}
+
+
+def fetch_collection(ec2, name):
+    operation, result_key = COLLECTIONS[name]
+    items = [item for page in ec2.get_paginator(operation).paginate() for item in page.get(result_key, [])]
+    if name == "instances":
+        # Reservations only group instances by launch request; nobody downstream needs them
+        return [inst for reservation in items for inst in reservation.get("Instances", [])]
+    return items
+
+
+def collection_snapshot(scope, region, name, credentials, max_age):
+    key = (scope, region, name)
+    snapshot = snapshot_cache.peek(key)
+    if snapshot is not None and snapshot.age <= max_age:
+        return snapshot
+    # Concurrent requests for the same collection share this crawl
+    snapshot, _ = snapshot_cache.get(
+        key, lambda: fetch_collection(get_client("ec2", region, credentials), name), force=True
+    )
+    return snapshot
+
+
+def join(collections):
+    """Reverse links between the fetched collections (instances <-> SGs <-> subnets <-> VPCs <-> volumes)."""
+    links = {}
+    instances = collections.get("instances")
+    if instances is not None:
+        sg_instances, subnet_instances, volume_instances = {}, {}, {}
+        for inst in instances:
+            instance_id = inst.get("InstanceId")
+            for sg in inst.get("SecurityGroups", []):
+                sg_instances.setdefault(sg["GroupId"], []).append(instance_id)
+            if inst.get("SubnetId"):
+                subnet_instances.setdefault(inst["SubnetId"], []).append(instance_id)
+            for bd in inst.get("BlockDeviceMappings", []):
+                vol_id = bd.get("Ebs", {}).get("VolumeId")
+                if vol_id:
+                    volume_instances[vol_id] = instance_id
+        links.update(
+            security_group_instances=sg_instances,
+            subnet_instances=subnet_instances,
+            volume_instances=volume_instances,
+        )
+    subnets = collections.get("subnets")
+    if subnets is not None:
+        vpc_subnets = {}
+        for subnet in subnets:
+            vpc_subnets.setdefault(subnet["VpcId"], []).append(subnet["SubnetId"])
+        links["vpc_subnets"] = vpc_subnets
+    return links
+
+
+def collect_estate(scope, region, names, credentials=None, max_age=ESTATE_MAX_AGE_SECONDS):
+    # Collections are independent describe_* sweeps, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="estate") as pool:
+        futures = {
+            name: pool.submit(collection_snapshot, scope, region, name, credentials, max_age) for name in names
+        }
+        snapshots = {name: future.result() for name, future in futures.items()}
+
+    collections = {name: snapshot.data for name, snapshot in snapshots.items()}
+    return {
+        "scope": scope,
+        "region": region,
+        "fetched_at": {name: snapshot.fetched_at for name, snapshot in snapshots.items()},
+        "collections": collections,
+        "links": join(collections),
+    }
@@ -0,0 +1,83 @@
+# app/main.py
+from fastapi import FastAPI, HTTPException, Header, Query, Response
+from fastapi.middleware.cors import CORSMiddleware
+from botocore.exceptions import BotoCoreError, ClientError
+import logging
+import os
+import requests
+from pydantic_core import to_json
+from common.aio import run_crawl, run_io
+from common.metrics import MetricsMiddleware, metrics_response, phase
+from common.session_client import SessionClient, session_scope
+from app.estate import COLLECTIONS, ESTATE_MAX_AGE_SECONDS, collect_estate
+
+logger = logging.getLogger(__name__)
+
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://backend-home:8000")
+
+app = FastAPI(
+    title="AWS Inventory Aggregator Service",
+    version="1.0.0"
+)
+
+# ---------- Middleware ----------
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(MetricsMiddleware)
+
+# Requests without a session crawl with the container's own credentials
+DEFAULT_ACCOUNT = "default"
+
+session_client = SessionClient(AUTH_SERVICE_URL, ttl=float(os.getenv("SESSION_CACHE_TTL", "60")))
+
+
+async def resolve_session(x_session_id):
+    try:
+        with phase("session"):
+            return await run_io(session_client.resolve, x_session_id)
+    except requests.exceptions.RequestException as e:
+        raise HTTPException(status_code=401, detail=f"Failed to fetch session: {e}")
+
+
+# ---------- Endpoints ----------
+@app.get("/health")
+async def health_check():
+    return {"status": "ok", "service": "inventory"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+
+@app.get("/estate")
+async def get_estate(
+    region: str = Query(..., description="A single region; callers fan out themselves"),
+    collections: str = Query(",".join(COLLECTIONS), description="Comma-separated collections to return"),
+    max_age: float = Query(ESTATE_MAX_AGE_SECONDS, ge=0, description="Reuse collections fetched this recently"),
+    x_session_id: str = Header(None)):
+    """Raw describe_* collections of one (account, region) plus the links between them."""
+    names = list(dict.fromkeys(c.strip() for c in collections.split(",") if c.strip()))
+    unknown = [name for name in names if name not in COLLECTIONS]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"Unknown collections {unknown}; expected some of {list(COLLECTIONS)}")
+
+    session = await resolve_session(x_session_id) if x_session_id else None
+    scope = session_scope(session) if session else DEFAULT_ACCOUNT
+
+    try:
+        with phase("fetch"):
+            estate = await run_crawl(collect_estate, scope, region, names, session, max_age)
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Failed to crawl {names} in {region}: {e}")
+        raise HTTPException(status_code=502, detail=f"Failed to crawl {region}: {e}")
+
+    # Raw boto3 shapes carry datetimes; pydantic_core serializes them as ISO 8601
+    with phase("serialize"):
+        body = await run_io(to_json, estate)
+    return Response(content=body, media_type="application/json")
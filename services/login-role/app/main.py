@@ -1,10 +1,16 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict
+from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 import boto3
-import uuid
 import datetime
+import os
+import threading
+import time
+import uuid
+from common.metrics import MetricsMiddleware, install_botocore_hooks, metrics_response
+from app.sessions import create_session_store, expires_at
 
 app = FastAPI(title="Auth Service", version="1.0.0")
 
@@ -16,10 +22,25 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# Session backend is picked by SESSION_BACKEND (memory | sqlite); entries are
+# evicted once their STS credentials expire.
+session_store = create_session_store()
 
-# In-memory session store for MVP
-# In prod → move to Redis or DynamoDB
-session_store: Dict[str, dict] = {}
+# STS clients come from an instrumented session; Session.client() is not thread-safe
+aws_session = boto3.session.Session()
+install_botocore_hooks(aws_session)
+aws_session_lock = threading.Lock()
+sts_clients = {}  # region -> STS client
+
+# Batch assume-role: roles assumed in parallel, and a role's session is reused
+# until shortly before its credentials expire
+ASSUME_ROLE_CONCURRENCY = int(os.getenv("ASSUME_ROLE_CONCURRENCY", "8"))
+ROLE_SESSION_REUSE_SKEW_SECONDS = float(os.getenv("ROLE_SESSION_REUSE_SKEW_SECONDS", "300"))
+MAX_GROUP_SIZE = int(os.getenv("MAX_GROUP_SIZE", "500"))
+role_sessions = {}  # (role_arn, region) -> session_id
+role_sessions_lock = threading.Lock()
 
 # ---------- Models ----------
 class AssumeRoleRequest(BaseModel):
@@ -30,40 +51,158 @@ class AssumeRoleResponse(BaseModel):
     session_id: str
     expiration: str
 
-# ---------- Endpoints ----------
-@app.get("/health")
-def health_check():
-    return {"status": "ok", "service": "auth"}
+class BatchAssumeRoleRequest(BaseModel):
+    region: str
+    # Either full role ARNs, or account IDs plus the role name to assume in each
+    role_arns: List[str] = []
+    account_ids: List[str] = []
+    role_name: Optional[str] = None
+    partition: str = "aws"
 
-@app.post("/", response_model=AssumeRoleResponse)
-def assume_role(req: AssumeRoleRequest):
-    try:
-        sts = boto3.client("sts", region_name=req.region)
-        resp = sts.assume_role(
-            RoleArn=req.role_arn,
-            RoleSessionName=f"aws-doc-app-{uuid.uuid4()}"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to assume role: {e}")
+class GroupMemberModel(BaseModel):
+    role_arn: str
+    account_id: Optional[str] = None
+    session_id: Optional[str] = None
+    expiration: Optional[str] = None
+    error: Optional[str] = None
+
+class SessionGroupResponse(BaseModel):
+    group_id: str
+    expiration: str
+    members: List[GroupMemberModel]
+
+class SessionGroupMemberModel(GroupMemberModel):
+    session: Optional[dict] = None
 
+class SessionGroupModel(BaseModel):
+    group_id: str
+    region: str
+    expiration: str
+    members: List[SessionGroupMemberModel] = Field(default_factory=list)
+
+# ---------- Helpers ----------
+def account_of(role_arn):
+    return role_arn.split(":")[4] if role_arn.count(":") >= 5 else None
+
+def sts_client(region):
+    with aws_session_lock:
+        client = sts_clients.get(region)
+        if client is None:
+            client = sts_clients[region] = aws_session.client("sts", region_name=region)
+        return client
+
+def assume(role_arn, region):
+    """Assume role_arn and store the credentials; returns (session_id, session)."""
+    resp = sts_client(region).assume_role(
+        RoleArn=role_arn,
+        RoleSessionName=f"aws-doc-app-{uuid.uuid4()}"
+    )
     creds = resp["Credentials"]
     session_id = str(uuid.uuid4())
-    session_store[session_id] = {
+    session = {
         "AccessKeyId": creds["AccessKeyId"],
         "SecretAccessKey": creds["SecretAccessKey"],
         "SessionToken": creds["SessionToken"],
         "Expiration": creds["Expiration"].isoformat(),
-        "Region": req.region
+        "Region": region,
+        "AccountId": account_of(role_arn),
+        "RoleArn": role_arn
     }
+    session_store.put(session_id, session)
+    return session_id, session
+
+def reuse_or_assume(role_arn, region):
+    with role_sessions_lock:
+        session_id = role_sessions.get((role_arn, region))
+    if session_id is not None:
+        session = session_store.get(session_id)
+        if session and expires_at(session) - ROLE_SESSION_REUSE_SKEW_SECONDS > time.time():
+            return session_id, session
+
+    session_id, session = assume(role_arn, region)
+    with role_sessions_lock:
+        role_sessions[(role_arn, region)] = session_id
+    return session_id, session
+
+def assume_member(role_arn, region):
+    member = {"role_arn": role_arn, "account_id": account_of(role_arn),
+              "session_id": None, "expiration": None, "error": None}
+    try:
+        member["session_id"], session = reuse_or_assume(role_arn, region)
+        member["expiration"] = session["Expiration"]
+    except Exception as e:
+        member["error"] = f"Failed to assume role: {e}"
+    return member
+
+# ---------- Endpoints ----------
+@app.get("/health")
+async def health_check():
+    return {"status": "ok", "service": "auth"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+@app.post("/", response_model=AssumeRoleResponse)
+def assume_role(req: AssumeRoleRequest):
+    try:
+        session_id, session = assume(req.role_arn, req.region)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to assume role: {e}")
 
     return AssumeRoleResponse(
         session_id=session_id,
-        expiration=creds["Expiration"].isoformat()
+        expiration=session["Expiration"]
     )
 
+@app.post("/batch", response_model=SessionGroupResponse)
+def assume_roles(req: BatchAssumeRoleRequest):
+    if req.account_ids and not req.role_name:
+        raise HTTPException(status_code=400, detail="role_name is required with account_ids")
+    role_arns = list(dict.fromkeys(
+        req.role_arns + [f"arn:{req.partition}:iam::{account}:role/{req.role_name}" for account in req.account_ids]
+    ))
+    if not role_arns:
+        raise HTTPException(status_code=400, detail="Provide role_arns or account_ids")
+    if len(role_arns) > MAX_GROUP_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_GROUP_SIZE} roles per group")
+
+    with ThreadPoolExecutor(max_workers=min(ASSUME_ROLE_CONCURRENCY, len(role_arns)),
+                            thread_name_prefix="assume-role") as pool:
+        members = list(pool.map(lambda arn: assume_member(arn, req.region), role_arns))
+
+    assumed = [m for m in members if m["session_id"]]
+    if not assumed:
+        raise HTTPException(status_code=400, detail={"message": "No role could be assumed", "members": members})
+
+    # The group lives as long as its longest-lived member; members expire on their own
+    expiration = max(
+        (m["expiration"] for m in assumed),
+        key=lambda value: datetime.datetime.fromisoformat(value).timestamp(),
+    )
+    group_id = str(uuid.uuid4())
+    session_store.put(group_id, {"GroupMembers": members, "Region": req.region, "Expiration": expiration})
+    return SessionGroupResponse(group_id=group_id, expiration=expiration, members=members)
+
 @app.get("/session/{session_id}")
 def get_session(session_id: str):
     session = session_store.get(session_id)
-    if not session:
+    if not session or "GroupMembers" in session:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
\ No newline at end of file
+    return session
+
+@app.get("/group/{group_id}", response_model=SessionGroupModel)
+def get_session_group(group_id: str):
+    """The group's members with their live credentials, for the inventory services."""
+    group = session_store.get(group_id)
+    if not group or "GroupMembers" not in group:
+        raise HTTPException(status_code=404, detail="Session group not found")
+
+    members = []
+    for member in group["GroupMembers"]:
+        session = session_store.get(member["session_id"]) if member["session_id"] else None
+        error = member["error"] or (None if session else "Session expired")
+        members.append({**member, "session": session, "error": error})
+    return SessionGroupModel(
+        group_id=group_id, region=group["Region"], expiration=group["Expiration"], members=members
+    )
\ No newline at end of file
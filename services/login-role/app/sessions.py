@@ -0,0 +1,161 @@
+# app/sessions.py
+# Session backends for assumed-role credentials.
+# Every entry expires at the STS "Expiration" timestamp and is evicted after that.
+import datetime
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+
+def expires_at(session: dict) -> float:
+    """Epoch seconds at which the session's STS credentials expire."""
+    return datetime.datetime.fromisoformat(session["Expiration"]).timestamp()
+
+
+class SessionStore(ABC):
+    """Backend interface; a backend missing any method fails when it is created."""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[dict]:
+        """The session, or None if it is unknown or expired."""
+
+    @abstractmethod
+    def put(self, session_id: str, session: dict) -> None:
+        """Store a session until its STS Expiration."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Forget a session; unknown ids are ignored."""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Drop expired sessions and return how many were dropped."""
+
+
+# ---------- In-memory backend ----------
+class MemorySessionStore(SessionStore):
+    """Process-local store bounded by max_size (least recently used goes first)."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (expires_at, session)
+        self._expiry_heap = []  # (expires_at, id), may hold stale entries
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def put(self, session_id, session):
+        expiry = expires_at(session)
+        with self._lock:
+            self._purge_locked(time.time())
+            self._sessions[session_id] = (expiry, session)
+            self._sessions.move_to_end(session_id)
+            heapq.heappush(self._expiry_heap, (expiry, session_id))
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+            # Entries for evicted/overwritten sessions linger in the heap until they
+            # expire; rebuild it when they start to dominate so memory stays flat.
+            if len(self._expiry_heap) > 2 * self.max_size:
+                self._expiry_heap = [(exp, sid) for sid, (exp, _) in self._sessions.items()]
+                heapq.heapify(self._expiry_heap)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge_expired(self):
+        with self._lock:
+            return self._purge_locked(time.time())
+
+    def _purge_locked(self, now):
+        purged = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expiry, session_id = heapq.heappop(self._expiry_heap)
+            entry = self._sessions.get(session_id)
+            if entry is not None and entry[0] == expiry:
+                del self._sessions[session_id]
+                purged += 1
+        return purged
+
+
+# ---------- SQLite backend ----------
+class SQLiteSessionStore(SessionStore):
+    """Durable store shared by every worker/replica that mounts the same file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " expires_at REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE session_id = ? AND expires_at > ?",
+            (session_id, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id, session):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, expires_at, data) VALUES (?, ?, ?)",
+                (session_id, expires_at(session), json.dumps(session)),
+            )
+
+    def delete(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self):
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+def create_session_store() -> SessionStore:
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "/data/sessions.db"))
+    if backend == "memory":
+        return MemorySessionStore(max_size=int(os.getenv("SESSION_MAX_ENTRIES", "10000")))
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
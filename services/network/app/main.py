@@ -1,12 +1,40 @@
-from fastapi import FastAPI, Query
-from pydantic import BaseModel
-from typing import List, Optional
-import boto3
+from fastapi import FastAPI, Query, HTTPException, Depends, Response, Request
+from pydantic import BaseModel, TypeAdapter
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import logging
+import os
 from fastapi.middleware.cors import CORSMiddleware
+from common.aws_clients import get_client
+from common.regions import fan_out, is_multi_region, resolve_regions
+from common.snapshots import cache_headers
+from common.aio import cached_snapshot, json_response, not_modified, snapshot_data, stored_snapshot, transform
+from common.compression import CompressionMiddleware
+from common.metrics import MetricsMiddleware, metrics_response
+from common.history import fingerprint, inventory_history, merge_diffs
+from common.query import PageRequest, SnapshotIndex, item_value, run_query
+from common.scheduler import crawl_scheduler
+from common.estate_client import ESTATE_MAX_AGE_SECONDS, estate_client
+from common.snapshot_store import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+# Regions kept warm from startup, before anyone has viewed them
+PREWARM_REGIONS = [r.strip() for r in os.getenv("PREWARM_REGIONS", "").split(",") if r.strip()]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    for region in PREWARM_REGIONS:
+        crawl_scheduler.register((DEFAULT_ACCOUNT, region, "network"), network_loader(region), pinned=True)
+    yield
+
 
 app = FastAPI(
     title="AWS Network Documentation Service",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS Middleware for cross-origin requests
@@ -17,6 +45,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Inside MetricsMiddleware, so compression shows up in the request's phases
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# ---------- Snapshot cache ----------
+# This service crawls with the container's own credentials, so every snapshot
+# belongs to the same account.
+DEFAULT_ACCOUNT = "default"
 
 # ---------- Models for Network Info ----------
 
@@ -29,9 +65,16 @@ class VPCModel(BaseModel):
     name: str
     vpc_id: str
     cidr_block: str
+    region: Optional[str] = None
     tags: Optional[List[TagModel]] = None
 
 
+class RouteModel(BaseModel):
+    destination: Optional[str] = None
+    target: Optional[str] = None
+    target_type: Optional[str] = None
+    state: Optional[str] = None
+
 class SubnetModel(BaseModel):
     subnet_name: str
     subnet_id: str
@@ -39,7 +82,11 @@ class SubnetModel(BaseModel):
     vpc_id: str
     availability_zone: str
     route_table: Optional[str] = None
+    # True when the subnet has no explicit association and uses the VPC's main table
+    route_table_main: Optional[bool] = None
+    routes: List[RouteModel] = []
     available_ips: Optional[int] = None
+    region: Optional[str] = None
     tags: Optional[List[TagModel]] = None
 
 class NATGatewayModel(BaseModel):
@@ -52,67 +99,430 @@ class NATGatewayModel(BaseModel):
     subnet_id: str
     private_ip: Optional[str] = None
     network_interface_id: Optional[str] = None
+    region: Optional[str] = None
     tags: Optional[List[TagModel]] = None
     
 
+class RegionStatusModel(BaseModel):
+    region: str
+    elapsed_ms: float
+    error: Optional[str] = None
+    count: int = 0
+
 class NetworkDocumentationModel(BaseModel):
 
     vpcs: List[VPCModel]
     subnets: List[SubnetModel]
     nat_gateways: List[NATGatewayModel]
+    # Only set for multi-region requests
+    regions: Optional[Dict[str, RegionStatusModel]] = None
+
+class NetworkFilterRequest(BaseModel):
+    vpc_id: Optional[str] = None
+    subnet_id: Optional[str] = None
+    availability_zone: Optional[str] = None
+    network_region: Optional[str] = None  # narrows a multi-region snapshot
+
+class VPCDiffModel(BaseModel):
+    added: List[VPCModel] = []
+    modified: List[VPCModel] = []
+    removed: List[str] = []
+
+class SubnetDiffModel(BaseModel):
+    added: List[SubnetModel] = []
+    modified: List[SubnetModel] = []
+    removed: List[str] = []
+
+class NATGatewayDiffModel(BaseModel):
+    added: List[NATGatewayModel] = []
+    modified: List[NATGatewayModel] = []
+    removed: List[str] = []
+
+class NetworkDiffModel(BaseModel):
+    since: float
+    base: Optional[float] = None
+    current: Optional[float] = None
+    truncated: bool = False
+    vpcs: VPCDiffModel
+    subnets: SubnetDiffModel
+    nat_gateways: NATGatewayDiffModel
+
+# ---------- Route tables ----------
+# Route target fields in describe_route_tables, checked in order
+ROUTE_TARGETS = [
+    ("NatGatewayId", "nat"),
+    ("TransitGatewayId", "tgw"),
+    ("VpcPeeringConnectionId", "pcx"),
+    ("EgressOnlyInternetGatewayId", "eigw"),
+    ("CarrierGatewayId", "cagw"),
+    ("LocalGatewayId", "lgw"),
+    ("CoreNetworkArn", "core-network"),
+    ("InstanceId", "instance"),
+    ("NetworkInterfaceId", "eni"),
+    ("GatewayId", None),
+]
+
+# GatewayId covers several gateway kinds; tell them apart by ID prefix
+GATEWAY_PREFIXES = {"igw-": "igw", "vgw-": "vgw", "vpce-": "vpce"}
+
+def route_target(route):
+    for field, target_type in ROUTE_TARGETS:
+        target = route.get(field)
+        if not target:
+            continue
+        if target_type is None:
+            if target == "local":
+                return target, "local"
+            target_type = next(
+                (kind for prefix, kind in GATEWAY_PREFIXES.items() if target.startswith(prefix)),
+                "gateway"
+            )
+        return target, target_type
+    return None, None
+
+def route_models(route_table):
+    routes = []
+    for route in route_table.get("Routes", []):
+        target, target_type = route_target(route)
+        routes.append(RouteModel(
+            destination=route.get("DestinationCidrBlock")
+                or route.get("DestinationIpv6CidrBlock")
+                or route.get("DestinationPrefixListId"),
+            target=target,
+            target_type=target_type,
+            state=route.get("State"),
+        ))
+    return routes
+
+def build_route_table_index(route_tables):
+    """Returns ({subnet_id: route_table}, {vpc_id: main_route_table})."""
+    by_subnet = {}
+    main_by_vpc = {}
+    for route_table in route_tables:
+        for assoc in route_table.get("Associations", []):
+            if assoc.get("Main"):
+                main_by_vpc[route_table["VpcId"]] = route_table
+            elif assoc.get("SubnetId"):
+                by_subnet[assoc["SubnetId"]] = route_table
+    return by_subnet, main_by_vpc
+
+def subnet_route_fields(subnet, route_index):
+    by_subnet, main_by_vpc = route_index
+    route_table = by_subnet.get(subnet["SubnetId"])
+    is_main = route_table is None
+    if is_main:
+        # Subnets without an explicit association use the VPC's main table
+        route_table = main_by_vpc.get(subnet["VpcId"])
+    if route_table is None:
+        return {"route_table": None, "route_table_main": None, "routes": []}
+    return {
+        "route_table": route_table["RouteTableId"],
+        "route_table_main": is_main,
+        "routes": route_models(route_table),
+    }
 
 # ---------- VPC, Subnet, and NAT Gateways Documentation ----------
-@app.get("/", response_model=NetworkDocumentationModel)
-def list_network_info(region: str = Query("ap-northeast-2")):
-    ec2 = boto3.client("ec2", region_name=region)
-    
-    # Fetch VPCs
-    vpc_response = ec2.describe_vpcs()
-    vpcs = [
-        VPCModel(
-            vpc=next((tag["Value"] for tag in vpc.get("Tags", []) if tag["Key"] == "Name"), "N/A"),
-            name=next((tag["Value"] for tag in vpc.get("Tags", []) if tag["Key"] == "Name"), "N/A"),
+NETWORK_RESOURCES = {
+    "vpcs": "vpc_id",
+    "subnets": "subnet_id",
+    "nat_gateways": "nat_gateway_id",
+}
+if snapshot_store is not None:
+    for resource, model in (("vpcs", VPCModel), ("subnets", SubnetModel), ("nat_gateways", NATGatewayModel)):
+        snapshot_store.register_model(resource, model)
+
+def record_history(region, resource, models):
+    id_field = NETWORK_RESOURCES[resource]
+    inventory_history.record(
+        (DEFAULT_ACCOUNT, region, resource),
+        {getattr(model, id_field): (fingerprint(model.model_dump()), model) for model in models}
+    )
+
+def paginate_all(ec2, operation, result_key):
+    return [
+        item
+        for page in ec2.get_paginator(operation).paginate()
+        for item in page.get(result_key, [])
+    ]
+
+def tag_map(resource):
+    return {tag["Key"]: tag["Value"] for tag in resource.get("Tags", [])}
+
+def tag_models(tags):
+    return [TagModel(Key=key, Value=value) for key, value in tags.items()]
+
+def primary_address(nat):
+    # NAT gateways that are pending/failed/deleted may have no addresses at all
+    addresses = nat.get("NatGatewayAddresses") or []
+    return next((a for a in addresses if a.get("IsPrimary")), addresses[0] if addresses else {})
+
+NETWORK_COLLECTIONS = [
+    ("vpcs", "describe_vpcs", "Vpcs"),
+    ("subnets", "describe_subnets", "Subnets"),
+    ("nat_gateways", "describe_nat_gateways", "NatGateways"),
+    ("route_tables", "describe_route_tables", "RouteTables"),
+]
+
+def fetch_network(region, fresh=False):
+    """Raw {collection: items} from the shared aggregator crawl, or straight from AWS."""
+    names = [name for name, _, _ in NETWORK_COLLECTIONS]
+    if estate_client is not None:
+        max_age = 0 if fresh else ESTATE_MAX_AGE_SECONDS
+        return estate_client.fetch(region, names, max_age=max_age)["collections"]
+
+    ec2 = get_client("ec2", region)
+    # The four collections are independent, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="network") as pool:
+        futures = {
+            name: pool.submit(paginate_all, ec2, operation, result_key)
+            for name, operation, result_key in NETWORK_COLLECTIONS
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+def collect_network(region, fresh=False):
+    raw = fetch_network(region, fresh)
+    raw_vpcs = raw["vpcs"]
+    raw_subnets = raw["subnets"]
+    raw_nats = raw["nat_gateways"]
+    route_index = build_route_table_index(raw["route_tables"])
+
+    # VPCs
+    vpcs = []
+    for vpc in raw_vpcs:
+        tags = tag_map(vpc)
+        vpcs.append(VPCModel(
+            vpc=tags.get("Name", "N/A"),
+            name=tags.get("Name", "N/A"),
             vpc_id=vpc["VpcId"],
             cidr_block=vpc["CidrBlock"],
-            tags=[TagModel(**tag) for tag in vpc.get("Tags", [])]
-        ) for vpc in vpc_response.get("Vpcs", [])
-    ]
+            region=region,
+            tags=tag_models(tags)
+        ))
 
-    # Fetch Subnets
-    subnet_response = ec2.describe_subnets()
-    subnets = [
-        SubnetModel(
-            subnet_name=next((tag["Value"] for tag in subnet.get("Tags", []) if tag["Key"] == "Name"), "N/A"),
+    # Subnets
+    subnets = []
+    for subnet in raw_subnets:
+        tags = tag_map(subnet)
+        subnets.append(SubnetModel(
+            subnet_name=tags.get("Name", "N/A"),
             subnet_id=subnet["SubnetId"],
-            cidr_block=subnet["CidrBlock"],
+            cidr_block=subnet.get("CidrBlock") or "N/A",  # IPv6-only subnets have no IPv4 block
             vpc_id=subnet["VpcId"],
             availability_zone=subnet["AvailabilityZone"],
-            route_table=None,  # Placeholder, requires additional API calls to fetch route table
+            **subnet_route_fields(subnet, route_index),
             available_ips=subnet.get("AvailableIpAddressCount", 0),
-            tags=[TagModel(**tag) for tag in subnet.get("Tags", [])]
-        ) for subnet in subnet_response.get("Subnets", [])
-    ]
+            region=region,
+            tags=tag_models(tags)
+        ))
 
-    # Fetch NAT Gateways
-    nat_response = ec2.describe_nat_gateways()
-    nat_gateways = [
-        NATGatewayModel(
-            nat_name=next((tag["Value"] for tag in nat.get("Tags", []) if tag["Key"] == "Name"), "N/A"),
+    # NAT Gateways
+    nat_gateways = []
+    for nat in raw_nats:
+        tags = tag_map(nat)
+        address = primary_address(nat)
+        nat_gateways.append(NATGatewayModel(
+            nat_name=tags.get("Name", "N/A"),
             nat_gateway_id=nat["NatGatewayId"],
             nat_arn=nat.get("NatGatewayArn"),
             vpc_id=nat["VpcId"],
-            type=nat.get("Type"),
-            elastic_ip=nat["NatGatewayAddresses"][0].get("PublicIp", "N/A"),
+            type=nat.get("ConnectivityType"),
+            elastic_ip=address.get("PublicIp", "N/A"),
             subnet_id=nat["SubnetId"],
-            private_ip=nat["NatGatewayAddresses"][0].get("PrivateIp", "N/A"),
-            network_interface_id=nat["NatGatewayAddresses"][0].get("NetworkInterfaceId", "N/A"),
-            tags=[TagModel(**tag) for tag in nat.get("Tags", [])]
-            
-        ) for nat in nat_response.get("NatGateways", [])
-    ]
+            private_ip=address.get("PrivateIp", "N/A"),
+            network_interface_id=address.get("NetworkInterfaceId", "N/A"),
+            region=region,
+            tags=tag_models(tags)
+        ))
+
+    record_history(region, "vpcs", vpcs)
+    record_history(region, "subnets", subnets)
+    record_history(region, "nat_gateways", nat_gateways)
 
     return NetworkDocumentationModel(
         vpcs=vpcs,
         subnets=subnets,
         nat_gateways=nat_gateways
     )
+
+
+def collect_multi_region_network(region, fresh=False):
+    results, status = fan_out(resolve_regions(region), lambda r: collect_network(r, fresh))
+    vpcs, subnets, nat_gateways = [], [], []
+    for name, network in results.items():
+        if network is None:
+            logger.error(f"Failed to collect network info in {name}: {status[name]['error']}")
+            continue
+        vpcs.extend(network.vpcs)
+        subnets.extend(network.subnets)
+        nat_gateways.extend(network.nat_gateways)
+        status[name]["count"] = len(network.vpcs) + len(network.subnets) + len(network.nat_gateways)
+
+    return NetworkDocumentationModel(
+        vpcs=vpcs,
+        subnets=subnets,
+        nat_gateways=nat_gateways,
+        regions=status
+    )
+
+
+def network_loader(region, fresh=False):
+    def crawl():
+        if is_multi_region(region):
+            network = collect_multi_region_network(region, fresh)
+        else:
+            network = collect_network(region, fresh)
+        return snapshot_data(NETWORK_ADAPTER, network)
+    return crawl
+
+
+def stored_network(region, as_of=None):
+    """(data, crawled_at) rebuilt from the last crawl, or the one at as_of; None if missing.
+
+    A multi-region restore needs every region; as_of reports missing ones instead.
+    """
+    regions = resolve_regions(region) if is_multi_region(region) else [region]
+    available = {}
+    for r in regions:
+        found = {
+            resource: inventory_history.stored((DEFAULT_ACCOUNT, r, resource), as_of)
+            for resource in NETWORK_RESOURCES
+        }
+        if all(stored is not None for stored in found.values()):
+            available[r] = found
+    if not available or (as_of is None and len(available) < len(regions)):
+        return None
+
+    crawled_at = min(taken_at for found in available.values() for taken_at, _ in found.values())
+    collections = {
+        resource: [item for found in available.values() for item in found[resource][1]]
+        for resource in NETWORK_RESOURCES
+    }
+    status = None
+    if is_multi_region(region):
+        status = {
+            r: {"region": r, "elapsed_ms": 0.0,
+                "count": sum(len(items) for _, items in available[r].values()) if r in available else 0,
+                "error": None if r in available else "No stored crawl"}
+            for r in regions
+        }
+    return snapshot_data(NETWORK_ADAPTER, NetworkDocumentationModel(**collections, regions=status)), crawled_at
+
+
+async def cached_network(region, refresh=False):
+    key = (DEFAULT_ACCOUNT, region, "network")
+    # Every view keeps the target on the background re-crawl schedule
+    crawl_scheduler.register(key, network_loader(region))
+    return await cached_snapshot(
+        key, network_loader(region, fresh=refresh), force=refresh, restore=lambda: stored_network(region)
+    )
+
+
+# Per collection: (id field, indexed filter fields, sort fields)
+NETWORK_QUERY_FIELDS = {
+    "vpcs": ("vpc_id", ["vpc_id", "region"], ["vpc_id", "name", "cidr_block", "region"]),
+    "subnets": (
+        "subnet_id",
+        ["vpc_id", "subnet_id", "availability_zone", "region"],
+        ["subnet_id", "subnet_name", "vpc_id", "availability_zone", "cidr_block", "available_ips", "region"],
+    ),
+    "nat_gateways": (
+        "nat_gateway_id",
+        ["vpc_id", "subnet_id", "region"],
+        ["nat_gateway_id", "nat_name", "vpc_id", "subnet_id", "type", "region"],
+    ),
+}
+
+
+def query_network(snapshot, resource, filters, page, response):
+    # Filters apply to every collection that has the field; sort/limit/cursor
+    # only to the collection named by `resource`.
+    criteria = filters.model_dump()
+    criteria["region"] = criteria.pop("network_region")
+    data = snapshot.data
+    result = {"regions": item_value(data, "regions")}
+    for name, (id_field, fields, sort_fields) in NETWORK_QUERY_FIELDS.items():
+        items = item_value(data, name)
+        index = snapshot.derived(
+            f"{name}_index", lambda: SnapshotIndex(items, fields, id_field)
+        )
+        active = {field: criteria[field] for field in fields if field in criteria}
+        if name == resource:
+            result[name] = run_query(index, active, page, sort_fields, response)
+        else:
+            result[name], _, _ = index.query(active, sort_fields[0])
+    return result
+
+
+NETWORK_ADAPTER = TypeAdapter(NetworkDocumentationModel)
+DIFF_ADAPTER = TypeAdapter(NetworkDiffModel)
+
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok", "service": "network"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+
+@app.get("/", response_model=NetworkDocumentationModel)
+async def list_network_info(
+    request: Request,
+    response: Response,
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+    refresh: bool = Query(False, description="Bypass the snapshot cache and crawl now"),
+    as_of: Optional[float] = Query(None, description="Epoch seconds; serve the inventory as it was then"),
+    resource: Optional[str] = Query(None, pattern="^(vpcs|subnets|nat_gateways)$",
+                                    description="Collection that sort/limit/cursor apply to"),
+    filters: NetworkFilterRequest = Depends(),
+    page: PageRequest = Depends(),
+):
+    if page.requested() and resource is None:
+        raise HTTPException(status_code=400, detail="sort, limit and cursor require resource=vpcs|subnets|nat_gateways")
+
+    if as_of is not None:
+        snapshot, status = await stored_snapshot(lambda t: stored_network(region, t), as_of)
+    else:
+        snapshot, status = await cached_network(region, refresh)
+    cache_headers(response, snapshot, status)
+    unchanged = await not_modified(request, response, snapshot)
+    if unchanged is not None:
+        return unchanged
+    data = snapshot.data
+    if resource or any(v is not None for v in filters.model_dump().values()):
+        data = await transform(query_network, snapshot, resource, filters, page, response)
+    return await json_response(response, NETWORK_ADAPTER, data, validated=True)
+
+
+def network_diff(region, since):
+    regions = resolve_regions(region) if is_multi_region(region) else [region]
+    diffs = {
+        resource: merge_diffs(
+            [inventory_history.diff((DEFAULT_ACCOUNT, r, resource), since) for r in regions], since
+        )
+        for resource in NETWORK_RESOURCES
+    }
+    summary = merge_diffs(list(diffs.values()), since)
+    return {
+        "since": since,
+        "base": summary["base"],
+        "current": summary["current"],
+        "truncated": summary["truncated"],
+        **{
+            resource: {key: diff[key] for key in ("added", "modified", "removed")}
+            for resource, diff in diffs.items()
+        },
+    }
+
+
+@app.get("/diff", response_model=NetworkDiffModel)
+async def diff_network_info(
+    response: Response,
+    since: float = Query(..., description="Epoch seconds of the snapshot the client already has"),
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+):
+    snapshot, status = await cached_network(region)
+    cache_headers(response, snapshot, status)
+    return await json_response(response, DIFF_ADAPTER, await transform(network_diff, region, since))
@@ -1,12 +1,48 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Depends, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-import boto3
+from pydantic import BaseModel, TypeAdapter
+from typing import Dict, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import logging
+import os
+import time
+from common.aws_clients import get_client
+from common.regions import DEFAULT_REGION, is_multi_region, resolve_regions
+from common.snapshots import cache_headers
+from common.aio import cached_snapshot, json_response, not_modified, snapshot_data, stored_snapshot, transform
+from common.compression import CompressionMiddleware
+from common.metrics import MetricsMiddleware, metrics_response
+from common.history import fingerprint, inventory_history, merge_diffs
+from common.query import PageRequest, SnapshotIndex, item_value, run_query
+from common.scheduler import crawl_scheduler
+from common.snapshot_store import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on in-flight S3 calls per request (shared across all buckets and probes)
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "32"))
+# Bucket settings can change without ListBuckets showing it; re-probe each bucket
+# at least this often
+S3_PROBE_MAX_AGE_SECONDS = float(os.getenv("S3_PROBE_MAX_AGE_SECONDS", "3600"))
+# Keep the bucket snapshot warm from startup; ListBuckets is global, so any
+# region listed here just picks the endpoint
+PREWARM_REGIONS = [r.strip() for r in os.getenv("PREWARM_REGIONS", "").split(",") if r.strip()]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if PREWARM_REGIONS:
+        crawl_scheduler.register(
+            BUCKETS_KEY, lambda: crawl_buckets(PREWARM_REGIONS[0], S3_MAX_CONCURRENCY), pinned=True
+        )
+    yield
+
 
 app = FastAPI(
     title="AWS S3 Documentation Service",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
 )
 
 # ---------- Middleware ----------
@@ -17,9 +53,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Inside MetricsMiddleware, so compression shows up in the request's phases
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
-# ---------- In-memory cache ----------
-last_buckets = []
+# ---------- Snapshot cache ----------
+# This service crawls with the container's own credentials, so every snapshot
+# belongs to the same account.
+DEFAULT_ACCOUNT = "default"
 
 # ---------- Models ----------
 class TagModel(BaseModel):
@@ -42,101 +83,357 @@ class S3BucketModel(BaseModel):
     tags: Optional[List[TagModel]] = []
 
 
+class BucketFilterRequest(BaseModel):
+    bucket_region: Optional[str] = None
+    encrypted: Optional[bool] = None
+    versioning_enabled: Optional[bool] = None
+    block_public_access: Optional[bool] = None
+    static_website: Optional[bool] = None
+    replication_enabled: Optional[bool] = None
+
+
+class RegionStatusModel(BaseModel):
+    region: str
+    count: int = 0
+    error: Optional[str] = None
+
+
+class MultiRegionBucketsModel(BaseModel):
+    buckets: List[S3BucketModel]
+    regions: Dict[str, RegionStatusModel]
+
+
+class BucketDiffModel(BaseModel):
+    since: float
+    base: Optional[float] = None
+    current: Optional[float] = None
+    truncated: bool = False
+    added: List[S3BucketModel] = []
+    modified: List[S3BucketModel] = []
+    removed: List[str] = []
+
+
+# ---------- Bucket probes ----------
+# Each probe makes one S3 call for one bucket and returns the fields it owns.
+# Probes never raise: failures map to the same defaults the UI has always shown.
+def probe_location(s3, bucket_name):
+    try:
+        loc = s3.get_bucket_location(Bucket=bucket_name)
+        return {"region": loc.get("LocationConstraint") or "us-east-1"}
+    except Exception:
+        return {"region": "Unknown"}
+
+
+def probe_website(s3, bucket_name):
+    try:
+        s3.get_bucket_website(Bucket=bucket_name)
+        return {"static_website": True}
+    except Exception:
+        return {"static_website": False}
+
+
+def probe_versioning(s3, bucket_name):
+    try:
+        v = s3.get_bucket_versioning(Bucket=bucket_name)
+        return {
+            "versioning_enabled": v.get("Status") == "Enabled",
+            "mfa_delete": v.get("MFADelete") == "Enabled",
+        }
+    except Exception:
+        return {"versioning_enabled": False, "mfa_delete": False}
+
+
+def probe_lifecycle(s3, bucket_name):
+    try:
+        lc = s3.get_bucket_lifecycle_configuration(Bucket=bucket_name)
+        return {"lifecycle_rules": len(lc.get("Rules", []))}
+    except Exception:
+        return {"lifecycle_rules": 0}
+
+
+def probe_replication(s3, bucket_name):
+    try:
+        rep = s3.get_bucket_replication(Bucket=bucket_name)
+        return {"replication_enabled": "ReplicationConfiguration" in rep}
+    except Exception:
+        return {"replication_enabled": False}
+
+
+def probe_encryption(s3, bucket_name):
+    try:
+        enc = s3.get_bucket_encryption(Bucket=bucket_name)
+        rules = enc["ServerSideEncryptionConfiguration"]["Rules"]
+        if rules:
+            algo = rules[0]["ApplyServerSideEncryptionByDefault"]
+            return {"encrypted": True, "kms_key_id": algo.get("KMSMasterKeyID")}
+        return {}
+    except Exception:
+        return {"encrypted": False, "kms_key_id": None}
+
+
+def probe_public_access_block(s3, bucket_name):
+    try:
+        bpa = s3.get_public_access_block(Bucket=bucket_name)
+        conf = bpa.get("PublicAccessBlockConfiguration", {})
+        return {"block_public_access": all(conf.values())}
+    except Exception:
+        return {"block_public_access": False}
+
+
+def probe_tagging(s3, bucket_name):
+    try:
+        tag_response = s3.get_bucket_tagging(Bucket=bucket_name)
+        tags = tag_response.get("TagSet", [])
+        return {"tags": [{"Key": tag["Key"], "Value": tag["Value"]} for tag in tags]}
+    except Exception:
+        return {"tags": []}  # If no tags are found
+
+
+BUCKET_PROBES = {
+    "location": probe_location,
+    "website": probe_website,
+    "versioning": probe_versioning,
+    "lifecycle": probe_lifecycle,
+    "replication": probe_replication,
+    "encryption": probe_encryption,
+    "public_access_block": probe_public_access_block,
+    "tagging": probe_tagging,
+}
+
+
+# ---------- Enrichment ----------
+def _timed_probe(probe, s3, bucket_name):
+    start = time.perf_counter()
+    result = probe(s3, bucket_name)
+    return result, time.perf_counter() - start
+
+
+def enrich_buckets(s3, bucket_names, concurrency=S3_MAX_CONCURRENCY):
+    """Run every probe for every bucket on a bounded pool.
+
+    Returns the bucket dicts in the order of ``bucket_names`` and a per-probe
+    timing breakdown ``{probe: {"calls", "total_ms", "max_ms"}}``.
+    """
+    timings = {name: {"calls": 0, "total_ms": 0.0, "max_ms": 0.0} for name in BUCKET_PROBES}
+    if not bucket_names:
+        return [], timings
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-probe") as pool:
+        futures = [
+            {
+                probe_name: pool.submit(_timed_probe, probe, s3, bucket_name)
+                for probe_name, probe in BUCKET_PROBES.items()
+            }
+            for bucket_name in bucket_names
+        ]
+
+        bucket_details = []
+        for bucket_name, bucket_futures in zip(bucket_names, futures):
+            bucket_info = {"name": bucket_name}
+            for probe_name, future in bucket_futures.items():
+                result, elapsed = future.result()
+                bucket_info.update(result)
+
+                elapsed_ms = elapsed * 1000
+                stats = timings[probe_name]
+                stats["calls"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+            # Copy settings (replication exists)
+            bucket_info["copy_settings_enabled"] = bucket_info["replication_enabled"]
+            bucket_details.append(bucket_info)
+
+    return bucket_details, timings
+
+
+def server_timing_header(timings):
+    # Server-Timing shows up per probe in the browser devtools network panel
+    return ", ".join(
+        f'{name};dur={stats["total_ms"]:.1f};desc="{stats["calls"]} calls, max {stats["max_ms"]:.1f}ms"'
+        for name, stats in timings.items()
+    )
+
+
 # ---------- Health Check ----------
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok", "service": "s3"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+
 # ---------- Main Endpoint ----------
-@app.get("/", response_model=List[S3BucketModel])
-def list_buckets(region: str = Query("ap-northeast-2")):
-    global last_buckets
-    s3 = boto3.client("s3", region_name=region)
+BUCKETS_KEY = (DEFAULT_ACCOUNT, "global", "s3")
+BUCKET_LIST_ADAPTER = TypeAdapter(List[S3BucketModel])
+if snapshot_store is not None:
+    snapshot_store.register_model("s3", S3BucketModel)
+
+
+# bucket name -> (ListBuckets fingerprint, time of the last probe). Kept out of
+# the history so a re-probe that finds nothing new is not reported as a change;
+# after a restart every bucket is probed once before ages apply again.
+bucket_probes = {}
+
+
+def crawl_buckets(region, concurrency, full=False):
+    s3 = get_client("s3", region, max_pool_connections=concurrency)
 
     try:
         resp = s3.list_buckets()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list buckets: {e}")
 
+    # Incremental unless full: the ListBuckets entry never changes for an existing
+    # bucket, so new or re-created buckets are probed at once and the rest once
+    # their probe results are older than S3_PROBE_MAX_AGE_SECONDS
+    now = time.time()
+    previous = {} if full else inventory_history.latest(BUCKETS_KEY)
     buckets = resp.get("Buckets", [])
-    bucket_details = []
-
-    for bucket in buckets:
-        bucket_name = bucket["Name"]
-        print(f"Fetching info for bucket: {bucket_name}")
-        bucket_info = {"name": bucket_name}
-
-        # --- 1. Region ---
-        try:
-            loc = s3.get_bucket_location(Bucket=bucket_name)
-            bucket_info["region"] = loc.get("LocationConstraint") or "us-east-1"
-        except Exception:
-            bucket_info["region"] = "Unknown"
-
-        # --- 2. Static Website Hosting ---
-        try:
-            s3.get_bucket_website(Bucket=bucket_name)
-            bucket_info["static_website"] = True
-        except Exception:
-            bucket_info["static_website"] = False
-
-        # --- 3. Versioning + MFA Delete ---
-        try:
-            v = s3.get_bucket_versioning(Bucket=bucket_name)
-            bucket_info["versioning_enabled"] = v.get("Status") == "Enabled"
-            bucket_info["mfa_delete"] = v.get("MFADelete") == "Enabled"
-        except Exception:
-            bucket_info["versioning_enabled"] = False
-            bucket_info["mfa_delete"] = False
-
-        # --- 4. Lifecycle Rules ---
-        try:
-            lc = s3.get_bucket_lifecycle_configuration(Bucket=bucket_name)
-            bucket_info["lifecycle_rules"] = len(lc.get("Rules", []))
-        except Exception:
-            bucket_info["lifecycle_rules"] = 0
-
-        # --- 5. Replication ---
-        try:
-            rep = s3.get_bucket_replication(Bucket=bucket_name)
-            bucket_info["replication_enabled"] = "ReplicationConfiguration" in rep
-        except Exception:
-            bucket_info["replication_enabled"] = False
-
-        # --- 6. Copy settings (replication exists) ---
-        bucket_info["copy_settings_enabled"] = bucket_info["replication_enabled"]
-
-        # --- 7. Encryption (KMS Key) ---
-        try:
-            enc = s3.get_bucket_encryption(Bucket=bucket_name)
-            rules = enc["ServerSideEncryptionConfiguration"]["Rules"]
-            if rules:
-                algo = rules[0]["ApplyServerSideEncryptionByDefault"]
-                bucket_info["encrypted"] = True
-                bucket_info["kms_key_id"] = algo.get("KMSMasterKeyID")
-        except Exception:
-            bucket_info["encrypted"] = False
-            bucket_info["kms_key_id"] = None
-
-        # --- 8. Block Public Access ---
-        try:
-            bpa = s3.get_public_access_block(Bucket=bucket_name)
-            conf = bpa.get("PublicAccessBlockConfiguration", {})
-            bucket_info["block_public_access"] = all(conf.values())
-        except Exception:
-            bucket_info["block_public_access"] = False
-        # --- 9. Tags ---
-        try:
-            tag_response = s3.get_bucket_tagging(Bucket=bucket_name)
-            tags = tag_response.get("TagSet", [])
-            bucket_info["tags"] = [{"Key": tag["Key"], "Value": tag["Value"]} for tag in tags]
-        except Exception:
-            bucket_info["tags"] = []  # If no tags are found
-
-
-        # Append model
-        bucket_details.append(S3BucketModel(**bucket_info))
-
-    last_buckets = bucket_details
+    listed = {bucket["Name"]: fingerprint(bucket) for bucket in buckets}
+    changed = [
+        name for name, list_fp in listed.items()
+        if name not in previous
+        or bucket_probes.get(name, (None,))[0] != list_fp
+        or now - bucket_probes[name][1] >= S3_PROBE_MAX_AGE_SECONDS
+    ]
+
+    bucket_infos, timings = enrich_buckets(s3, changed, concurrency)
+    enriched = {info["name"]: S3BucketModel(**info) for info in bucket_infos}
+
+    # History fingerprints cover the probe results, so /diff sees real changes
+    entries = {}
+    for name in listed:
+        if name in enriched:
+            model = enriched[name]
+            entries[name] = (fingerprint(model.model_dump(mode="json")), model)
+        else:
+            entries[name] = previous[name]
+    inventory_history.record(BUCKETS_KEY, entries)
+
+    for name in [name for name in bucket_probes if name not in listed]:
+        bucket_probes.pop(name, None)
+    bucket_probes.update((name, (listed[name], now)) for name in enriched)
+
+    if changed:
+        slowest = max(timings.items(), key=lambda item: item[1]["total_ms"])[0]
+        logger.info(f"Enriched {len(changed)}/{len(buckets)} buckets with concurrency={concurrency}; slowest probe: {slowest}")
+    details = snapshot_data(BUCKET_LIST_ADAPTER, [model for _, model in entries.values()])
+    return {"buckets": details, "timings": timings}
+
+
+def stored_buckets(as_of=None):
+    """(data, crawled_at) rebuilt from the last crawl, or the one at as_of; None if missing."""
+    stored = inventory_history.stored(BUCKETS_KEY, as_of)
+    if stored is None:
+        return None
+    crawled_at, buckets = stored
+    # Probe timings are not persisted; they belong to the crawl that measured them
+    return {"buckets": snapshot_data(BUCKET_LIST_ADAPTER, buckets), "timings": {}}, crawled_at
+
+
+async def cached_buckets(region, concurrency, refresh=False):
+    list_region = DEFAULT_REGION if is_multi_region(region) else region
+    # Every view keeps the snapshot on the background re-crawl schedule
+    crawl_scheduler.register(BUCKETS_KEY, lambda: crawl_buckets(list_region, concurrency))
+    # ListBuckets is global, so every region query shares one snapshot
+    return await cached_snapshot(
+        BUCKETS_KEY,
+        lambda: crawl_buckets(list_region, concurrency, full=refresh),
+        force=refresh,
+        restore=stored_buckets,
+    )
+
+
+def group_by_region(bucket_details, region):
+    # ListBuckets is global, so one listing already covers every region; a
+    # multi-region request only filters by each bucket's home region.
+    wanted = None if region == "all" else resolve_regions(region)
+    status = {name: {"region": name, "count": 0, "error": None} for name in wanted or []}
+    buckets = []
+    for bucket in bucket_details:
+        home = item_value(bucket, "region")
+        if wanted is not None and home not in status:
+            continue
+        status.setdefault(home, {"region": home, "count": 0, "error": None})["count"] += 1
+        buckets.append(bucket)
+    return {"buckets": buckets, "regions": status}
+
+
+BUCKET_INDEX_FIELDS = [
+    "region", "encrypted", "versioning_enabled", "block_public_access",
+    "static_website", "replication_enabled",
+]
+BUCKET_SORT_FIELDS = ["name", "region", "lifecycle_rules", "encrypted", "versioning_enabled"]
+
+
+def query_buckets(snapshot, region, filters, page, response):
+    index = snapshot.derived(
+        "bucket_index", lambda: SnapshotIndex(snapshot.data["buckets"], BUCKET_INDEX_FIELDS, "name")
+    )
+    criteria = filters.model_dump()
+    criteria["region"] = criteria.pop("bucket_region")
+    if is_multi_region(region) and region != "all":
+        # Narrow to the requested home regions inside the index so totals and cursors agree
+        wanted = resolve_regions(region)
+        if criteria["region"] is None:
+            criteria["region"] = wanted
+        elif criteria["region"] not in wanted:
+            criteria["region"] = []
+    return run_query(index, criteria, page, BUCKET_SORT_FIELDS, response)
+
+
+BUCKETS_ADAPTER = TypeAdapter(Union[List[S3BucketModel], MultiRegionBucketsModel])
+DIFF_ADAPTER = TypeAdapter(BucketDiffModel)
+
+
+def select_buckets(snapshot, region, filters, page, response):
+    bucket_details = snapshot.data["buckets"]
+    if page.requested() or any(v is not None for v in filters.model_dump().values()):
+        bucket_details = query_buckets(snapshot, region, filters, page, response)
+    if is_multi_region(region):
+        return group_by_region(bucket_details, region)
     return bucket_details
+
+
+@app.get("/", response_model=Union[List[S3BucketModel], MultiRegionBucketsModel])
+async def list_buckets(
+    request: Request,
+    response: Response,
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+    concurrency: Optional[int] = Query(None, ge=1, le=S3_MAX_CONCURRENCY),
+    refresh: bool = Query(False, description="Bypass the snapshot cache and re-probe every bucket"),
+    as_of: Optional[float] = Query(None, description="Epoch seconds; serve the inventory as it was then"),
+    filters: BucketFilterRequest = Depends(),
+    page: PageRequest = Depends(),
+):
+    concurrency = concurrency or S3_MAX_CONCURRENCY
+    if as_of is not None:
+        snapshot, status = await stored_snapshot(stored_buckets, as_of)
+    else:
+        snapshot, status = await cached_buckets(region, concurrency, refresh)
+    cache_headers(response, snapshot, status)
+    # Probe timings change with every crawl but only reach the Server-Timing header
+    unchanged = await not_modified(request, response, snapshot, content=lambda data: data["buckets"])
+    if unchanged is not None:
+        return unchanged
+    # Timings describe the crawl that produced this snapshot
+    response.headers["Server-Timing"] = server_timing_header(snapshot.data["timings"])
+
+    buckets = await transform(select_buckets, snapshot, region, filters, page, response)
+    return await json_response(response, BUCKETS_ADAPTER, buckets, validated=True)
+
+
+@app.get("/diff", response_model=BucketDiffModel)
+async def diff_buckets(
+    response: Response,
+    since: float = Query(..., description="Epoch seconds of the snapshot the client already has"),
+    region: str = Query("ap-northeast-2"),
+):
+    snapshot, status = await cached_buckets(region, S3_MAX_CONCURRENCY)
+    cache_headers(response, snapshot, status)
+    diff = await transform(inventory_history.diff, BUCKETS_KEY, since)
+    return await json_response(response, DIFF_ADAPTER, diff or merge_diffs([], since))
@@ -0,0 +1,180 @@
+# app/exposure.py
+# Exposure queries ("which rules allow tcp/22 from 0.0.0.0/0") over every rule in
+# an inventory snapshot. Ports go into a segment tree over the rule intervals,
+# sources into per-prefix-length tables, so a query touches O(log n + matches)
+# entries instead of scanning every rule.
+import bisect
+import ipaddress
+
+ALL_PORTS = (0, 65535)
+CONTAINS, OVERLAPS = "contains", "overlaps"
+# IpProtocol may be a name or an IANA protocol number; "-1" is all traffic
+PROTOCOL_NAMES = {"-1": "all", "1": "icmp", "6": "tcp", "17": "udp", "58": "icmpv6"}
+# Only these carry ports; for ICMP, FromPort/ToPort are the type and code
+PORT_PROTOCOLS = ("tcp", "udp")
+
+
+def protocol_name(protocol):
+    """Lowercase protocol name, with protocol numbers translated where known."""
+    protocol = str(protocol).lower()
+    return PROTOCOL_NAMES.get(protocol, protocol)
+
+
+def rule_interval(rule):
+    """[from, to] ports a compact rule covers, or None if its protocol has no ports.
+
+    All-traffic rules and tcp/udp rules without ports cover every port.
+    """
+    protocol = protocol_name(rule["protocol"])
+    if protocol == "all":
+        return ALL_PORTS
+    if protocol not in PORT_PROTOCOLS:
+        return None
+    if rule.get("from_port") is None:
+        return ALL_PORTS
+    return rule["from_port"], rule["to_port"]
+
+
+class PortIntervalIndex:
+    """Static segment tree: which intervals contain a given port."""
+
+    def __init__(self, intervals):
+        # intervals: list of (low, high, value), inclusive bounds
+        self.points = sorted({low for low, _, _ in intervals} | {high + 1 for _, high, _ in intervals})
+        size = max(len(self.points) - 1, 1)
+        self.size = 1
+        while self.size < size:
+            self.size *= 2
+        self.nodes = [[] for _ in range(2 * self.size)]
+        for low, high, value in intervals:
+            self._insert(bisect.bisect_left(self.points, low), bisect.bisect_left(self.points, high + 1), value)
+
+    def _insert(self, start, end, value):
+        # Elementary segments [start, end) of the compressed coordinates
+        start += self.size
+        end += self.size
+        while start < end:
+            if start & 1:
+                self.nodes[start].append(value)
+                start += 1
+            if end & 1:
+                end -= 1
+                self.nodes[end].append(value)
+            start //= 2
+            end //= 2
+
+    def stab(self, port):
+        segment = bisect.bisect_right(self.points, port) - 1
+        if segment < 0 or segment >= len(self.points) - 1:
+            return []
+        node = segment + self.size
+        found = []
+        while node:
+            found.extend(self.nodes[node])
+            node //= 2
+        return found
+
+
+class PrefixIndex:
+    """Rule sources by (IP version, prefix length) -> {network int: [values]}."""
+
+    def __init__(self):
+        self.tables = {}  # (version, prefixlen) -> {network int: [values]}
+        self._sorted = {}
+
+    def add(self, network, value):
+        table = self.tables.setdefault((network.version, network.prefixlen), {})
+        table.setdefault(int(network.network_address), []).append(value)
+
+    def freeze(self):
+        self._sorted = {key: sorted(table) for key, table in self.tables.items()}
+
+    def supernets(self, network):
+        """Values whose network contains `network` (one lookup per shorter prefix)."""
+        found = []
+        address = int(network.network_address)
+        bits = network.max_prefixlen
+        for prefixlen in range(network.prefixlen + 1):
+            table = self.tables.get((network.version, prefixlen))
+            if table:
+                mask = ((1 << bits) - 1) ^ ((1 << (bits - prefixlen)) - 1)
+                found.extend(table.get(address & mask, []))
+        return found
+
+    def subnets(self, network):
+        """Values whose network lies strictly inside `network`."""
+        found = []
+        low = int(network.network_address)
+        high = int(network.broadcast_address)
+        for (version, prefixlen), starts in self._sorted.items():
+            if version != network.version or prefixlen <= network.prefixlen:
+                continue
+            table = self.tables[(version, prefixlen)]
+            for start in starts[bisect.bisect_left(starts, low):bisect.bisect_right(starts, high)]:
+                found.extend(table[start])
+        return found
+
+
+class ExposureIndex:
+    def __init__(self, security_groups):
+        self.rules = []  # (sg, direction, rule)
+        intervals = []
+        self.by_source_group = {}
+        self.prefixes = PrefixIndex()
+
+        for sg in security_groups:
+            for direction in ("inbound", "outbound"):
+                for rule in sg[f"{direction}_rules"]:
+                    rule_id = len(self.rules)
+                    self.rules.append((sg, direction, rule))
+                    interval = rule_interval(rule)
+                    if interval is not None:
+                        intervals.append((*interval, rule_id))
+                    if rule.get("source_group"):
+                        self.by_source_group.setdefault(rule["source_group"], []).append(rule_id)
+                    else:
+                        try:
+                            self.prefixes.add(ipaddress.ip_network(rule["cidr"], strict=False), rule_id)
+                        except ValueError:
+                            pass  # prefix lists and other non-CIDR sources are not indexed
+
+        self.ports = PortIntervalIndex(intervals)
+        self.prefixes.freeze()
+
+    def match(self, direction="inbound", protocol=None, port=None, cidr=None,
+              source_group=None, mode=CONTAINS):
+        """Sorted ids of the rules matching every given criterion.
+
+        Candidates come from the most selective structure that applies (source
+        group, then CIDR prefixes, then the port tree); the remaining criteria
+        are checked on each candidate rule directly.
+        """
+        if source_group is not None and cidr is not None:
+            return []  # a rule has either a CIDR or a group source, never both
+        if source_group is not None:
+            candidates = self.by_source_group.get(source_group, ())
+        elif cidr is not None:
+            network = ipaddress.ip_network(cidr, strict=False)
+            candidates = self.prefixes.supernets(network)
+            if mode == OVERLAPS:
+                candidates += self.prefixes.subnets(network)
+        elif port is not None:
+            candidates = self.ports.stab(port)
+        else:
+            candidates = range(len(self.rules))
+
+        protocol = protocol_name(protocol) if protocol is not None else None
+        selected = []
+        for rule_id in candidates:
+            _, rule_direction, rule = self.rules[rule_id]
+            if rule_direction != direction:
+                continue
+            # Rules for all protocols ("All" / -1) match any protocol query
+            if protocol is not None and protocol_name(rule["protocol"]) not in (protocol, "all"):
+                continue
+            if port is not None:
+                interval = rule_interval(rule)
+                if interval is None or not interval[0] <= port <= interval[1]:
+                    continue
+            selected.append(rule_id)
+        return sorted(set(selected))
@@ -1,8 +1,8 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException,Header, Query
+from fastapi import FastAPI, HTTPException,Header, Query, Path, Response, Depends, Request
 from fastapi import Body
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import List, Optional, Dict, Union
 import requests
 import boto3
 import io
@@ -12,10 +12,26 @@ from botocore.exceptions import ClientError, NoCredentialsError, EndpointConnect
 import openpyxl
 import tempfile
 import os
+import time
 import botocore
 import uuid
+from common.session_client import EXPIRY_SKEW_SECONDS, SessionClient, session_expires_at, session_scope
+from common.aws_clients import get_client
+from common.regions import fan_out, is_multi_region, resolve_regions
+from common.snapshots import cache_headers, snapshot_cache
+from common.aio import cached_snapshot, json_response, not_modified, run_io, snapshot_data, stored_snapshot, transform
+from common.compression import CompressionMiddleware
+from common.metrics import MetricsMiddleware, metrics_response, phase
+from common.history import fingerprint, inventory_history, merge_diffs
+from common.exports import export_response
+from common.query import PageRequest, SnapshotIndex, run_query
+from app.exposure import CONTAINS, OVERLAPS, PORT_PROTOCOLS, ExposureIndex, protocol_name
+from common.scheduler import TargetExpired, crawl_scheduler
+from common.estate_client import ESTATE_MAX_AGE_SECONDS, estate_client
 
 AUTH_SERVICE_URL = "http://backend-home:8000"
+# Member accounts of a session group crawled in parallel
+AWS_ACCOUNT_WORKERS = int(os.getenv("AWS_ACCOUNT_WORKERS", "8"))
 
 logger = logging.getLogger(__name__)
 
@@ -35,8 +51,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Inside MetricsMiddleware, so compression shows up in the request's phases
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
-last_security_groups = []
+
+# Resolved sessions are cached briefly (never past their STS expiration)
+session_client = SessionClient(AUTH_SERVICE_URL, ttl=float(os.getenv("SESSION_CACHE_TTL", "60")))
 
 # ---------- Models ----------
 class InboundRule(BaseModel):
@@ -58,6 +79,8 @@ class InstanceInfo(BaseModel):
     instance_name: Optional[str] = None
     private_ip: Optional[str] = None
     public_ip: Optional[str] = None
+    # Only set for session-group requests
+    account_id: Optional[str] = None
 
 
 class RuleModel(BaseModel):
@@ -79,126 +102,500 @@ class GroupedSecurityGroupModel(BaseModel):
     tags: Optional[List[TagModel]] = []
 
 
+class CompactRuleModel(BaseModel):
+    protocol: str
+    port: str
+    cidr: str
+    # None for rules that cover every port
+    from_port: Optional[int] = None
+    to_port: Optional[int] = None
+    # Set when the rule references another security group instead of a CIDR
+    source_group: Optional[str] = None
+
+class CompactSecurityGroupModel(BaseModel):
+    sg_id: str
+    sg_name: str
+    vpc_id: str
+    region: str
+    inbound_rules: List[CompactRuleModel] = []
+    outbound_rules: List[CompactRuleModel] = []
+    instance_ids: List[str] = []
+    tags: Optional[List[TagModel]] = []
+    # Only set for session-group requests
+    account_id: Optional[str] = None
+
+class RegionStatusModel(BaseModel):
+    region: str
+    elapsed_ms: float
+    error: Optional[str] = None
+    count: int = 0
+
+class AccountStatusModel(BaseModel):
+    account_id: str
+    role_arn: Optional[str] = None
+    elapsed_ms: float = 0
+    error: Optional[str] = None
+    count: int = 0
+
+# Normalized shape: rules are listed once per SG and attached instances once
+# per account, so the payload grows with rules + instances, not rules × instances.
+class SecurityGroupInventoryModel(BaseModel):
+    security_groups: Dict[str, CompactSecurityGroupModel]
+    instances: Dict[str, InstanceInfo]
+    # Only set for multi-region requests
+    regions: Optional[Dict[str, RegionStatusModel]] = None
+    # Only set for session-group requests
+    accounts: Optional[Dict[str, AccountStatusModel]] = None
+
+
+class SecurityGroupDiffModel(BaseModel):
+    since: float
+    base: Optional[float] = None
+    current: Optional[float] = None
+    truncated: bool = False
+    added: List[CompactSecurityGroupModel] = []
+    modified: List[CompactSecurityGroupModel] = []
+    removed: List[str] = []
+    # Instances attached to the added/modified groups
+    instances: Dict[str, InstanceInfo] = {}
+
+
 class ExportRequest(BaseModel):
     region: str = "ap-northeast-2"
     account: Optional[str] = None  # for multi-account later
+    compress: bool = False  # gzip the file
+
+
+class ExposureRequest(BaseModel):
+    direction: str = Field("inbound", pattern="^(inbound|outbound)$")
+    protocol: Optional[str] = None
+    port: Optional[int] = Field(None, ge=0, le=65535)
+    cidr: Optional[str] = None
+    source_group: Optional[str] = None
+    match: str = Field(CONTAINS, pattern=f"^({CONTAINS}|{OVERLAPS})$")
+
+
+class ExposureMatchModel(BaseModel):
+    sg_id: str
+    sg_name: str
+    vpc_id: str
+    region: str
+    direction: str
+    rule: CompactRuleModel
+    instance_ids: List[str] = []
+    account_id: Optional[str] = None
+
+
+class ExposureModel(BaseModel):
+    matches: List[ExposureMatchModel]
+    instances: Dict[str, InstanceInfo]
 
 
 class FilterRequest(BaseModel):
     vpc_id: Optional[str] = None
     protocol: Optional[str] = None
     port: Optional[str] = None
+    sg_region: Optional[str] = None  # narrows a multi-region snapshot
+    account_id: Optional[str] = None  # narrows a session-group snapshot
 
 
 # ---------- Endpoints ----------
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok", "service": "aws-doc-backend"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+
+
+
+def rule_ports(rule, protocol):
+    """(from_port, to_port, label); from/to are None unless the rule has a port range."""
+    from_port = rule.get("FromPort")
+    to_port = rule.get("ToPort", from_port)
+    if protocol not in PORT_PROTOCOLS:
+        # All traffic has no ports; for ICMP the fields are the type and code (-1 = any)
+        if protocol == "all" or from_port is None or from_port == -1:
+            return None, None, "All"
+        return None, None, str(from_port) if to_port in (None, -1) else f"{from_port}/{to_port}"
+    # No FromPort or -1 means every port
+    if from_port is None or from_port == -1:
+        return None, None, "All"
+    if to_port == -1:
+        to_port = 65535
+    return from_port, to_port, str(from_port) if from_port == to_port else f"{from_port}-{to_port}"
+
+
+def rule_rows(rules):
+    for rule in rules:
+        protocol = protocol_name(rule.get("IpProtocol", "-1"))
+        proto = "All" if protocol == "all" else protocol
+        from_port, to_port, port = rule_ports(rule, protocol)
+        base = {"protocol": proto, "port": port, "from_port": from_port, "to_port": to_port}
+        for ip_range in rule.get("IpRanges", []):
+            yield {**base, "cidr": ip_range.get("CidrIp", "")}
+        for ip_range in rule.get("Ipv6Ranges", []):
+            yield {**base, "cidr": ip_range.get("CidrIpv6", "")}
+        for pair in rule.get("UserIdGroupPairs", []):
+            # Shown in the cidr column the way the console shows the source
+            yield {**base, "cidr": pair.get("GroupId", ""), "source_group": pair.get("GroupId")}
+
+
+def build_inventory(sg_resp, instance_resp, region):
+    instances: Dict[str, dict] = {}
+    sg_to_instances: Dict[str, List[str]] = {}
+    for reservation in instance_resp.get("Reservations", []):
+        for inst in reservation.get("Instances", []):
+            instance_id = inst.get("InstanceId")
+            instances[instance_id] = {
+                "instance_id": instance_id,
+                "instance_name": next(
+                    (t["Value"] for t in inst.get("Tags", []) if t["Key"] == "Name"),
+                    None
+                ),
+                "private_ip": inst.get("PrivateIpAddress"),
+                "public_ip": inst.get("PublicIpAddress")
+            }
+            for sg in inst.get("SecurityGroups", []):
+                sg_to_instances.setdefault(sg["GroupId"], []).append(instance_id)
+
+    security_groups: Dict[str, dict] = {}
+    for sg in sg_resp["SecurityGroups"]:
+        sg_id = sg["GroupId"]
+        security_groups[sg_id] = {
+            "sg_id": sg_id,
+            "sg_name": sg.get("GroupName", ""),
+            "vpc_id": sg.get("VpcId", ""),
+            "region": region,
+            "inbound_rules": list(rule_rows(sg.get("IpPermissions", []))),
+            "outbound_rules": list(rule_rows(sg.get("IpPermissionsEgress", []))),
+            "instance_ids": sg_to_instances.get(sg_id, []),
+            "tags": [{"Key": t["Key"], "Value": t["Value"]} for t in sg.get("Tags", [])]
+        }
+
+    return {"security_groups": security_groups, "instances": instances}
+
+
+def expand_inventory(inventory):
+    # Legacy shape: one row per (rule × attached instance)
+    result: Dict[str, dict] = {}
+    for sg_id, sg in inventory["security_groups"].items():
+        attached = [inventory["instances"][i] for i in sg["instance_ids"]] or [None]
+        expanded = {**sg, "inbound_rules": [], "outbound_rules": []}
+        expanded.pop("instance_ids")
+        for direction in ("inbound_rules", "outbound_rules"):
+            for rule in sg[direction]:
+                for inst in attached:
+                    expanded[direction].append({
+                        **rule,
+                        "instance_id": inst["instance_id"] if inst else None,
+                        "instance_name": inst["instance_name"] if inst else None,
+                        "private_ip": inst["private_ip"] if inst else None,
+                        "public_ip": inst["public_ip"] if inst else None,
+                    })
+        result[sg_id] = expanded
+    return result
 
 
-@app.get("/", response_model=Dict[str, GroupedSecurityGroupModel])
-def list_security_groups(
-    region: str = Query("ap-northeast-2"),
-    x_session_id: str = Header(None)):
+def session_account(session):
+    # Sessions created before AccountId was recorded fall back to their access key
+    return session.get("AccountId") or session["AccessKeyId"]
+
+
+def collect_inventory(session, region, fresh=False):
+    if estate_client is not None:
+        return collect_estate_inventory(session, region, fresh)
+
+    ec2 = get_client("ec2", region, credentials=session)
+
+    # Describe SGs, every page
+    try:
+        security_groups = [
+            sg
+            for page in ec2.get_paginator("describe_security_groups").paginate()
+            for sg in page.get("SecurityGroups", [])
+        ]
+    except ClientError as e:
+        logger.error(f"Error describing security groups: {e}")
+        raise HTTPException(status_code=500, detail="Failed to describe security groups from AWS.")
+
+    # Describe EC2 instances, every page
+    try:
+        reservations = [
+            reservation
+            for page in ec2.get_paginator("describe_instances").paginate()
+            for reservation in page.get("Reservations", [])
+        ]
+    except ClientError as e:
+        logger.error(f"Error describing instances: {e}")
+        raise HTTPException(status_code=500, detail="Failed to describe EC2 instances from AWS.")
+
+    return build_inventory({"SecurityGroups": security_groups}, {"Reservations": reservations}, region)
+
+
+def collect_estate_inventory(session, region, fresh=False):
+    """collect_inventory() over the aggregator's shared crawl of the session's account."""
+    max_age = 0 if fresh else ESTATE_MAX_AGE_SECONDS
+    try:
+        estate = estate_client.fetch(
+            region, ["security_groups", "instances"], session.get("SessionId"), max_age
+        )["collections"]
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error fetching the shared inventory crawl: {e}")
+        raise HTTPException(status_code=502, detail="Failed to fetch security groups from the inventory service.")
+    return build_inventory(
+        {"SecurityGroups": estate["security_groups"]},
+        {"Reservations": [{"Instances": estate["instances"]}]},
+        region,
+    )
+
+
+def collect_multi_region_inventory(session, region, fresh=False):
+    results, status = fan_out(
+        resolve_regions(region, credentials=session),
+        lambda r: collect_inventory(session, r, fresh)
+    )
+    merged = {"security_groups": {}, "instances": {}, "regions": status}
+    for name, inventory in results.items():
+        if inventory is None:
+            logger.error(f"Failed to list security groups in {name}: {status[name]['error']}")
+            continue
+        record_history(session, name, inventory)
+        merged["security_groups"].update(inventory["security_groups"])
+        merged["instances"].update(inventory["instances"])
+        status[name]["count"] = len(inventory["security_groups"])
+    return merged
+
+
+def rule_values(field):
+    def extract(sg):
+        return [rule[field] for direction in ("inbound_rules", "outbound_rules") for rule in sg[direction]]
+    return extract
+
+
+SG_INDEX_FIELDS = ["vpc_id", "region", "protocol", "port", "account_id"]
+SG_SORT_FIELDS = ["sg_id", "sg_name", "vpc_id", "region", "account_id"]
+
+
+def query_inventory(snapshot, filters, page, response):
+    inventory = snapshot.data
+    index = snapshot.derived("security_group_index", lambda: SnapshotIndex(
+        list(inventory["security_groups"].values()), SG_INDEX_FIELDS, "sg_id",
+        extractors={"protocol": rule_values("protocol"), "port": rule_values("port")},
+    ))
+    criteria = filters.model_dump()
+    criteria["region"] = criteria.pop("sg_region")
+    selected = run_query(index, criteria, page, SG_SORT_FIELDS, response)
+    # Only ship the instances the selected groups refer to
+    instances = inventory["instances"]
+    return {
+        **inventory,
+        "security_groups": {sg["sg_id"]: sg for sg in selected},
+        "instances": {
+            instance_id: instances[instance_id]
+            for sg in selected for instance_id in sg["instance_ids"] if instance_id in instances
+        },
+    }
+
+
+async def resolve_session(x_session_id):
     if not x_session_id:
         raise HTTPException(status_code=401, detail="Missing session ID")
     try:
-        resp = requests.get(f"{AUTH_SERVICE_URL}/session/{x_session_id}")
-        resp.raise_for_status()
-        session = resp.json()
+        # Cache misses go over HTTP to the login service
+        with phase("session"):
+            return await run_io(session_client.resolve, x_session_id)
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=401, detail=f"Failed to fetch session: {e}")
 
-    try:
-        ec2 = boto3.client("ec2", session["Region"], 
-                           aws_access_key_id=session["AccessKeyId"],
-                           aws_secret_access_key=session["SecretAccessKey"],
-                           aws_session_token=session["SessionToken"])
-
-        # Describe SGs
-        try:
-            sg_resp = ec2.describe_security_groups()
-        except ClientError as e:
-            logger.error(f"Error describing security groups: {e}")
-            raise HTTPException(status_code=500, detail="Failed to describe security groups from AWS.")
 
-        # Describe EC2 instances
+async def resolve_group(x_session_group):
+    try:
+        with phase("session"):
+            return await run_io(session_client.resolve_group, x_session_group)
+    except requests.exceptions.RequestException as e:
+        raise HTTPException(status_code=401, detail=f"Failed to fetch session group: {e}")
+
+
+def member_account(member):
+    return member["account_id"] or member["role_arn"]
+
+
+def live_members(group):
+    """Members whose credentials are still usable, keyed by account."""
+    cutoff = time.time() + EXPIRY_SKEW_SECONDS
+    members = {}
+    for member in group["members"]:
+        session = member.get("session")
+        if session is not None and (session_expires_at(session) or float("inf")) > cutoff:
+            members[member_account(member)] = {**member, "session": {**session, "SessionId": member["session_id"]}}
+    return members
+
+
+def record_history(session, region, inventory):
+    scope = session_scope(session)
+    inventory_history.record(
+        (scope, region, "security-groups"),
+        {sg_id: (fingerprint(sg), sg) for sg_id, sg in inventory["security_groups"].items()}
+    )
+    # Only /diff reads the SG history; instances are kept so a stored crawl
+    # can be served as a whole inventory again
+    inventory_history.record(
+        (scope, region, "sg-instances"),
+        {instance_id: (fingerprint(inst), inst) for instance_id, inst in inventory["instances"].items()}
+    )
+
+
+def stored_inventory(session, region, as_of=None):
+    """(inventory, crawled_at) rebuilt from the last crawl, or the one at as_of; None if missing.
+
+    A multi-region restore needs every region; as_of reports missing ones instead.
+    """
+    scope = session_scope(session)
+    regions = resolve_regions(region, credentials=session) if is_multi_region(region) else [region]
+    available = {}
+    for r in regions:
+        groups = inventory_history.stored((scope, r, "security-groups"), as_of)
+        instances = inventory_history.stored((scope, r, "sg-instances"), as_of)
+        if groups is not None and instances is not None:
+            available[r] = (groups, instances)
+    if not available or (as_of is None and len(available) < len(regions)):
+        return None
+
+    inventory = {"security_groups": {}, "instances": {}}
+    for (_, groups), (_, instances) in available.values():
+        inventory["security_groups"].update((sg["sg_id"], sg) for sg in groups)
+        inventory["instances"].update((inst["instance_id"], inst) for inst in instances)
+    if is_multi_region(region):
+        inventory["regions"] = {
+            r: {"region": r, "elapsed_ms": 0.0, "count": len(available[r][0][1]) if r in available else 0,
+                "error": None if r in available else "No stored crawl"}
+            for r in regions
+        }
+    return snapshot_data(INVENTORY_ADAPTER, inventory), min(groups[0] for groups, _ in available.values())
+
+
+def crawl_inventory(session, region, fresh=False):
+    if is_multi_region(region):
+        return snapshot_data(INVENTORY_ADAPTER, collect_multi_region_inventory(session, region, fresh))
+    # Crawl the requested region, not the one the session was created in
+    inventory = collect_inventory(session, region, fresh)
+    record_history(session, region, inventory)
+    return snapshot_data(INVENTORY_ADAPTER, inventory)
+
+
+def scheduled_loader(session_id, region):
+    # Re-resolve on every run: the login service drops sessions once their STS
+    # credentials expire, which takes the target off the schedule
+    def crawl():
         try:
-            instance_resp = ec2.describe_instances()
-        except ClientError as e:
-            logger.error(f"Error describing instances: {e}")
-            raise HTTPException(status_code=500, detail="Failed to describe EC2 instances from AWS.")
-
-        # Map SG → instances
-        sg_to_instances = {}
-        for reservation in instance_resp.get("Reservations", []):
-            for inst in reservation.get("Instances", []):
-                name_tag = next(
-                    (t["Value"] for t in inst.get("Tags", []) if t["Key"] == "Name"),
-                    None
-                )
-                for sg in inst.get("SecurityGroups", []):
-                    sg_id = sg["GroupId"]
-                    sg_to_instances.setdefault(sg_id, []).append({
-                        "instance_id": inst.get("InstanceId"),
-                        "instance_name": name_tag,
-                        "private_ip": inst.get("PrivateIpAddress"),
-                        "public_ip": inst.get("PublicIpAddress")
-                    })
-
-        # Construct result
-        result: Dict[str, dict] = {}
-        for sg in sg_resp["SecurityGroups"]:
-            sg_id = sg["GroupId"]
-            result[sg_id] = {
-                "sg_id": sg_id,
-                "sg_name": sg.get("GroupName", ""),
-                "vpc_id": sg.get("VpcId", ""),
-                "region": region,
-                "inbound_rules": [],
-                "outbound_rules": [],
-                "tags": [TagModel(Key=t["Key"], Value=t["Value"]) for t in sg.get("Tags", [])] if sg.get("Tags") else []
+            session = session_client.resolve(session_id)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                raise TargetExpired(f"session {session_id} is gone") from e
+            raise
+        return crawl_inventory(session, region)
+    return crawl
+
+
+def tag_account(inventory, account_id):
+    return {
+        "security_groups": {
+            sg_id: {**sg, "account_id": account_id} for sg_id, sg in inventory["security_groups"].items()
+        },
+        "instances": {
+            instance_id: {**instance, "account_id": account_id}
+            for instance_id, instance in inventory["instances"].items()
+        },
+    }
+
+
+def collect_group_inventory(group, region, force=False):
+    """Crawl every member account in parallel and merge the account-tagged results.
+
+    Each account keeps its own snapshot (and background re-crawl), so the merge
+    mostly reads warm per-account snapshots.
+    """
+    members = live_members(group)
+
+    def crawl_member(account):
+        member = members[account]
+        session = member["session"]
+        key = (session_scope(session), region, "security-groups")
+        crawl_scheduler.register(
+            key, scheduled_loader(member["session_id"], region), expires_at=session_expires_at(session)
+        )
+        snapshot, _ = snapshot_cache.get(key, lambda: crawl_inventory(session, region, force), force=force)
+        return snapshot.data
+
+    results, status = fan_out(list(members), crawl_member, max_workers=AWS_ACCOUNT_WORKERS)
+    merged = {"security_groups": {}, "instances": {}, "accounts": {}}
+    for member in group["members"]:
+        account = member_account(member)
+        if account not in results:
+            merged["accounts"][account] = {
+                "account_id": account, "role_arn": member["role_arn"],
+                "error": member.get("error") or "Session expired",
             }
+            continue
+        inventory = results[account]
+        entry = merged["accounts"][account] = {
+            "account_id": account, "role_arn": member["role_arn"],
+            "elapsed_ms": status[account]["elapsed_ms"], "error": status[account]["error"],
+        }
+        if inventory is None:
+            logger.error(f"Failed to list security groups in account {account}: {entry['error']}")
+            continue
+        tagged = tag_account(inventory, account)
+        merged["security_groups"].update(tagged["security_groups"])
+        merged["instances"].update(tagged["instances"])
+        entry["count"] = len(tagged["security_groups"])
+    return snapshot_data(INVENTORY_ADAPTER, merged)
+
+
+def stored_group_inventory(group, region, as_of=None):
+    """stored_inventory() merged over the group's live member accounts.
+
+    A restore needs every live member; as_of reports missing ones instead.
+    """
+    members = live_members(group)
+    merged = {"security_groups": {}, "instances": {}, "accounts": {}}
+    crawled = []
+    for member in group["members"]:
+        account = member_account(member)
+        found = stored_inventory(members[account]["session"], region, as_of) if account in members else None
+        entry = merged["accounts"][account] = {"account_id": account, "role_arn": member["role_arn"]}
+        if found is None:
+            if account in members and as_of is None:
+                return None
+            entry["error"] = "No stored crawl" if account in members else member.get("error") or "Session expired"
+            continue
+        inventory, crawled_at = found
+        crawled.append(crawled_at)
+        tagged = tag_account(inventory, account)
+        merged["security_groups"].update(tagged["security_groups"])
+        merged["instances"].update(tagged["instances"])
+        entry["count"] = len(tagged["security_groups"])
+    if not crawled:
+        return None
+    return snapshot_data(INVENTORY_ADAPTER, merged), min(crawled)
+
+
+async def cached_inventory(session_id, session, region, refresh=False):
+    key = (session_scope(session), region, "security-groups")
+    # Every view keeps the target on the background re-crawl schedule
+    crawl_scheduler.register(key, scheduled_loader(session_id, region), expires_at=session_expires_at(session))
+    try:
+        return await cached_snapshot(
+            key, lambda: crawl_inventory(session, region, refresh), force=refresh,
+            restore=lambda: stored_inventory(session, region),
+        )
 
-            # inbound rules
-            for rule in sg.get("IpPermissions", []):
-                proto = "All" if rule.get("IpProtocol") == "-1" else rule.get("IpProtocol", "All")
-                port = str(rule.get("FromPort", "All")) if "FromPort" in rule else "All"
-                for ip_range in rule.get("IpRanges", []):
-                    cidr = ip_range.get("CidrIp", "")
-                    instances = sg_to_instances.get(sg_id, [None]) or [None]
-                    for inst in instances:
-                        result[sg_id]["inbound_rules"].append({
-                            "protocol": proto,
-                            "port": port,
-                            "cidr": cidr,
-                            "instance_id": inst["instance_id"] if inst else None,
-                            "instance_name": inst["instance_name"] if inst else None,
-                            "private_ip": inst["private_ip"] if inst else None,
-                            "public_ip": inst["public_ip"] if inst else None,
-                        })
-
-            # outbound rules
-            for rule in sg.get("IpPermissionsEgress", []):
-                proto = "All" if rule.get("IpProtocol") == "-1" else rule.get("IpProtocol", "All")
-                port = str(rule.get("FromPort", "All")) if "FromPort" in rule else "All"
-                for ip_range in rule.get("IpRanges", []):
-                    cidr = ip_range.get("CidrIp", "")
-                    instances = sg_to_instances.get(sg_id, [None]) or [None]
-                    for inst in instances:
-                        result[sg_id]["outbound_rules"].append({
-                            "protocol": proto,
-                            "port": port,
-                            "cidr": cidr,
-                            "instance_id": inst["instance_id"] if inst else None,
-                            "instance_name": inst["instance_name"] if inst else None,
-                            "private_ip": inst["private_ip"] if inst else None,
-                            "public_ip": inst["public_ip"] if inst else None,
-                        })
-
-        return result
+    except HTTPException:
+        raise
 
     # AWS credential errors
     except NoCredentialsError:
@@ -216,48 +613,206 @@ def list_security_groups(
         raise HTTPException(status_code=500, detail="An unexpected error occurred while listing security groups.")
 
 
+async def cached_group_inventory(group_id, group, region, refresh=False):
+    key = (f"group:{group_id}", region, "security-groups")
+    try:
+        return await cached_snapshot(
+            key, lambda: collect_group_inventory(group, region, refresh), force=refresh,
+            restore=lambda: stored_group_inventory(group, region),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Unexpected error while listing security groups for group {group_id}: {e}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred while listing security groups.")
 
-# @app.post("/export/csv")
-# def export_security_groups_csv(req: ExportRequest = Body(...)):
-#     region = req.region
-#     ec2 = boto3.client("ec2", region_name=region, aws_access_key_id="test", aws_secret_access_key="test")
-#     resp = ec2.describe_security_groups()
-
-#     output = io.StringIO()
-#     writer = csv.writer(output)
-#     writer.writerow([
-#         "sg_id", "name", "vpc_id", "region", "direction", "protocol", "port", "cidr"
-#     ])
-
-#     for sg in resp["SecurityGroups"]:
-#         sg_id = sg["GroupId"]
-#         name = sg.get("GroupName", "")
-#         vpc_id = sg.get("VpcId", "")
-#         # Inbound rules
-#         for rule in sg.get("IpPermissions", []):
-#             proto = rule.get("IpProtocol", "All")
-#             if proto == "-1":
-#                 proto = "All"
-#             from_port = rule.get("FromPort", "All") if "FromPort" in rule else "All"
-#             for ip_range in rule.get("IpRanges", []):
-#                 writer.writerow([
-#                     sg_id, name, vpc_id, region, "inbound", proto, str(from_port), ip_range.get("CidrIp", "")
-#                 ])
-#         # Outbound rules
-#         for rule in sg.get("IpPermissionsEgress", []):
-#             proto = rule.get("IpProtocol", "All")
-#             if proto == "-1":
-#                 proto = "All"
-#             from_port = rule.get("FromPort", "All") if "FromPort" in rule else "All"
-#             for ip_range in rule.get("IpRanges", []):
-#                 writer.writerow([
-#                     sg_id, name, vpc_id, region, "outbound", proto, str(from_port), ip_range.get("CidrIp", "")
-#                 ])
-
-#     output.seek(0)
-#     filename = f"security_groups_{region}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-#     return StreamingResponse(
-#         output,
-#         media_type="text/csv",
-#         headers={"Content-Disposition": f"attachment; filename={filename}"}
-#     )
\ No newline at end of file
+
+async def request_inventory(x_session_id, x_session_group, region, refresh=False, as_of=None):
+    """Inventory for one session, or merged over every account of X-Session-Group.
+
+    With as_of, the stored crawl from that time is served instead of the cache.
+    Returns (sessions crawled, snapshot, cache status).
+    """
+    if x_session_group:
+        group = await resolve_group(x_session_group)
+        if as_of is not None:
+            snapshot, status = await stored_snapshot(lambda t: stored_group_inventory(group, region, t), as_of)
+        else:
+            snapshot, status = await cached_group_inventory(x_session_group, group, region, refresh)
+        return [m["session"] for m in live_members(group).values()], snapshot, status
+    session = await resolve_session(x_session_id)
+    if as_of is not None:
+        snapshot, status = await stored_snapshot(lambda t: stored_inventory(session, region, t), as_of)
+    else:
+        snapshot, status = await cached_inventory(x_session_id, session, region, refresh)
+    return [session], snapshot, status
+
+
+INVENTORY_ADAPTER = TypeAdapter(SecurityGroupInventoryModel)
+EXPANDED_ADAPTER = TypeAdapter(Dict[str, GroupedSecurityGroupModel])
+EXPOSURE_ADAPTER = TypeAdapter(ExposureModel)
+DIFF_ADAPTER = TypeAdapter(SecurityGroupDiffModel)
+
+
+def select_inventory(snapshot, filters, page, expand, response):
+    inventory = snapshot.data
+    if page.requested() or any(v is not None for v in filters.model_dump().values()):
+        inventory = query_inventory(snapshot, filters, page, response)
+    if expand:
+        return expand_inventory(inventory)
+    return inventory
+
+
+@app.get("/", response_model=Union[SecurityGroupInventoryModel, Dict[str, GroupedSecurityGroupModel]])
+async def list_security_groups(
+    request: Request,
+    response: Response,
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+    expand: bool = Query(False, description="Return one row per rule × attached instance"),
+    refresh: bool = Query(False, description="Bypass the snapshot cache and crawl now"),
+    as_of: Optional[float] = Query(None, description="Epoch seconds; serve the inventory as it was then"),
+    filters: FilterRequest = Depends(),
+    page: PageRequest = Depends(),
+    x_session_id: str = Header(None),
+    x_session_group: str = Header(None, description="Session group from the login service's POST /batch")):
+    _, snapshot, status = await request_inventory(x_session_id, x_session_group, region, refresh, as_of)
+    cache_headers(response, snapshot, status)
+    unchanged = await not_modified(request, response, snapshot)
+    if unchanged is not None:
+        return unchanged
+    inventory = await transform(select_inventory, snapshot, filters, page, expand, response)
+    # Expanded rows are reshaped per request, so they are still validated
+    if expand:
+        return await json_response(response, EXPANDED_ADAPTER, inventory)
+    return await json_response(response, INVENTORY_ADAPTER, inventory, validated=True)
+
+
+def exposure_matches(snapshot, criteria, response):
+    inventory = snapshot.data
+    index = snapshot.derived(
+        "exposure_index", lambda: ExposureIndex(inventory["security_groups"].values())
+    )
+
+    start = time.perf_counter()
+    try:
+        rule_ids = index.match(
+            criteria.direction, criteria.protocol, criteria.port,
+            criteria.cidr, criteria.source_group, criteria.match,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cidr: {e}")
+    response.headers["Server-Timing"] = f"query;dur={(time.perf_counter() - start) * 1000:.3f}"
+
+    matches = []
+    instance_ids = set()
+    for rule_id in rule_ids:
+        sg, direction, rule = index.rules[rule_id]
+        matches.append({
+            "sg_id": sg["sg_id"],
+            "sg_name": sg["sg_name"],
+            "vpc_id": sg["vpc_id"],
+            "region": sg["region"],
+            "direction": direction,
+            "rule": rule,
+            "instance_ids": sg["instance_ids"],
+            "account_id": sg.get("account_id"),
+        })
+        instance_ids.update(sg["instance_ids"])
+    instances = inventory["instances"]
+    return {
+        "matches": matches,
+        "instances": {i: instances[i] for i in sorted(instance_ids) if i in instances},
+    }
+
+
+@app.get("/exposure", response_model=ExposureModel)
+async def security_group_exposure(
+    request: Request,
+    response: Response,
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+    criteria: ExposureRequest = Depends(),
+    as_of: Optional[float] = Query(None, description="Epoch seconds; match against the inventory as it was then"),
+    x_session_id: str = Header(None),
+    x_session_group: str = Header(None)):
+    _, snapshot, status = await request_inventory(x_session_id, x_session_group, region, as_of=as_of)
+    cache_headers(response, snapshot, status)
+    unchanged = await not_modified(request, response, snapshot)
+    if unchanged is not None:
+        return unchanged
+    matches = await transform(exposure_matches, snapshot, criteria, response)
+    return await json_response(response, EXPOSURE_ADAPTER, matches, validated=True)
+
+
+def account_diff(session, region, since, tag):
+    regions = resolve_regions(region, credentials=session) if is_multi_region(region) else [region]
+    account = session_account(session)
+    diff = merge_diffs(
+        [inventory_history.diff((session_scope(session), r, "security-groups"), since) for r in regions],
+        since
+    )
+    if tag:
+        for change in ("added", "modified"):
+            diff[change] = [{**sg, "account_id": account} for sg in diff[change]]
+    return diff
+
+
+def inventory_diff(sessions, region, since, snapshot, tag_accounts=False):
+    diff = merge_diffs([account_diff(session, region, since, tag_accounts) for session in sessions], since)
+    instances = snapshot.data["instances"]
+    diff["instances"] = {
+        instance_id: instances[instance_id]
+        for sg in diff["added"] + diff["modified"]
+        for instance_id in sg["instance_ids"]
+        if instance_id in instances
+    }
+    return diff
+
+
+@app.get("/diff", response_model=SecurityGroupDiffModel)
+async def diff_security_groups(
+    response: Response,
+    since: float = Query(..., description="Epoch seconds of the snapshot the client already has"),
+    region: str = Query("ap-northeast-2", description="Region, comma-separated regions, or 'all'"),
+    x_session_id: str = Header(None),
+    x_session_group: str = Header(None)):
+    sessions, snapshot, status = await request_inventory(x_session_id, x_session_group, region)
+    cache_headers(response, snapshot, status)
+    diff = await transform(inventory_diff, sessions, region, since, snapshot, bool(x_session_group))
+    return await json_response(response, DIFF_ADAPTER, diff)
+
+
+
+EXPORT_COLUMNS = ["sg_id", "name", "vpc_id", "region", "direction", "protocol", "port", "cidr"]
+
+
+def export_rows(session, regions):
+    # Rows are produced page by page from the describe_security_groups paginator
+    for region in regions:
+        ec2 = get_client("ec2", region, credentials=session)
+        for page in ec2.get_paginator("describe_security_groups").paginate():
+            for sg in page.get("SecurityGroups", []):
+                sg_id = sg["GroupId"]
+                name = sg.get("GroupName", "")
+                vpc_id = sg.get("VpcId", "")
+                for direction, key in (("inbound", "IpPermissions"), ("outbound", "IpPermissionsEgress")):
+                    for rule in rule_rows(sg.get(key, [])):
+                        yield [sg_id, name, vpc_id, region, direction, rule["protocol"], rule["port"], rule["cidr"]]
+
+
+@app.post("/export/{fmt}")
+async def export_security_groups(
+    fmt: str = Path(..., pattern="^(csv|xlsx)$"),
+    req: ExportRequest = Body(...),
+    x_session_id: str = Header(None)):
+    session = await resolve_session(x_session_id)
+    if is_multi_region(req.region):
+        regions = await run_io(resolve_regions, req.region, credentials=session)
+    else:
+        regions = [req.region]
+    return export_response(
+        fmt,
+        EXPORT_COLUMNS,
+        export_rows(session, regions),
+        f"security_groups_{req.region.replace(',', '_')}",
+        compress=req.compress,
+    )
@@ -0,0 +1,11 @@
+# tests/conftest.py
+# The shared backend code lives in services/common and is imported as
+# `common.*`, exactly as inside the service images.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = os.path.join(ROOT, "services")
+
+if SERVICES not in sys.path:
+    sys.path.insert(0, SERVICES)
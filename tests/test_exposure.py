@@ -0,0 +1,282 @@
+import importlib.util
+import ipaddress
+import itertools
+import os
+import random
+
+import pytest
+
+from conftest import SERVICES
+
+# Every service ships its own `app` package, so load the module by path
+# instead of putting security-groups/ on sys.path
+spec = importlib.util.spec_from_file_location(
+    "sg_exposure", os.path.join(SERVICES, "security-groups", "app", "exposure.py")
+)
+exposure = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(exposure)
+
+CONTAINS, OVERLAPS = exposure.CONTAINS, exposure.OVERLAPS
+ExposureIndex, PortIntervalIndex, PrefixIndex = exposure.ExposureIndex, exposure.PortIntervalIndex, exposure.PrefixIndex
+
+PORTS = [(22, 22), (80, 80), (443, 443), (0, 0), (65535, 65535), (1024, 65535), (0, 1023), (8000, 8080), None]
+CIDRS = [
+    "0.0.0.0/0", "10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "10.1.2.3/32", "192.168.0.0/16", "203.0.113.7/32",
+    "::/0", "2001:db8::/32", "2001:db8:1::/48", "2001:db8:1::1/128", "fd00::/8",
+    "pl-0123456789abcdef0",  # prefix-list sources are not CIDRs
+]
+GROUPS = ["sg-a", "sg-b", "sg-c"]
+
+PORT_QUERIES = [None, 0, 1, 22, 23, 80, 443, 1023, 1024, 8080, 65534, 65535]
+CIDR_QUERIES = [
+    None, "0.0.0.0/0", "10.0.0.0/8", "10.1.2.0/24", "10.1.2.3", "10.1.2.3/32", "10.200.0.0/16", "172.16.0.0/12",
+    "::/0", "2001:db8::/32", "2001:db8:1::/64", "2001:db8:1::1", "2001:db9::/32",
+]
+
+
+# What each IpProtocol means for port queries, written out independently of
+# exposure.py: None = no ports, "all" = every port, "ports" = from_port..to_port
+PROTOCOL_PORTS = {
+    "All": "all", "-1": "all", "tcp": "ports", "TCP": "ports", "6": "ports", "udp": "ports", "17": "ports",
+    "icmp": None, "1": None, "icmpv6": None, "58": None, "50": None,
+}
+PROTOCOL_ALIASES = {"tcp": {"tcp", "6"}, "udp": {"udp", "17"}, "icmp": {"icmp", "1"}}
+
+
+def compact_rule(rng):
+    # Same shape as rule_rows() in security-groups/app/main.py, plus the raw
+    # protocol numbers and ICMP type/code ranges that older snapshots carry
+    protocol = rng.choice(list(PROTOCOL_PORTS))
+    if PROTOCOL_PORTS[protocol] == "ports":
+        from_port, to_port = rng.choice(PORTS) or (None, None)
+    elif PROTOCOL_PORTS[protocol] is None and rng.random() < 0.5:
+        from_port, to_port = rng.choice([(8, 65535), (0, 65535), (3, 4)])  # ICMP type-code
+    else:
+        from_port, to_port = None, None
+    rule = {"protocol": protocol, "from_port": from_port, "to_port": to_port}
+    if rng.random() < 0.25:
+        group = rng.choice(GROUPS)
+        return {**rule, "cidr": group, "source_group": group}
+    return {**rule, "cidr": rng.choice(CIDRS)}
+
+
+def covers_port(rule, port):
+    kind = PROTOCOL_PORTS[rule["protocol"]]
+    if kind is None:
+        return False
+    if kind == "all" or rule["from_port"] is None:
+        return True
+    return rule["from_port"] <= port <= rule["to_port"]
+
+
+def covers_protocol(rule, protocol):
+    if PROTOCOL_PORTS[rule["protocol"]] == "all":
+        return True
+    names = PROTOCOL_ALIASES.get(protocol.lower(), {protocol.lower()})
+    return rule["protocol"].lower() in names
+
+
+def make_groups(count=40, seed=3):
+    rng = random.Random(seed)
+    return [
+        {
+            "sg_id": f"sg-{n:03d}",
+            "inbound_rules": [compact_rule(rng) for _ in range(rng.randint(0, 8))],
+            "outbound_rules": [compact_rule(rng) for _ in range(rng.randint(0, 3))],
+        }
+        for n in range(count)
+    ]
+
+
+def all_rules(groups):
+    # In ExposureIndex rule id order
+    return [
+        (sg, direction, rule)
+        for sg in groups for direction in ("inbound", "outbound") for rule in sg[f"{direction}_rules"]
+    ]
+
+
+def network_of(rule):
+    try:
+        return ipaddress.ip_network(rule["cidr"], strict=False)
+    except ValueError:
+        return None
+
+
+def brute_force(groups, direction="inbound", protocol=None, port=None, cidr=None, source_group=None, mode=CONTAINS):
+    query = ipaddress.ip_network(cidr, strict=False) if cidr is not None else None
+    matched = []
+    for rule_id, (_, rule_direction, rule) in enumerate(all_rules(groups)):
+        if rule_direction != direction:
+            continue
+        if protocol is not None and not covers_protocol(rule, protocol):
+            continue
+        if port is not None and not covers_port(rule, port):
+            continue
+        if source_group is not None and (cidr is not None or rule.get("source_group") != source_group):
+            continue
+        if query is not None:
+            network = None if rule.get("source_group") else network_of(rule)
+            if network is None or network.version != query.version:
+                continue
+            if mode == CONTAINS and not query.subnet_of(network):
+                continue
+            if mode == OVERLAPS and not network.overlaps(query):
+                continue
+        matched.append(rule_id)
+    return matched
+
+
+@pytest.fixture(scope="module")
+def groups():
+    return make_groups()
+
+
+@pytest.fixture(scope="module")
+def index(groups):
+    return ExposureIndex(groups)
+
+
+def test_rule_interval():
+    assert exposure.rule_interval({"protocol": "All", "from_port": None, "to_port": None}) == (0, 65535)
+    assert exposure.rule_interval({"protocol": "-1", "from_port": None, "to_port": None}) == (0, 65535)
+    assert exposure.rule_interval({"protocol": "tcp", "from_port": None, "to_port": None}) == (0, 65535)
+    assert exposure.rule_interval({"protocol": "tcp", "from_port": 22, "to_port": 22}) == (22, 22)
+    assert exposure.rule_interval({"protocol": "17", "from_port": 53, "to_port": 53}) == (53, 53)
+    # ICMP type 8 with any code is not a port range
+    assert exposure.rule_interval({"protocol": "icmp", "from_port": 8, "to_port": 65535}) is None
+    assert exposure.rule_interval({"protocol": "1", "from_port": None, "to_port": None}) is None
+    assert exposure.rule_interval({"protocol": "50", "from_port": None, "to_port": None}) is None
+
+
+def rule_group(*rules):
+    return [{"sg_id": "sg-1", "inbound_rules": list(rules), "outbound_rules": []}]
+
+
+def test_icmp_rules_never_match_port_queries():
+    index = ExposureIndex(rule_group(
+        {"protocol": "icmp", "from_port": 8, "to_port": 65535, "cidr": "0.0.0.0/0"},
+        {"protocol": "1", "from_port": 0, "to_port": 65535, "cidr": "0.0.0.0/0"},
+        {"protocol": "icmpv6", "from_port": None, "to_port": None, "cidr": "::/0"},
+        {"protocol": "tcp", "from_port": 22, "to_port": 22, "cidr": "0.0.0.0/0"},
+    ))
+
+    assert index.match(port=22) == [3]
+    assert index.match(port=8) == []
+    assert index.match(protocol="icmp") == [0, 1]
+    assert index.match(protocol="icmp", cidr="10.0.0.1") == [0, 1]
+
+
+def test_numeric_protocols_match_their_names():
+    index = ExposureIndex(rule_group(
+        {"protocol": "6", "from_port": 22, "to_port": 22, "cidr": "0.0.0.0/0"},
+        {"protocol": "17", "from_port": 53, "to_port": 53, "cidr": "0.0.0.0/0"},
+        {"protocol": "-1", "from_port": None, "to_port": None, "cidr": "10.0.0.0/8"},
+        {"protocol": "TCP", "from_port": 443, "to_port": 443, "cidr": "0.0.0.0/0"},
+    ))
+
+    assert index.match(protocol="tcp") == [0, 2, 3]
+    assert index.match(protocol="6") == [0, 2, 3]
+    assert index.match(protocol="udp", port=53) == [1, 2]
+    assert index.match(protocol="tcp", port=22) == [0, 2]
+    assert index.match(port=22, cidr="10.1.2.3") == [0, 2]
+    assert index.match(protocol="icmp") == [2]
+
+
+def test_port_index_edges():
+    tree = PortIntervalIndex([(22, 22, "ssh"), (0, 65535, "all"), (0, 0, "zero"), (65535, 65535, "top")])
+
+    assert sorted(tree.stab(22)) == ["all", "ssh"]
+    assert tree.stab(21) == ["all"]
+    assert tree.stab(23) == ["all"]
+    assert sorted(tree.stab(0)) == ["all", "zero"]
+    assert sorted(tree.stab(65535)) == ["all", "top"]
+    assert tree.stab(-1) == []
+    assert tree.stab(65536) == []
+
+
+def test_port_index_matches_brute_force():
+    rng = random.Random(11)
+    intervals = []
+    for value in range(200):
+        low = rng.choice([0, 65535, rng.randint(0, 65535)])
+        high = rng.choice([low, 65535, min(65535, low + rng.randint(0, 2000))])
+        intervals.append((low, high, value))
+    tree = PortIntervalIndex(intervals)
+    # Every interval edge and its neighbours, plus the range ends
+    ports = {-1, 0, 1, 65534, 65535, 65536}
+    for low, high, _ in intervals:
+        ports.update((low - 1, low, high, high + 1))
+
+    for port in sorted(ports):
+        assert sorted(tree.stab(port)) == [value for low, high, value in intervals if low <= port <= high]
+
+
+def test_empty_port_index():
+    assert PortIntervalIndex([]).stab(22) == []
+
+
+@pytest.mark.parametrize("query", [
+    "0.0.0.0/0", "10.0.0.0/8", "10.1.2.3/32", "10.1.2.0/24", "192.0.2.0/24",
+    "::/0", "2001:db8::/32", "2001:db8:1::1/128", "fe80::/10",
+])
+def test_prefix_index_matches_brute_force(query):
+    networks = [ipaddress.ip_network(cidr) for cidr in CIDRS if not cidr.startswith("pl-")]
+    prefixes = PrefixIndex()
+    for value, network in enumerate(networks):
+        prefixes.add(network, value)
+    prefixes.freeze()
+    query = ipaddress.ip_network(query)
+    same_version = [(value, network) for value, network in enumerate(networks) if network.version == query.version]
+
+    assert sorted(prefixes.supernets(query)) == [value for value, network in same_version if query.subnet_of(network)]
+    assert sorted(prefixes.subnets(query)) == [
+        value for value, network in same_version if network.subnet_of(query) and network != query
+    ]
+
+
+def test_slash_zero_rules_contain_every_address_of_their_version_only(groups, index):
+    open_v4 = {
+        rule_id for rule_id, (_, _, rule) in enumerate(all_rules(groups)) if rule["cidr"] == "0.0.0.0/0"
+    }
+    open_v6 = {rule_id for rule_id, (_, _, rule) in enumerate(all_rules(groups)) if rule["cidr"] == "::/0"}
+    assert open_v4 and open_v6
+
+    for direction in ("inbound", "outbound"):
+        v4 = set(index.match(direction, cidr="203.0.113.99/32"))
+        v6 = set(index.match(direction, cidr="2001:db8:ffff::1/128"))
+        assert {r for r in open_v4 if all_rules(groups)[r][1] == direction} <= v4
+        assert {r for r in open_v6 if all_rules(groups)[r][1] == direction} <= v6
+        assert not v4 & open_v6
+        assert not v6 & open_v4
+
+
+@pytest.mark.parametrize("mode", [CONTAINS, OVERLAPS])
+@pytest.mark.parametrize("direction", ["inbound", "outbound"])
+@pytest.mark.parametrize("protocol", [None, "tcp", "UDP"])
+def test_match_agrees_with_brute_force(groups, index, mode, direction, protocol):
+    for port, cidr in itertools.product(PORT_QUERIES, CIDR_QUERIES):
+        criteria = dict(direction=direction, protocol=protocol, port=port, cidr=cidr, mode=mode)
+        assert index.match(**criteria) == brute_force(groups, **criteria), criteria
+
+
+@pytest.mark.parametrize("source_group", GROUPS + ["sg-unknown"])
+@pytest.mark.parametrize("port", [None, 22, 65535])
+def test_group_pair_rules_match_by_source_group(groups, index, source_group, port):
+    for direction, protocol in itertools.product(("inbound", "outbound"), (None, "tcp")):
+        criteria = dict(direction=direction, protocol=protocol, port=port, source_group=source_group)
+        found = index.match(**criteria)
+        assert found == brute_force(groups, **criteria), criteria
+        assert all(all_rules(groups)[rule_id][2]["source_group"] == source_group for rule_id in found)
+
+
+def test_group_pair_and_cidr_together_match_nothing(index):
+    assert index.match(cidr="0.0.0.0/0", source_group="sg-a") == []
+
+
+def test_cidr_queries_skip_group_pairs_and_prefix_lists(groups, index):
+    rules = all_rules(groups)
+    found = index.match("inbound", cidr="0.0.0.0/0", mode=OVERLAPS)
+    assert found
+    assert all(not rules[rule_id][2].get("source_group") for rule_id in found)
+    assert all(not rules[rule_id][2]["cidr"].startswith("pl-") for rule_id in found)
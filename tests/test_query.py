@@ -0,0 +1,123 @@
+import base64
+import json
+import random
+
+import pytest
+from fastapi import HTTPException
+
+from common.query import SnapshotIndex, encode_cursor, normalize, sort_key
+
+
+def make_items(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"i-{n:05d}",
+            "state": rng.choice(["running", "stopped", "pending"]),
+            "zone": rng.choice(["a", "b", "c", "d", "e", "f", "g", "h", "i", "j"]),
+            "size": rng.choice([None, 1, 2, 2.5, 8, 64]),
+        }
+        for n in range(count)
+    ]
+
+
+def matches(item, field, value):
+    # A list value matches any of its members, as in SnapshotIndex.positions
+    members = value if isinstance(value, list) else [value]
+    return normalize(item[field]) in {normalize(member) for member in members}
+
+
+def brute_force(items, filters, sort, descending):
+    matched = [item for item in items if all(matches(item, field, value) for field, value in filters.items())]
+    return sorted(matched, key=lambda item: sort_key(item[sort]) + (item["id"],), reverse=descending)
+
+
+def read_all_pages(index, filters, sort, descending, limit):
+    pages, cursor = [], None
+    while True:
+        items, total, cursor = index.query(filters, sort, descending, limit, cursor)
+        pages.append(items)
+        if cursor is None:
+            return [item for page in pages for item in page], total, pages
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"state": "running"},
+    {"zone": "c"},  # sparse: sorted from the postings
+    {"state": "stopped", "zone": "a"},
+    {"zone": "nowhere"},
+    {"zone": ["a", "b"]},
+])
+@pytest.mark.parametrize("sort", ["id", "size", "state"])
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 7, 1000])
+def test_pages_match_brute_force(filters, sort, descending, limit):
+    items = make_items(300)
+    index = SnapshotIndex(items, ["state", "zone"], "id")
+    expected = brute_force(items, filters, sort, descending)
+
+    found, total, pages = read_all_pages(index, filters, sort, descending, limit)
+
+    assert found == expected
+    assert total == len(expected)
+    assert all(len(page) <= limit for page in pages)
+
+
+def test_without_limit_returns_everything_after_the_cursor():
+    items = make_items(50)
+    index = SnapshotIndex(items, ["state"], "id")
+    first, _, cursor = index.query({}, "id", limit=10)
+    rest, total, next_cursor = index.query({}, "id", cursor=cursor)
+
+    assert first + rest == brute_force(items, {}, "id", False)
+    assert total == 50
+    assert next_cursor is None
+
+
+def test_sort_order_is_built_once_per_field():
+    index = SnapshotIndex(make_items(20), ["state"], "id")
+    index.query({}, "size", limit=5)
+    cached = index.order("size")
+    index.query({"state": "running"}, "size", limit=5)
+
+    assert index.order("size") is cached
+
+
+def raw_cursor(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw_cursor("not json"),
+    raw_cursor("[1, 2]"),
+    encode_cursor(["1", 8, "i-00001"]),  # string rank
+    encode_cursor([1.0, 8, "i-00001"]),
+    encode_cursor([True, 8, "i-00001"]),
+    encode_cursor([3, 8, "i-00001"]),
+    encode_cursor([1, "8", "i-00001"]),  # string value with the number rank
+    encode_cursor([1, True, "i-00001"]),
+    encode_cursor([2, 8, "i-00001"]),  # number value with the string rank
+    encode_cursor([2, ["a"], "i-00001"]),
+    encode_cursor([0, 5, "i-00001"]),
+    encode_cursor([1, 8, 1]),  # non-string id
+    encode_cursor([1, 8, None]),
+])
+@pytest.mark.parametrize("sort", ["size", "state"])
+def test_malformed_cursor_is_rejected(cursor, sort):
+    index = SnapshotIndex(make_items(20), ["state"], "id")
+
+    with pytest.raises(HTTPException) as raised:
+        index.query({}, sort, limit=5, cursor=cursor)
+    assert raised.value.status_code == 400
+    assert raised.value.detail == "Invalid cursor"
+
+
+def test_cursor_of_a_null_value_is_accepted():
+    items = make_items(50)
+    index = SnapshotIndex(items, ["state"], "id")
+    page, _, _ = index.query({}, "size", cursor=encode_cursor([0, None, "i-00010"]))
+
+    after = [item for item in brute_force(items, {}, "size", False) if item["size"] is not None or item["id"] > "i-00010"]
+    assert page == after
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from common.session_client import SessionClient
+
+
+class SlowClient(SessionClient):
+    """Answers every lookup with `session` once `release` is set."""
+
+    def __init__(self, session):
+        super().__init__("http://auth.invalid")
+        self.session = session
+        self.release = threading.Event()
+        self.fetches = 0
+
+    def _fetch(self, path):
+        self.fetches += 1
+        self.release.wait(5)
+        return self.session
+
+
+def resolve_concurrently(client, count):
+    results = []
+
+    def worker():
+        try:
+            results.append(client.resolve("abc"))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    while not client._inflight:
+        pass
+    client.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in threads), "a waiter never got an answer"
+    return results
+
+
+def test_concurrent_lookups_share_one_fetch():
+    client = SlowClient({"AccessKeyId": "AKIA", "Expiration": "2099-01-01T00:00:00+00:00"})
+    results = resolve_concurrently(client, 8)
+    assert client.fetches == 1
+    assert all(result["AccessKeyId"] == "AKIA" and result["SessionId"] == "abc" for result in results)
+    # Cached afterwards
+    assert client.resolve("abc")["AccessKeyId"] == "AKIA"
+    assert client.fetches == 1
+
+
+def test_waiters_get_the_error_when_the_session_cannot_be_cached():
+    client = SlowClient({"AccessKeyId": "AKIA", "Expiration": "not a timestamp"})
+    results = resolve_concurrently(client, 8)
+    assert len(results) == 8
+    assert all(isinstance(result, ValueError) for result in results)
+    assert not client._inflight
+
+
+def test_fetch_errors_reach_every_waiter():
+    client = SlowClient(None)
+
+    def failing_fetch(path):
+        client.release.wait(5)
+        raise ConnectionError("auth service down")
+
+    client._fetch = failing_fetch
+    results = resolve_concurrently(client, 4)
+    assert all(isinstance(result, ConnectionError) for result in results)
+    with pytest.raises(ConnectionError):
+        client.release.set()
+        client.resolve("abc")
@@ -0,0 +1,143 @@
+import pytest
+
+from common.snapshot_store import SQLiteSnapshotStore
+
+KEY = ("123456789012", "eu-west-1", "security-groups")
+WEB = {"sg_id": "sg-web", "tags": [{"Key": "env", "Value": "prod"}, {"Key": "team", "Value": "web"}]}
+DB = {"sg_id": "sg-db", "tags": [{"Key": "env", "Value": "prod"}]}
+DB_CHANGED = {"sg_id": "sg-db", "tags": [{"Key": "env", "Value": "prod"}, {"Key": "pci", "Value": "yes"}]}
+
+
+def crawl(store, items, taken_at, key=KEY):
+    # The fingerprint stands in for the hash of the raw AWS record
+    store.record(key, {item["sg_id"]: (repr(item), item) for item in items}, taken_at)
+    store.flush()
+
+
+def count(store, table, where=""):
+    return store._conn().execute(f"SELECT COUNT(*) FROM {table} {where}").fetchone()[0]
+
+
+def items_at(store, as_of=None, key=KEY):
+    found = store.entries(key, as_of)
+    return None if found is None else (found[0], {rid: item for rid, (_, item) in found[1].items()})
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "snapshots.db")
+
+
+@pytest.fixture
+def store(path):
+    return SQLiteSnapshotStore(path)
+
+
+def test_unchanged_recrawl_adds_only_a_crawl_row(store):
+    crawl(store, [WEB, DB], 1000.0)
+    tables = {table: count(store, table) for table in ("records", "parts", "versions")}
+
+    crawl(store, [WEB, DB], 2000.0)
+
+    assert {table: count(store, table) for table in tables} == tables
+    assert count(store, "crawls") == 2
+    assert count(store, "versions", "WHERE valid_to IS NOT NULL") == 0
+
+
+def test_new_fingerprint_with_identical_record_keeps_the_version(store):
+    crawl(store, [WEB], 1000.0)
+    store.record(KEY, {"sg-web": ("refetched", WEB)}, 2000.0)
+    store.flush()
+
+    assert count(store, "versions") == 1
+    assert count(store, "crawls") == 2
+
+
+def test_changed_resource_closes_its_version(store):
+    crawl(store, [WEB, DB], 1000.0)
+    crawl(store, [WEB, DB_CHANGED], 2000.0)
+
+    rows = store._conn().execute(
+        "SELECT valid_from, valid_to FROM versions WHERE resource_id = 'sg-db' ORDER BY valid_from"
+    ).fetchall()
+    assert rows == [(1000.0, 2000.0), (2000.0, None)]
+    assert count(store, "versions", "WHERE resource_id = 'sg-web' AND valid_to IS NULL") == 1
+
+
+def test_removed_resource_closes_its_version(store):
+    crawl(store, [WEB, DB], 1000.0)
+    crawl(store, [WEB], 2000.0)
+
+    rows = store._conn().execute("SELECT valid_from, valid_to FROM versions WHERE resource_id = 'sg-db'").fetchall()
+    assert rows == [(1000.0, 2000.0)]
+    assert set(items_at(store)[1]) == {"sg-web"}
+
+
+def test_entries_as_of_crawl_times(store):
+    crawl(store, [WEB, DB], 1000.0)
+    crawl(store, [WEB, DB_CHANGED], 2000.0)
+    crawl(store, [DB_CHANGED], 3000.0)
+
+    assert items_at(store, 999.0) is None
+    assert items_at(store, 1000.0) == (1000.0, {"sg-web": WEB, "sg-db": DB})
+    assert items_at(store, 1500.0) == (1000.0, {"sg-web": WEB, "sg-db": DB})
+    assert items_at(store, 2000.0) == (2000.0, {"sg-web": WEB, "sg-db": DB_CHANGED})
+    assert items_at(store, 2999.0) == (2000.0, {"sg-web": WEB, "sg-db": DB_CHANGED})
+    assert items_at(store, 3000.0) == (3000.0, {"sg-db": DB_CHANGED})
+    assert items_at(store) == (3000.0, {"sg-db": DB_CHANGED})
+
+
+def test_entries_keep_fingerprints_and_scopes_apart(store):
+    other = ("210987654321", "eu-west-1", "security-groups")
+    crawl(store, [WEB], 1000.0)
+    crawl(store, [DB], 1000.0, key=other)
+
+    taken_at, entries = store.entries(KEY)
+    assert entries == {"sg-web": (repr(WEB), WEB)}
+    assert set(items_at(store, key=other)[1]) == {"sg-db"}
+
+
+def test_parts_are_stored_once_and_rebuilt(store):
+    crawl(store, [WEB, DB], 1000.0)
+    crawl(store, [WEB, DB_CHANGED], 2000.0)
+
+    # env=prod, team=web, pci=yes
+    assert count(store, "parts") == 3
+    stored = store._conn().execute("SELECT data FROM records").fetchall()
+    assert all("prod" not in data for data, in stored)
+    assert items_at(store, 1000.0)[1]["sg-db"]["tags"] == DB["tags"]
+    assert items_at(store)[1]["sg-db"]["tags"] == DB_CHANGED["tags"]
+    assert items_at(store)[1]["sg-web"]["tags"] == WEB["tags"]
+
+
+def test_registered_model_rebuilds_items(store):
+    pydantic = pytest.importorskip("pydantic")
+
+    class Tag(pydantic.BaseModel):
+        Key: str
+        Value: str
+
+    class Group(pydantic.BaseModel):
+        sg_id: str
+        tags: list[Tag] = []
+
+    store.register_model("security-groups", Group)
+    crawl(store, [WEB], 1000.0)
+
+    group = items_at(store)[1]["sg-web"]
+    assert isinstance(group, Group)
+    assert group.model_dump() == WEB
+
+
+def test_restart_resumes_from_open_versions(store, path):
+    crawl(store, [WEB, DB], 1000.0)
+
+    restarted = SQLiteSnapshotStore(path)
+    assert items_at(restarted) == (1000.0, {"sg-web": WEB, "sg-db": DB})
+
+    crawl(restarted, [WEB, DB_CHANGED], 2000.0)
+
+    assert count(restarted, "versions") == 3
+    assert count(restarted, "versions", "WHERE valid_to IS NULL") == 2
+    assert items_at(restarted, 1500.0) == (1000.0, {"sg-web": WEB, "sg-db": DB})
+    assert items_at(restarted) == (2000.0, {"sg-web": WEB, "sg-db": DB_CHANGED})